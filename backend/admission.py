@@ -0,0 +1,287 @@
+"""
+Admission control for expensive endpoints, shared by every worker on a host.
+
+Concurrency gates. Each gated endpoint has `limit` slot files and `queue`
+ticket files in ADMISSION_DIR. A request runs while it holds an flock on a
+slot; when all slots are busy it takes a ticket and waits up to
+ADMISSION_WAIT_SECONDS for one. With no free ticket, or when the wait runs
+out, it is rejected at once with 503 and Retry-After, so cheap endpoints
+keep their workers instead of piling up behind a slow one until the
+gunicorn timeout. Locks die with their process, so a crashed worker never
+leaks a slot.
+
+    ADMISSION_LIMITS="get_matches=4:8,send_partner_email=2:0"   # endpoint=limit:queue
+
+Token buckets. Per-user and per-IP send quotas (OTP, partner emails) live
+in a small SQLite file next to the slots, so all workers draw from the
+same buckets. Quotas are "count/seconds": a burst of `count`, refilled
+evenly over `seconds`; over-quota requests get 429 with Retry-After.
+
+    RATE_LIMITS="otp_email=5/3600,otp_ip=20/3600"
+
+Gate occupancy, limits, rejections and throttled sends are exported at
+/metrics.
+"""
+
+import fcntl
+import math
+import os
+import random
+import sqlite3
+import threading
+import time
+from functools import wraps
+
+import metrics
+
+_DEFAULT_DIR = "/dev/shm/studybuddy-admission" if os.path.isdir("/dev/shm") else os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "data", "admission"
+)
+ADMISSION_DIR = os.getenv("ADMISSION_DIR", _DEFAULT_DIR)
+WAIT_SECONDS = float(os.getenv("ADMISSION_WAIT_SECONDS", 2))
+RETRY_AFTER_SECONDS = int(os.getenv("ADMISSION_RETRY_AFTER_SECONDS", 5))
+POLL_SECONDS = 0.02
+PRUNE_PROBABILITY = 0.001
+
+DEFAULT_LIMITS = {
+    "get_matches": (4, 8),
+    "send_partner_email": (2, 4),
+    "get_groups": (2, 4),
+    # Single-flight runs one refresh; the other slots just wait for its result
+    "update_courses_from_nthu": (4, 0),
+}
+
+DEFAULT_RATES = {
+    "otp_email": "5/3600",
+    "otp_ip": "20/3600",
+    "partner_email_user": "20/3600",
+    "partner_email_ip": "60/3600",
+}
+
+metrics.describe("studybuddy_admission_limit", "Concurrent requests allowed per endpoint on this host")
+metrics.describe("studybuddy_admission_in_flight", "Requests this worker is running per gated endpoint")
+metrics.describe("studybuddy_admission_rejected_total", "Requests shed with 503 per endpoint and reason")
+metrics.describe("studybuddy_rate_limited_total", "Sends refused with 429 per bucket")
+
+
+def _parse_limits(text):
+    limits = dict(DEFAULT_LIMITS)
+    for item in filter(None, (part.strip() for part in (text or "").split(","))):
+        name, _, value = item.partition("=")
+        limit, _, queue = value.partition(":")
+        limits[name.strip()] = (int(limit), int(queue or 0))
+    return limits
+
+
+def _parse_rates(text):
+    rates = dict(DEFAULT_RATES)
+    for item in filter(None, (part.strip() for part in (text or "").split(","))):
+        name, _, value = item.partition("=")
+        rates[name.strip()] = value.strip()
+    return {name: tuple(float(x) for x in value.split("/")) for name, value in rates.items()}
+
+
+LIMITS = _parse_limits(os.getenv("ADMISSION_LIMITS"))
+RATES = _parse_rates(os.getenv("RATE_LIMITS"))
+
+
+class Gate:
+    """Host-wide concurrency limit with a bounded wait queue, built on flocked files"""
+
+    def __init__(self, name, limit, queue, directory=None):
+        self.name = name
+        self.limit = limit
+        self.queue = queue
+        self.directory = directory or ADMISSION_DIR
+        self._in_flight = 0
+        self._lock = threading.Lock()
+        metrics.set_gauge("studybuddy_admission_limit", limit, endpoint=name)
+
+    def _try_lock(self, kind, count):
+        """fd of the first free `kind` file, or None"""
+        os.makedirs(self.directory, exist_ok=True)
+        for i in range(count):
+            fd = os.open(os.path.join(self.directory, f"{self.name}.{kind}.{i}"), os.O_RDWR | os.O_CREAT, 0o600)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return fd
+            except BlockingIOError:
+                os.close(fd)
+        return None
+
+    def try_acquire(self):
+        return self._try_lock("slot", self.limit)
+
+    def take_ticket(self):
+        return self._try_lock("queue", self.queue)
+
+    def acquire(self, timeout=None):
+        """(slot fd, None) once admitted, or (None, "queue_full" | "timeout")"""
+        fd = self.try_acquire()
+        if fd is not None:
+            return fd, None
+        ticket = self.take_ticket()
+        if ticket is None:
+            return None, "queue_full"
+        try:
+            deadline = time.monotonic() + (WAIT_SECONDS if timeout is None else timeout)
+            while time.monotonic() < deadline:
+                time.sleep(POLL_SECONDS)
+                fd = self.try_acquire()
+                if fd is not None:
+                    return fd, None
+            return None, "timeout"
+        finally:
+            os.close(ticket)
+
+    async def acquire_async(self, timeout=None):
+        """acquire() for the ASGI path; waits without blocking the event loop"""
+        import asyncio
+
+        fd = self.try_acquire()
+        if fd is not None:
+            return fd, None
+        ticket = self.take_ticket()
+        if ticket is None:
+            return None, "queue_full"
+        try:
+            deadline = time.monotonic() + (WAIT_SECONDS if timeout is None else timeout)
+            while time.monotonic() < deadline:
+                await asyncio.sleep(POLL_SECONDS)
+                fd = self.try_acquire()
+                if fd is not None:
+                    return fd, None
+            return None, "timeout"
+        finally:
+            os.close(ticket)
+
+    def entered(self):
+        with self._lock:
+            self._in_flight += 1
+            metrics.set_gauge("studybuddy_admission_in_flight", self._in_flight, endpoint=self.name)
+
+    def release(self, fd):
+        os.close(fd)
+        with self._lock:
+            self._in_flight -= 1
+            metrics.set_gauge("studybuddy_admission_in_flight", self._in_flight, endpoint=self.name)
+
+    def rejected(self, reason):
+        metrics.inc("studybuddy_admission_rejected_total", endpoint=self.name, reason=reason)
+
+
+_gates = {}
+
+
+def get_gate(name):
+    if name not in _gates:
+        limit, queue = LIMITS.get(name, (0, 0))
+        _gates[name] = Gate(name, limit, queue)
+    return _gates[name]
+
+
+def overloaded_response():
+    from flask import jsonify
+
+    response = jsonify({"error": "Server is busy, please try again shortly"})
+    response.status_code = 503
+    response.headers["Retry-After"] = str(RETRY_AFTER_SECONDS)
+    return response
+
+
+def limit(name):
+    """Route decorator: run under the `name` gate, shedding load with 503 when it is full"""
+
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            gate = get_gate(name)
+            if gate.limit <= 0:
+                return f(*args, **kwargs)
+            fd, reason = gate.acquire()
+            if fd is None:
+                gate.rejected(reason)
+                return overloaded_response()
+            gate.entered()
+            try:
+                return f(*args, **kwargs)
+            finally:
+                gate.release(fd)
+
+        return decorated_function
+
+    return decorator
+
+
+# Token buckets
+
+_db_local = threading.local()
+
+
+def _connection():
+    """Per-thread SQLite connection to the shared bucket store (reopened after fork)"""
+    conn = getattr(_db_local, "conn", None)
+    if conn is None or _db_local.pid != os.getpid():
+        os.makedirs(ADMISSION_DIR, exist_ok=True)
+        conn = sqlite3.connect(os.path.join(ADMISSION_DIR, "buckets.sqlite"), timeout=5, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("CREATE TABLE IF NOT EXISTS buckets (key TEXT PRIMARY KEY, tokens REAL, updated REAL)")
+        _db_local.conn, _db_local.pid = conn, os.getpid()
+    return conn
+
+
+def take(bucket, key, now=None):
+    """Spend one token from bucket/key; returns 0 if allowed, else seconds until one is available"""
+    if bucket not in RATES:
+        return 0
+    count, seconds = RATES[bucket]
+    rate = count / seconds
+    now = time.time() if now is None else now
+    conn = _connection()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        row = conn.execute("SELECT tokens, updated FROM buckets WHERE key = ?", (f"{bucket}:{key}",)).fetchone()
+        tokens = count if row is None else min(count, row[0] + (now - row[1]) * rate)
+        if tokens < 1:
+            conn.execute("COMMIT")
+            return math.ceil((1 - tokens) / rate)
+        if random.random() < PRUNE_PROBABILITY:
+            # Buckets idle for a day have long since refilled; forget them
+            conn.execute("DELETE FROM buckets WHERE updated < ?", (now - 86400,))
+        conn.execute(
+            "INSERT OR REPLACE INTO buckets (key, tokens, updated) VALUES (?, ?, ?)",
+            (f"{bucket}:{key}", tokens - 1, now),
+        )
+        conn.execute("COMMIT")
+        return 0
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+
+def check_rates(checks):
+    """Take a token from each (bucket, key); returns the longest wait if any bucket is empty, else 0.
+
+    Keys that are empty (no user, no IP) are skipped. Tokens already taken
+    from earlier buckets are not refunded, which keeps a flood from probing
+    one bucket at a time.
+    """
+    wait = 0
+    for bucket, key in checks:
+        if not key:
+            continue
+        retry_after = take(bucket, key)
+        if retry_after:
+            metrics.inc("studybuddy_rate_limited_total", bucket=bucket)
+            wait = max(wait, retry_after)
+    return wait
+
+
+def rate_limited_response(retry_after, message="Too many requests, please try again later"):
+    from flask import jsonify
+
+    response = jsonify({"error": message, "retry_after": retry_after})
+    response.status_code = 429
+    response.headers["Retry-After"] = str(retry_after)
+    return response
+
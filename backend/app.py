@@ -1,73 +1,175 @@
-from flask import Flask, request, jsonify, session
+from startup import report as startup_report
+
+from flask import Blueprint, Flask, current_app, request, jsonify, session
 from flask_mail import Mail, Message
-from pymongo import MongoClient
+from pymongo.errors import DuplicateKeyError
 import os
 from dotenv import load_dotenv
 from bson import ObjectId
-from sklearn.metrics.pairwise import cosine_similarity
-import numpy as np
 from datetime import datetime, timedelta
 from functools import wraps
-import re
+from werkzeug.middleware.proxy_fix import ProxyFix
+import json
+import queue
 import random
 import string
 import threading
-import requests
-import json
+import time
+
+import admission
+import catalog
+import catalog_snapshot
+import change_feed
+import course_similarity
+import db
+import feature_matrix
+import groups
+import logs
+import metrics
+import new_matches
+import partner_filters
+import ranker
+import repository
+import semester
+import singleflight
+import student_import
+import timetable
+import tracing
+from json_provider import FastJSONProvider
+from matching import (
+    MATCH_PROJECTION,
+    WEIGHT_KEYS,
+    build_match_response,
+    filter_query,
+    filters_key,
+    parse_filters,
+    parse_weights,
+    shortlist,
+)
 
 load_dotenv()
 
-# Setup MongoDB connection
-MONGO_URI = os.getenv("MONGO_URI")
-print(f"🔄 Connecting to MongoDB Atlas...")
-print(f"URI: {MONGO_URI[:50]}..." if MONGO_URI and len(MONGO_URI) > 50 else f"URI: {MONGO_URI}")
-
-# Ensure URI has tlsAllowInvalidCertificates parameter for Render compatibility
-if MONGO_URI:
-    if "tlsAllowInvalidCertificates" not in MONGO_URI:
-        separator = "&" if "?" in MONGO_URI else "?"
-        MONGO_URI = f"{MONGO_URI}{separator}tls=true&tlsAllowInvalidCertificates=true"
-        print("Added TLS parameters to connection string")
-
-try:
-    # Simplified connection - let the URI parameters handle all TLS settings
-    client = MongoClient(
-        MONGO_URI,
-        serverSelectionTimeoutMS=20000,
-        connectTimeoutMS=20000,
-        socketTimeoutMS=20000
+# Collections resolve lazily, so importing this module never touches the network
+
+# Reverse proxies in front of the app (Render/Railway add one); each appends a
+# X-Forwarded-For hop, and only those hops are trusted for per-IP rate limits
+TRUSTED_PROXY_HOPS = int(os.getenv("TRUSTED_PROXY_HOPS", 1))
+
+bp = Blueprint("api", __name__)
+mail = Mail()
+
+email_log = logs.get_logger("email")
+courses_log = logs.get_logger("courses")
+request_log = logs.get_logger("requests")
+startup_log = logs.get_logger("startup")
+
+
+def create_app(config=None):
+    """Application factory. Builds and configures the Flask app without any network I/O."""
+    startup_report.record_since_start("imports")
+    logs.configure()
+
+    with startup_report.phase("config"):
+        app = Flask(__name__)
+        # The platform proxy appends the real peer to X-Forwarded-For; hops to
+        # the left of the ones it adds are client-controlled and ignored
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=TRUSTED_PROXY_HOPS, x_proto=TRUSTED_PROXY_HOPS)
+        # orjson-backed; encodes ObjectId and datetime without per-handler conversion
+        app.json = FastJSONProvider(app)
+
+        # Session configuration
+        app.config["SECRET_KEY"] = os.getenv("SECRET_KEY", "b7328b8e99a64cc38dc6b1b52d4f553a")
+        app.config["SESSION_COOKIE_SECURE"] = True  # Only send cookies over HTTPS
+        app.config["SESSION_COOKIE_HTTPONLY"] = True  # Prevent JavaScript access to session cookie
+        app.config["SESSION_COOKIE_SAMESITE"] = "None"  # Allow cross-site cookies for CORS
+        app.config["SESSION_COOKIE_DOMAIN"] = None  # Allow cookies from any domain
+        app.config["PERMANENT_SESSION_LIFETIME"] = timedelta(days=7)
+        app.config["SESSION_COOKIE_PATH"] = "/"  # Cookies available for all paths
+        app.config["SESSION_REFRESH_EACH_REQUEST"] = True  # Refresh session on each request
+
+        # Email configuration for OTP verification
+        app.config['MAIL_SERVER'] = 'smtp.gmail.com'
+        app.config['MAIL_PORT'] = 587
+        app.config['MAIL_USE_TLS'] = True
+        app.config['MAIL_USE_SSL'] = False
+        app.config['MAIL_USERNAME'] = os.getenv('MAIL_USERNAME', 'your-email@gmail.com')
+        app.config['MAIL_PASSWORD'] = os.getenv('MAIL_PASSWORD', 'your-app-password')
+        app.config['MAIL_DEFAULT_SENDER'] = os.getenv('MAIL_USERNAME', 'your-email@gmail.com')
+
+        if config:
+            app.config.update(config)
+
+    with startup_report.phase("extensions"):
+        # Flask-Mail only reads config here; SMTP connections are opened per send
+        mail.init_app(app)
+        tracing.init_app(app)
+
+    with startup_report.phase("blueprints"):
+        app.register_blueprint(bp)
+
+    startup_log.info("app created", extra={"phases_ms": startup_report.as_dict()["phases_ms"]})
+    return app
+
+
+def _cors_origin_allowed(origin):
+    # Allow localhost, Vercel domains, and the new custom domain
+    return bool(origin) and (
+        origin.startswith('http://localhost:') or
+        origin.startswith('http://127.0.0.1:') or
+        '.vercel.app' in origin or
+        'studybuddynthu.org' in origin
     )
-    # Test the connection
-    client.server_info()
-    print("✅ MongoDB connected successfully!")
-except Exception as e:
-    print(f"❌ MongoDB connection failed: {e}")
-    print("\n🔍 Troubleshooting:")
-    print("1. Check MongoDB Atlas Network Access - whitelist 0.0.0.0/0")
-    print("2. Verify credentials in MONGO_URI")
-    print("3. Current URI format:", MONGO_URI[:80] if MONGO_URI else "None")
-    exit(1)
-
-db = client["study_partner"]
-students_collection = db["students"]
-courses_collection = db["courses"]
-otp_collection = db["otps"]  # New collection for storing OTPs
-
-# Initialize Flask app
-app = Flask(__name__)
+
+
+student_feed = None
+
+
+def _ensure_indexes():
+    try:
+        repository.ensure_student_indexes()
+    except Exception as e:
+        startup_log.warning("student index setup failed", extra={"error": str(e)})
+
+
+def _ensure_rosters():
+    try:
+        backfilled = repository.ensure_rosters()
+        if backfilled:
+            startup_log.info("built course rosters", extra={"courses": backfilled})
+    except Exception as e:
+        startup_log.warning("course roster setup failed", extra={"error": str(e)})
+
+
+def start_background_workers(app_instance):
+    """Per-worker background threads; started on the first request, i.e. after fork"""
+    global student_feed
+    feature_matrix.start_refresher(load_match_students)
+    new_matches.start(app_instance, mail)
+    threading.Thread(target=_ensure_rosters, name="course-rosters", daemon=True).start()
+    threading.Thread(target=_ensure_indexes, name="student-indexes", daemon=True).start()
+    if student_feed is None and os.getenv("CHANGE_FEED", "1") == "1":
+        student_feed = change_feed.ChangeFeed(repository.students_collection, "students", MATCH_PROJECTION)
+        student_feed.register(feature_matrix.change_consumer(repository.matrix_student))
+        student_feed.start()
+
+
+@bp.before_app_request
+def record_first_request():
+    if startup_report.mark_first_request():
+        start_background_workers(current_app._get_current_object())
+        timings = startup_report.as_dict()
+        if startup_report.over_budget:
+            startup_log.warning("startup exceeded STARTUP_BUDGET_MS", extra=timings)
+        else:
+            startup_log.info("first request", extra=timings)
+
 
 # Manual CORS handler - allows all Vercel domains and localhost
-@app.after_request
+@bp.after_app_request
 def add_cors_headers(response):
     origin = request.headers.get('Origin')
     
-    # Allow localhost, Vercel domains, and the new custom domain
-    if origin and (
-        origin.startswith('http://localhost:') or
-        origin.startswith('http://127.0.0.1:') or
-        '.vercel.app' in origin or
-        'studybuddynthu.org' in origin
-    ):
+    if _cors_origin_allowed(origin):
         response.headers['Access-Control-Allow-Origin'] = origin
         response.headers['Access-Control-Allow-Credentials'] = 'true'
         response.headers['Access-Control-Allow-Headers'] = 'Content-Type, Authorization'
@@ -78,18 +180,13 @@ def add_cors_headers(response):
     return response
 
 # Handle preflight OPTIONS requests
-@app.before_request
+@bp.before_app_request
 def handle_preflight():
     if request.method == 'OPTIONS':
-        response = app.make_default_options_response()
+        response = current_app.make_default_options_response()
         origin = request.headers.get('Origin')
         
-        if origin and (
-            origin.startswith('http://localhost:') or
-            origin.startswith('http://127.0.0.1:') or
-            '.vercel.app' in origin or
-            'studybuddynthu.org' in origin
-        ):
+        if _cors_origin_allowed(origin):
             response.headers['Access-Control-Allow-Origin'] = origin
             response.headers['Access-Control-Allow-Credentials'] = 'true'
             response.headers['Access-Control-Allow-Headers'] = 'Content-Type, Authorization'
@@ -98,29 +195,15 @@ def handle_preflight():
         
         return response
 
-# Session configuration
-app.config["SECRET_KEY"] = os.getenv("SECRET_KEY", "b7328b8e99a64cc38dc6b1b52d4f553a")
-app.config["SESSION_COOKIE_SECURE"] = True  # Only send cookies over HTTPS
-app.config["SESSION_COOKIE_HTTPONLY"] = True  # Prevent JavaScript access to session cookie
-app.config["SESSION_COOKIE_SAMESITE"] = "None"  # Allow cross-site cookies for CORS
-app.config["SESSION_COOKIE_DOMAIN"] = None  # Allow cookies from any domain
-app.config["PERMANENT_SESSION_LIFETIME"] = timedelta(days=7)
-app.config["SESSION_COOKIE_PATH"] = "/"  # Cookies available for all paths
-app.config["SESSION_REFRESH_EACH_REQUEST"] = True  # Refresh session on each request
-
-# Email configuration for OTP verification
-app.config['MAIL_SERVER'] = 'smtp.gmail.com'
-app.config['MAIL_PORT'] = 587
-app.config['MAIL_USE_TLS'] = True
-app.config['MAIL_USE_SSL'] = False
-app.config['MAIL_USERNAME'] = os.getenv('MAIL_USERNAME', 'your-email@gmail.com')
-app.config['MAIL_PASSWORD'] = os.getenv('MAIL_PASSWORD', 'your-app-password')
-app.config['MAIL_DEFAULT_SENDER'] = os.getenv('MAIL_USERNAME', 'your-email@gmail.com')
-
-# Initialize Flask-Mail
-print("📧 Initializing Flask-Mail...")
-mail = Mail(app)
-print("✅ Flask-Mail initialized - OTP will be sent via email")
+# How long a second /update_courses_from_nthu caller waits for the running refresh.
+# Capped at half the gunicorn worker timeout, which leaves the other half for
+# the caller's own run if the wait expires, before the worker is killed
+COURSE_REFRESH_WAIT_SECONDS = min(
+    float(os.getenv("COURSE_REFRESH_WAIT_SECONDS", 60)), float(os.getenv("GUNICORN_TIMEOUT", 120)) / 2
+)
+
+ROSTER_PAGE_SIZE = 50
+ROSTER_MAX_PAGE_SIZE = 200
 
 # Legacy fixed lists for UI fallback
 STUDY_SPOTS = [
@@ -277,48 +360,40 @@ def login_required(f):
     return decorated_function
 
 
-# Helper functions
-
-
-def get_all_unique_features():
-    all_courses = set()
-    all_spots = set()
-    all_times = set()
+def admin_required(f):
+    """Logged in with an email listed in ADMIN_EMAILS (comma separated)"""
 
-    for student in students_collection.find():
-        all_courses.update(student.get("course_ids", []))
-        all_spots.update(student.get("study_spots", []))
-        all_times.update(student.get("study_times", []))
-    return list(all_courses), list(all_spots), list(all_times)
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if "user_id" not in session:
+            return jsonify({"error": "Authentication required"}), 401
+        admins = {e.strip().lower() for e in os.getenv("ADMIN_EMAILS", "").split(",") if e.strip()}
+        if (session.get("user_email") or "").lower() not in admins:
+            return jsonify({"error": "Admin access required"}), 403
+        return f(*args, **kwargs)
 
+    return decorated_function
 
-def encode_features(student, all_courses, all_spots, all_times):
-    vector = []
-    vector += [1 if c in student.get("course_ids", []) else 0 for c in all_courses]
-    vector += [1 if s in student.get("study_spots", []) else 0 for s in all_spots]
-    vector += [1 if t in student.get("study_times", []) else 0 for t in all_times]
-    return np.array(vector)
 
+# Helper functions
 
-def calculate_weighted_similarity(
-    vector1, vector2, all_courses, all_spots, course_weight=3.0, spot_weight=1.0, time_weight=1.5
-):
-    len_courses = len(all_courses)
-    len_spots = len(all_spots)
 
-    weighted_v1 = vector1.copy().astype(float)
-    weighted_v2 = vector2.copy().astype(float)
+def load_match_students():
+    """Every student with the fields matching uses (feature matrix builds)"""
+    return repository.all_match_students()
 
-    weighted_v1[:len_courses] *= course_weight
-    weighted_v2[:len_courses] *= course_weight
 
-    weighted_v1[len_courses : len_courses + len_spots] *= spot_weight
-    weighted_v2[len_courses : len_courses + len_spots] *= spot_weight
+def log_match_events(events):
+    """Record ranker training signals without waiting for the write to be acknowledged"""
+    try:
+        repository.log_match_events(events)
+    except Exception as e:
+        request_log.warning("could not log match events", extra={"events": len(events), "error": str(e)})
 
-    weighted_v1[len_courses + len_spots :] *= time_weight
-    weighted_v2[len_courses + len_spots :] *= time_weight
 
-    return cosine_similarity([weighted_v1], [weighted_v2])[0][0]
+def client_ip():
+    """Caller address as seen by the platform proxy (ProxyFix trusts only the hops it appends)"""
+    return request.remote_addr
 
 
 def is_valid_nthu_email(email):
@@ -340,11 +415,9 @@ def send_otp_email_async(app_instance, email, otp):
     import smtplib
     
     def send_email():
-        print(f"🔄 Background email thread started for {email}", flush=True)
+        started = time.perf_counter()
         try:
             with app_instance.app_context():
-                print(f"🔗 Connecting to Gmail SMTP server...", flush=True)
-                
                 # Set socket timeout to prevent hanging
                 socket.setdefaulttimeout(30)
                 
@@ -385,49 +458,37 @@ def send_otp_email_async(app_instance, email, otp):
                     """
                 )
                 
-                print(f"📧 Sending email via Flask-Mail...", flush=True)
-                mail.send(msg)
-                print(f"✅ Email sent successfully to {email}!", flush=True)
-                
+                with tracing.span("smtp send", "client", **{"smtp.purpose": "otp"}):
+                    mail.send(msg)
+                email_log.info("otp email sent", extra={"email": email, "duration_ms": _elapsed_ms(started)})
+
         except socket.timeout:
-            print(f"❌ Email sending timed out after 30s for {email}", flush=True)
+            email_log.error("otp email timed out", extra={"email": email, "timeout_s": 30})
         except smtplib.SMTPAuthenticationError as e:
-            print(f"❌ SMTP Authentication failed: {str(e)}", flush=True)
-            print(f"⚠️ Check your MAIL_USERNAME and MAIL_PASSWORD in Render env vars", flush=True)
+            email_log.error(
+                "smtp authentication failed; check MAIL_USERNAME and MAIL_PASSWORD", extra={"email": email, "error": str(e)}
+            )
         except smtplib.SMTPException as e:
-            print(f"❌ SMTP Error: {str(e)}", flush=True)
-        except Exception as e:
-            print(f"❌ Unexpected error sending email: {str(e)}", flush=True)
-            import traceback
-            traceback.print_exc()
-        finally:
-            print(f"🏁 Background email thread finished for {email}", flush=True)
+            email_log.error("smtp error", extra={"email": email, "error": str(e)})
+        except Exception:
+            email_log.exception("unexpected error sending otp email", extra={"email": email})
     
     # Start email sending in background thread
-    thread = threading.Thread(target=send_email)
+    thread = threading.Thread(target=tracing.propagate(send_email))
     thread.daemon = True
     thread.start()
 
+def _elapsed_ms(started):
+    return round((time.perf_counter() - started) * 1000, 1)
+
+
 def send_otp_email(email, otp):
-    """Send OTP via email - always prints to console and tries email async"""
-    # Always print OTP to console/logs as backup
-    print("\n" + "="*80, flush=True)
-    print(f"📧 OTP for {email}: {otp}", flush=True)
-    print(f"⏰ Valid for 10 minutes", flush=True)
-    print("="*80 + "\n", flush=True)
-    
-    # Also write to stderr for visibility
-    import sys
-    sys.stderr.write(f"\n{'='*80}\n")
-    sys.stderr.write(f"📧 OTP for {email}: {otp}\n")
-    sys.stderr.write(f"⏰ Valid for 10 minutes\n")
-    sys.stderr.write(f"{'='*80}\n\n")
-    sys.stderr.flush()
-    
+    """Send OTP via email in the background; the code itself is never logged"""
+    email_log.info("otp issued", extra={"email": email, "valid_minutes": 10})
+
     # Try to send email asynchronously (non-blocking) with proper app context
     if mail is not None:
-        print(f"📤 Attempting to send email to {email} in background...", flush=True)
-        send_otp_email_async(app, email, otp)
+        send_otp_email_async(current_app._get_current_object(), email, otp)
     
     # Always return True immediately (don't wait for email)
     return True
@@ -435,78 +496,27 @@ def send_otp_email(email, otp):
 
 def store_otp(email, otp):
     """Store OTP in database with expiration"""
-    expiry_time = datetime.utcnow() + timedelta(minutes=10)  # 10 minutes expiry
-    otp_collection.update_one(
-        {"email": email},
-        {
-            "$set": {
-                "email": email,
-                "otp": otp,
-                "created_at": datetime.utcnow(),
-                "expires_at": expiry_time,
-                "verified": False
-            }
-        },
-        upsert=True
-    )
+    repository.store_otp(email, otp)
 
 
 def verify_otp(email, otp):
     """Verify OTP for given email"""
-    otp_doc = otp_collection.find_one({
-        "email": email,
-        "otp": otp,
-        "verified": False,
-        "expires_at": {"$gt": datetime.utcnow()}
-    })
-    
-    if otp_doc:
-        # Mark OTP as verified
-        otp_collection.update_one(
-            {"_id": otp_doc["_id"]},
-            {"$set": {"verified": True}}
-        )
-        return True
-    return False
+    return repository.verify_otp(email, otp)
 
 
 def validate_student_data(data):
-    required_fields = ["name", "email", "college", "department", "course_ids", "study_spots", "study_times"]
-
-    for field in required_fields:
-        if field not in data:
-            return False, f"Missing required field: {field}"
-    
-    # Validate NTHU email
-    email = data.get("email", "").strip().lower()
-    if not is_valid_nthu_email(email):
-        return False, "Please use a valid NTHU email address ending with .nthu.edu.tw"
-    
-    # Only check email uniqueness on registration
-    if students_collection.find_one({"email": email}):
-        return False, "Email already registered"
-
-    for field in ["course_ids", "study_spots", "study_times"]:
-        if not isinstance(data[field], list) or len(data[field]) == 0:
-            return False, f"{field} must be a non-empty list"
-
-    # Validate college and department
-    college = data.get("college")
-    department = data.get("department")
-    
-    if college not in COLLEGE_DEPARTMENTS:
-        return False, "Invalid college selected"
-    
-    if department not in COLLEGE_DEPARTMENTS[college]:
-        return False, "Invalid department for selected college"
-
+    error = student_import.check_student(
+        data, COLLEGE_DEPARTMENTS, repository.email_exists
+    )
+    if error:
+        return False, error
     return True, "Valid"
 
 
 # Authentication routes
 
 
-@app.route("/login", methods=["POST"])
+@bp.route("/login", methods=["POST"])
 def login():
     data = request.json
     email = (data.get("email") or "").strip().lower()
@@ -516,7 +526,7 @@ def login():
         return jsonify({"error": "Please use a valid NTHU email address ending with .nthu.edu.tw"}), 401
     
     # Check if user exists
-    user = students_collection.find_one({"email": email})
+    user = repository.find_login(email)
     if not user:
         return jsonify({"error": "No account found with this NTHU email. Please register first."}), 401
     
@@ -530,21 +540,20 @@ def login():
     )
 
 
-@app.route("/logout", methods=["POST"])
+@bp.route("/logout", methods=["POST"])
 @login_required
 def logout():
     session.clear()
     return jsonify({"message": "Logged out successfully"})
 
 
-@app.route("/me", methods=["GET"])
+@bp.route("/me", methods=["GET"])
 @login_required
 def me():
     try:
         user_id = session.get("user_id")
-        user = students_collection.find_one({"_id": ObjectId(user_id)})
+        user = repository.get_profile(user_id)
         if user:
-            user["_id"] = str(user["_id"])
             return jsonify(user)
         else:
             return jsonify({"error": "User not found"}), 404
@@ -555,7 +564,27 @@ def me():
 # Main endpoints
 
 
-@app.route("/")
+@bp.route("/health", methods=["GET"])
+def health():
+    """Liveness probe - never touches the database"""
+    return jsonify({"status": "ok"})
+
+
+@bp.route("/ready", methods=["GET"])
+def ready():
+    """Readiness probe - pings MongoDB with a short timeout"""
+    ok, error = db.ping(timeout_ms=int(os.getenv("READY_TIMEOUT_MS", 2000)))
+    body = {"status": "ready" if ok else "unavailable", "mongo": "ok" if ok else error, "startup": startup_report.as_dict()}
+    return jsonify(body), 200 if ok else 503
+
+
+@bp.route("/metrics", methods=["GET"])
+def metrics_endpoint():
+    """Prometheus metrics for this worker process"""
+    return current_app.response_class(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+
+@bp.route("/")
 def home():
     return jsonify(
         {
@@ -566,17 +595,25 @@ def home():
                 "logout": "POST /logout",
                 "me": "GET /me",
                 "add_student": "POST /add_student (requires auth)",
+                "import_students": "POST /import_students (requires admin)",
                 "get_students": "GET /get_students (requires auth)",
                 "get_student": "GET /get_student/<student_id> (requires auth)",
-                "get_matches": "GET /get_matches/<student_id> (requires auth)",
+                "get_matches": "GET /get_matches/<student_id>?department=&college=&course=&shared_time=1 (requires auth)",
+                "get_groups": "GET /get_groups?course=<code>&size=4 (requires auth; defaults to your department)",
                 "search_courses": "GET /search_courses?q=your_search_term",
+                "course_students": "GET /courses/<code>/students?after=<student_id>&limit=50 (requires auth)",
+                "popular_courses": "GET /courses/popular?limit=20",
+                "blocks": "GET /blocks, POST|DELETE /blocks/<student_id> (requires auth)",
                 "get_options": "GET /get_options",
+                "health": "GET /health",
+                "ready": "GET /ready",
+                "metrics": "GET /metrics",
             },
         }
     )
 
 
-@app.route("/get_options", methods=["GET"])
+@bp.route("/get_options", methods=["GET"])
 def get_options():
     return jsonify(
         {
@@ -589,41 +626,39 @@ def get_options():
     )
 
 
-@app.route("/get_departments/<college>", methods=["GET"])
+@bp.route("/get_departments/<college>", methods=["GET"])
 def get_departments(college):
     """Get departments for a specific college"""
     departments = COLLEGE_DEPARTMENTS.get(college, [])
     return jsonify({"departments": departments})
 
 
-@app.route("/search_courses", methods=["GET"])
+@bp.route("/search_courses", methods=["GET"])
 def search_courses():
     query = request.args.get("q", "").strip()
-    if len(query) < 2:
+    if len(query) < catalog.MIN_QUERY_LENGTH:
         return jsonify({"courses": []})
 
-    # Search across code and names with partial match, case insensitive
-    regex = {"$regex": re.escape(query), "$options": "i"}
-    filter_condition = {
-        "$or": [{"科號": regex}, {"課程英文名稱": regex}, {"課程中文名稱": regex}]
-    }
-
-    courses = courses_collection.find(filter_condition, {"_id": 0, "科號": 1, "課程中文名稱": 1, "課程英文名稱": 1}).limit(
-        50
-    )
+    snapshot = catalog_snapshot.get_snapshot()
+    if snapshot is not None:
+        courses = catalog.format_search_results(snapshot.search(query, catalog.SEARCH_LIMIT))
+    else:
+        # Regex scans are slow; identical in-flight searches share one
+        courses = singleflight.do(
+            f"search_courses:{query.lower()}",
+            lambda: catalog.format_search_results(repository.search_courses(query)),
+            shared=True,
+        )
+    return jsonify({"courses": courses})
 
-    results = []
-    for c in courses:
-        code = c.get("科號", "")
-        name_en = c.get("課程英文名稱", "")
-        name_zh = c.get("課程中文名稱", "")
-        display = f"{code} - {name_en or name_zh}"
-        results.append({"code": code, "name_en": name_en, "name_zh": name_zh, "display": display})
 
-    return jsonify({"courses": results})
+def course_names(codes):
+    snapshot = catalog_snapshot.get_snapshot()
+    courses = snapshot.find_codes(codes) if snapshot is not None else repository.courses_by_code(codes)
+    return catalog.format_course_names(courses)
 
 
-@app.route("/get_course_names", methods=["POST"])
+@bp.route("/get_course_names", methods=["POST"])
 def get_course_names():
     """Get course names for an array of course codes"""
     data = request.json
@@ -632,26 +667,46 @@ def get_course_names():
     if not course_codes:
         return jsonify({"courses": {}})
     
-    # Fetch course details from database
-    courses = courses_collection.find(
-        {"科號": {"$in": course_codes}},
-        {"_id": 0, "科號": 1, "課程中文名稱": 1, "課程英文名稱": 1}
-    )
-    
-    # Create a mapping of course code to name
-    course_map = {}
-    for c in courses:
-        code = c.get("科號", "")
-        name_en = c.get("課程英文名稱", "")
-        name_zh = c.get("課程中文名稱", "")
-        # Use English name if available, otherwise Chinese name
-        display_name = name_en or name_zh or code
-        course_map[code] = display_name
-    
-    return jsonify({"courses": course_map})
+    return jsonify({"courses": course_names(course_codes)})
 
 
-@app.route("/send_otp", methods=["POST"])
+@bp.route("/courses/<code>/students", methods=["GET"])
+@login_required
+def course_students(code):
+    """One page of a course's roster, keyed by the last student_id of the previous page"""
+    try:
+        limit = min(max(request.args.get("limit", ROSTER_PAGE_SIZE, type=int), 1), ROSTER_MAX_PAGE_SIZE)
+        after = request.args.get("after")
+        if after and not ObjectId.is_valid(after):
+            return jsonify({"error": "Invalid after cursor"}), 400
+        ids = repository.roster_page(code, after, limit)
+        people = {s["_id"]: s for s in repository.get_senders(ids)} if ids else {}
+        return jsonify(
+            {
+                "course": code,
+                "count": repository.roster_count(code),
+                "students": [people[i] for i in ids if i in people],
+                "next_after": str(ids[-1]) if len(ids) == limit else None,
+            }
+        )
+    except Exception as e:
+        return jsonify({"error": f"Error fetching roster: {str(e)}"}), 500
+
+
+@bp.route("/courses/popular", methods=["GET"])
+def popular_courses():
+    try:
+        limit = min(max(request.args.get("limit", 20, type=int), 1), ROSTER_MAX_PAGE_SIZE)
+        rows = repository.popular_courses(limit)
+        names = course_names([r["_id"] for r in rows]) if rows else {}
+        return jsonify(
+            {"courses": [{"code": r["_id"], "name": names.get(r["_id"], r["_id"]), "students": r["count"]} for r in rows]}
+        )
+    except Exception as e:
+        return jsonify({"error": f"Error fetching popular courses: {str(e)}"}), 500
+
+
+@bp.route("/send_otp", methods=["POST"])
 def send_otp():
     """Send OTP to email for verification"""
     data = request.json
@@ -659,6 +714,10 @@ def send_otp():
     
     if not is_valid_nthu_email(email):
         return jsonify({"error": "Please use a valid NTHU email address ending with .nthu.edu.tw"}), 400
+
+    retry_after = admission.check_rates([("otp_email", email), ("otp_ip", client_ip())])
+    if retry_after:
+        return admission.rate_limited_response(retry_after, "Too many OTP requests. Please try again later.")
     
     # Generate and store OTP
     otp = generate_otp()
@@ -671,7 +730,7 @@ def send_otp():
         return jsonify({"error": "Failed to send OTP. Please check your email address and try again."}), 500
 
 
-@app.route("/verify_otp", methods=["POST"])
+@bp.route("/verify_otp", methods=["POST"])
 def verify_otp_endpoint():
     """Verify OTP for email"""
     data = request.json
@@ -687,117 +746,210 @@ def verify_otp_endpoint():
         return jsonify({"error": "Invalid or expired OTP"}), 400
 
 
-@app.route("/register", methods=["POST"])
+@bp.route("/register", methods=["POST"])
 def register():
     data = request.json
     email = (data.get("email") or "").strip().lower()
     
     # Check if email is verified
-    otp_doc = otp_collection.find_one({
-        "email": email,
-        "verified": True,
-        "expires_at": {"$gt": datetime.utcnow()}
-    })
-    
-    if not otp_doc:
+    if not repository.has_verified_otp(email):
         return jsonify({"error": "Email not verified. Please verify your email first."}), 400
     
     is_valid, message = validate_student_data(data)
     if not is_valid:
         return jsonify({"error": message}), 400
-    data["created_at"] = datetime.utcnow()
-    data["email_verified"] = True  # Mark as verified
     try:
-        result = students_collection.insert_one(data)
+        student_id = repository.insert_student(repository.new_student_doc(data, email_verified=True))
         # Clean up OTP after successful registration
-        otp_collection.delete_one({"email": email})
-        return jsonify({"message": "Registration successful", "student_id": str(result.inserted_id)}), 201
+        repository.delete_otp(email)
+        new_matches.submit(student_id)
+        return jsonify({"message": "Registration successful", "student_id": str(student_id)}), 201
+    except DuplicateKeyError:
+        # Lost a race with a concurrent registration or import (unique email index)
+        return jsonify({"error": "Email already registered"}), 400
     except Exception as e:
         return jsonify({"error": f"Error saving student: {str(e)}"}), 500
 
 
-@app.route("/add_student", methods=["POST"])
+@bp.route("/add_student", methods=["POST"])
 @login_required
 def add_student():
     data = request.json
     is_valid, message = validate_student_data(data)
     if not is_valid:
         return jsonify({"error": message}), 400
-    data["created_at"] = datetime.utcnow()
     try:
-        result = students_collection.insert_one(data)
-        return jsonify({"message": "Student added successfully", "student_id": str(result.inserted_id)}), 201
+        student_id = repository.insert_student(repository.new_student_doc(data))
+        return jsonify({"message": "Student added successfully", "student_id": str(student_id)}), 201
+    except DuplicateKeyError:
+        return jsonify({"error": "Email already registered"}), 400
     except Exception as e:
         return jsonify({"error": f"Error saving student: {str(e)}"}), 500
 
 
-@app.route("/get_students", methods=["GET"])
+@bp.route("/import_students", methods=["POST"])
+@admin_required
+def import_students():
+    """Bulk add students from a JSON Lines or CSV upload, streaming one result line per row.
+
+    The import runs in its own thread and finishes even if the client
+    disconnects; the summary line is then only logged.
+    """
+    upload = request.files.get("file")
+    if upload:
+        body, filename, content_type = upload.read(), upload.filename, upload.content_type
+    else:
+        body, filename, content_type = request.get_data(), "", request.content_type
+    fmt = request.args.get("format") or student_import.detect_format(filename, content_type)
+    if fmt not in student_import.FORMATS:
+        return jsonify({"error": f"Unsupported format: {fmt}"}), 400
+    dry_run = request.args.get("dry_run", "").lower() in ("1", "true", "yes")
+    try:
+        lines = student_import.decode_body(body)
+    except UnicodeDecodeError:
+        return jsonify({"error": "File must be UTF-8 encoded"}), 400
+
+    results = queue.Queue()
+    disconnected = threading.Event()
+
+    def run():
+        counts = {"inserted": 0, "valid": 0, "error": 0}
+        summary = {"summary": counts, "dry_run": dry_run}
+        try:
+            rows = student_import.read_rows(lines, fmt)
+            for result in student_import.import_students(rows, COLLEGE_DEPARTMENTS, dry_run=dry_run):
+                counts[result["status"]] += 1
+                if not disconnected.is_set():
+                    results.put(result)
+        except Exception as e:
+            request_log.exception("student import failed", extra=counts)
+            summary["error"] = f"Import stopped: {e}"
+        if disconnected.is_set():
+            request_log.info("student import finished after the client disconnected", extra=summary)
+        results.put(summary)
+
+    threading.Thread(target=tracing.propagate(run), name="student-import", daemon=True).start()
+
+    def report():
+        finished = False
+        try:
+            while not finished:
+                item = results.get()
+                finished = "summary" in item
+                yield json.dumps(item) + "\n"
+        finally:
+            if not finished:
+                disconnected.set()
+
+    return current_app.response_class(report(), mimetype="application/x-ndjson")
+
+
+@bp.route("/get_students", methods=["GET"])
 @login_required
 def get_students():
     try:
-        students = []
-        for s in students_collection.find():
-            s["_id"] = str(s["_id"])
-            students.append(s)
+        students = repository.list_profiles()
         return jsonify({"students": students, "count": len(students)})
     except Exception as e:
         return jsonify({"error": f"Error fetching students: {str(e)}"}), 500
 
 
-@app.route("/get_student/<student_id>", methods=["GET"])
+@bp.route("/get_student/<student_id>", methods=["GET"])
 @login_required
 def get_student(student_id):
     try:
-        student = students_collection.find_one({"_id": ObjectId(student_id)})
+        student = repository.get_profile(student_id)
         if not student:
             return jsonify({"error": "Student not found"}), 404
-        student["_id"] = str(student["_id"])
         return jsonify(student)
     except Exception as e:
         return jsonify({"error": f"Error fetching student: {str(e)}"}), 500
 
 
-@app.route("/get_matches/<student_id>", methods=["GET"])
+def compute_matches(student_id, filters=None):
+    """(body, status) for /get_matches; identical for every viewer of the same student and filters"""
+    filters = filters or {}
+    target = repository.match_student(student_id)
+    if not target:
+        return {"error": "Student not found"}, 404
+
+    # Partners already emailed or blocked (either way) never come back
+    exclude = partner_filters.load(student_id)
+    matrix = feature_matrix.get_matrix()
+    if matrix is not None:
+        # Indexed filters pick the rows to score; the stricter they are, the fewer
+        query = filter_query(filters)
+        rows = matrix.rows_of(repository.candidate_ids(query)) if query else None
+        # Shortlist from the shared matrix, then re-score only those in full
+        candidate_ids, total_checked = shortlist(
+            matrix, target, ObjectId(student_id), exclude=exclude, rows=rows, shared_time=filters.get("shared_time", False)
+        )
+        others = repository.match_candidates(candidate_ids)
+    else:
+        # One scan of the other students; the feature vocabulary is built
+        # from target + others instead of a second full collection scan
+        others = repository.match_students_except(student_id, exclude.object_ids(), filter_query(filters, target))
+        total_checked = None
+    course_slots = repository.course_slots(timetable.student_course_ids([target, *others]))
+    return build_match_response(
+        target, others, course_slots=course_slots, total_checked=total_checked, filters=filters
+    )
+
+
+def serve_matches(student_id, args):
+    """(body, status) for a /get_matches request; shared by the Flask route and asgi.py"""
+    filters = parse_filters(args)
+    key = f"get_matches:{student_id}" + (f"?{filters_key(filters)}" if filters else "")
+    # Concurrent requests for the same student and filters (any worker) share one computation
+    body, status = singleflight.do(key, lambda: compute_matches(student_id, filters), shared=True)
+    # Seed the stored top-N list that live new-match detection compares against
+    new_matches.seed(ObjectId(student_id))
+    return body, status
+
+
+@bp.route("/get_matches/<student_id>", methods=["GET"])
 @login_required
+@admission.limit("get_matches")
 def get_matches(student_id):
+    """Top matches, optionally limited by ?department=&college=&course=&shared_time=1"""
     try:
-        target = students_collection.find_one({"_id": ObjectId(student_id)})
-        if not target:
-            return jsonify({"error": "Student not found"}), 404
-        all_courses, all_spots, all_times = get_all_unique_features()
-        if not all_courses:
-            return jsonify({"error": "No course data available"}), 400
-
-        others = list(students_collection.find({"_id": {"$ne": ObjectId(student_id)}}))
-        if not others:
-            return jsonify({"message": "No other students available", "matches": []}), 200
-
-        tf = encode_features(target, all_courses, all_spots, all_times)
-        matches = []
-        for student in others:
-            sf = encode_features(student, all_courses, all_spots, all_times)
-            similarity = calculate_weighted_similarity(tf, sf, all_courses, all_spots)
-            matches.append(
-                {
-                    "student_id": str(student["_id"]),
-                    "name": student["name"],
-                    "email": student["email"],
-                    "department": student["department"],
-                    "similarity": round(similarity * 100, 1),
-                    "shared_courses": list(set(target.get("course_ids", [])) & set(student.get("course_ids", []))),
-                    "shared_spots": list(set(target.get("study_spots", [])) & set(student.get("study_spots", []))),
-                    "shared_times": list(set(target.get("study_times", [])) & set(student.get("study_times", []))),
-                }
-            )
-        matches.sort(key=lambda x: x["similarity"], reverse=True)
-        top_matches = matches[:3]
-        return jsonify({"target_student": target["name"], "matches": top_matches, "total_checked": len(others)})
+        body, status = serve_matches(student_id, request.args)
+        log_match_events(ranker.impression_events(session["user_id"], body.get("matches", [])))
+        return jsonify(body), status
     except Exception as e:
         return jsonify({"error": f"Error computing matches: {str(e)}"}), 500
 
 
-@app.route("/send_partner_email", methods=["POST"])
+@bp.route("/get_groups", methods=["GET"])
 @login_required
+@admission.limit("get_groups")
+def get_groups():
+    """Balanced study groups of 3-5 for one course, or for the caller's department when no course is given"""
+    try:
+        course = request.args.get("course", "").strip()
+        size = request.args.get("size", groups.DEFAULT_GROUP_SIZE, type=int)
+        if course:
+            scope, load, value = course, repository.students_in_course, course
+        else:
+            department = (repository.get_sender(session["user_id"]) or {}).get("department") or ""
+            scope, load, value = f"department:{department}", repository.students_in_department, department
+
+        def compute():
+            return groups.groups_for(scope, lambda: load(value), semester.current(), size)
+
+        body = singleflight.do(f"get_groups:{scope}:{size}", compute)
+        mine = next(
+            (i for i, g in enumerate(body["groups"]) if any(m["student_id"] == session["user_id"] for m in g["members"])),
+            None,
+        )
+        return jsonify({**body, "your_group": mine})
+    except Exception as e:
+        return jsonify({"error": f"Error forming groups: {str(e)}"}), 500
+
+
+@bp.route("/send_partner_email", methods=["POST"])
+@login_required
+@admission.limit("send_partner_email")
 def send_partner_email():
     """Send an email to a potential study partner"""
     try:
@@ -806,7 +958,7 @@ def send_partner_email():
             return jsonify({"error": "Not authenticated"}), 401
         
         # Get the current user
-        current_user = students_collection.find_one({"_id": ObjectId(user_id)})
+        current_user = repository.get_sender(user_id)
         if not current_user:
             return jsonify({"error": "User not found"}), 404
         
@@ -826,6 +978,17 @@ def send_partner_email():
         # Validate partner email is NTHU
         if not is_valid_nthu_email(partner_email):
             return jsonify({"error": "Invalid partner email"}), 400
+
+        retry_after = admission.check_rates([("partner_email_user", user_id), ("partner_email_ip", client_ip())])
+        if retry_after:
+            return admission.rate_limited_response(retry_after, "You have sent too many partner requests. Please try again later.")
+
+        partner_id = repository.student_id_by_email(partner_email.lower())
+        if partner_id and partner_filters.is_blocked_by(user_id, partner_id):
+            return jsonify({"error": "This student is not accepting partner requests"}), 403
+        # One request per recipient; claimed before sending so concurrent sends cannot both go out
+        if not partner_filters.claim_contact(user_id, partner_email, partner_id):
+            return jsonify({"error": "You have already sent a partner request to this student"}), 409
         
         # Format shared items for email
         shared_courses_str = ", ".join(shared_courses) if shared_courses else "various courses"
@@ -917,45 +1080,102 @@ https://studybuddynthu.org
                 html=html_body,
                 reply_to=sender_email  # KEY: Replies go to the sender, not StudyBuddy
             )
-            mail.send(msg)
+            with tracing.span("smtp send", "client", **{"smtp.purpose": "partner_request"}):
+                mail.send(msg)
             
-            print(f"✅ Partner email sent from {sender_email} to {partner_email}")
+            email_log.info("partner email sent", extra={"sender": sender_email, "recipient": partner_email})
+            if partner_id:
+                log_match_events([ranker.contact_event(user_id, str(partner_id))])
             return jsonify({
                 "message": "Email sent successfully! Your study partner will receive your connection request.",
                 "sent_to": partner_email
             }), 200
             
         except Exception as email_error:
-            print(f"❌ Error sending partner email: {email_error}")
+            email_log.error("partner email failed", extra={"recipient": partner_email, "error": str(email_error)})
+            partner_filters.release_contact(user_id, partner_email, partner_id)
             return jsonify({"error": "Failed to send email. Please try again later."}), 500
         
     except Exception as e:
-        print(f"Error in send_partner_email: {e}")
+        request_log.exception("send_partner_email failed")
         return jsonify({"error": f"Error sending email: {str(e)}"}), 500
 
 
-@app.route("/update_courses_from_nthu", methods=["POST"])
+@bp.route("/blocks", methods=["GET"])
+@login_required
+def list_blocks():
+    """Students the current user has blocked"""
+    try:
+        ids = partner_filters.blocked_ids(session["user_id"])
+        return jsonify({"blocked": repository.get_senders(ids) if ids else []})
+    except Exception as e:
+        return jsonify({"error": f"Error fetching blocks: {str(e)}"}), 500
+
+
+@bp.route("/blocks/<student_id>", methods=["POST", "DELETE"])
+@login_required
+def block_student(student_id):
+    """Hide a student from your matches (and you from theirs); DELETE undoes it"""
+    if not ObjectId.is_valid(student_id) or student_id == session["user_id"]:
+        return jsonify({"error": "Invalid student id"}), 400
+    try:
+        if request.method == "DELETE":
+            partner_filters.unblock(session["user_id"], student_id)
+            return jsonify({"message": "Student unblocked", "student_id": student_id})
+        partner_filters.block(session["user_id"], student_id)
+        return jsonify({"message": "Student blocked", "student_id": student_id})
+    except Exception as e:
+        return jsonify({"error": f"Error updating blocks: {str(e)}"}), 500
+
+
+@bp.route("/update_courses_from_nthu", methods=["POST"])
 @login_required
+@admission.limit("update_courses_from_nthu")
 def update_courses_from_nthu():
     """Fetch latest course data from NTHU's live JSON endpoint and update database"""
+    # A double-click or a second admin joins the refresh already running
+    body, status = singleflight.do(
+        "update_courses_from_nthu", refresh_courses_from_nthu, shared=True, wait=COURSE_REFRESH_WAIT_SECONDS
+    )
+    return jsonify(body), status
+
+
+def archive_semester(term):
+    """Archive course selections older than term, then rebuild the matrix without them"""
+    try:
+        students, codes = repository.archive_stale_courses(term)
+        courses_log.info("archived stale course selections", extra={"term": term, "courses": codes, "students": students})
+        feature_matrix.rebuild_if_older_than(time.time(), load_match_students)
+    except Exception:
+        courses_log.exception("semester archival failed", extra={"term": term})
+
+
+def refresh_courses_from_nthu():
+    """Download the NTHU feed and upsert it; returns (body, status)"""
+    import requests
+
     try:
         NTHU_COURSE_URL = "https://www.ccxp.nthu.edu.tw/ccxp/INQUIRE/JH/OPENDATA/open_course_data.json"
         
-        print(f"🔄 Fetching course data from NTHU...")
-        response = requests.get(NTHU_COURSE_URL, timeout=30)
+        started = time.perf_counter()
+        courses_log.info("fetching nthu course feed", extra={"url": NTHU_COURSE_URL})
+        with tracing.span("GET nthu course feed", "client", **{"http.method": "GET", "http.url": NTHU_COURSE_URL}) as fetch:
+            response = requests.get(NTHU_COURSE_URL, timeout=30)
+            fetch.set(**{"http.status_code": response.status_code, "http.response_content_length": len(response.content)})
         
         if response.status_code != 200:
-            return jsonify({"error": f"Failed to fetch from NTHU: {response.status_code}"}), 500
+            courses_log.warning("nthu course feed failed", extra={"status": response.status_code})
+            return {"error": f"Failed to fetch from NTHU: {response.status_code}"}, 500
         
         # Parse JSON data
         courses_data = response.json()
         
         if not isinstance(courses_data, list):
-            return jsonify({"error": "Invalid course data format from NTHU"}), 500
+            return {"error": "Invalid course data format from NTHU"}, 500
         
         # Process and update courses
-        updated_count = 0
-        new_count = 0
+        course_docs = []
+        now = datetime.utcnow()
         
         for course in courses_data:
             if not isinstance(course, dict):
@@ -975,45 +1195,68 @@ def update_courses_from_nthu():
                 "name_zh": course_name_zh,
                 "name_en": course_name_en,
                 "display": f"{course_code} - {course_name_zh}",
-                "updated_at": datetime.utcnow()
+                "updated_at": now
             }
-            
-            # Upsert course (update if exists, insert if new)
-            result = courses_collection.update_one(
-                {"code": course_code},
-                {"$set": course_doc},
-                upsert=True
-            )
-            
-            if result.upserted_id:
-                new_count += 1
-            elif result.modified_count > 0:
-                updated_count += 1
+            slots = timetable.course_slot_bits(course)
+            if slots is not None:
+                course_doc["slots"] = slots
+            course_docs.append(course_doc)
         
-        total_courses = courses_collection.count_documents({})
+        # Upsert every course (update if exists, insert if new) in one bulk write
+        new_count, updated_count = repository.upsert_courses(course_docs)
+        total_courses = repository.count_courses()
+
+        # Publish the mmapped catalog for search/name lookups in every worker
+        try:
+            catalog_snapshot.publish(courses_data)
+        except Exception as e:
+            courses_log.warning("catalog snapshot not published", extra={"error": str(e)})
+
+        # Related-course table for soft course overlap in matching
+        try:
+            course_similarity.publish(courses_data)
+        except Exception as e:
+            courses_log.warning("course similarity table not published", extra={"error": str(e)})
+
+        # The feed is the current term's catalog; archive older selections behind it
+        term = semester.feed_semester(d["code"] for d in course_docs)
+        if term:
+            semester.set_current(term)
+            threading.Thread(
+                target=tracing.propagate(archive_semester), args=(term,), name="semester-archive", daemon=True
+            ).start()
         
-        print(f"✅ Course update complete: {new_count} new, {updated_count} updated, {total_courses} total")
+        courses_log.info(
+            "course update complete",
+            extra={
+                "new": new_count,
+                "updated": updated_count,
+                "total": total_courses,
+                "semester": term,
+                "duration_ms": _elapsed_ms(started),
+            },
+        )
         
-        return jsonify({
+        return {
             "message": "Courses updated successfully from NTHU",
             "new_courses": new_count,
             "updated_courses": updated_count,
-            "total_courses": total_courses
-        }), 200
+            "total_courses": total_courses,
+            "semester": term,
+        }, 200
         
     except requests.Timeout:
-        return jsonify({"error": "Timeout fetching from NTHU server"}), 500
+        courses_log.error("nthu course feed timed out", extra={"timeout_s": 30})
+        return {"error": "Timeout fetching from NTHU server"}, 500
     except Exception as e:
-        print(f"❌ Error updating courses: {e}")
-        import traceback
-        traceback.print_exc()
-        return jsonify({"error": f"Error updating courses: {str(e)}"}), 500
+        courses_log.exception("course update failed")
+        return {"error": f"Error updating courses: {str(e)}"}, 500
 
 
-@app.route("/update_profile", methods=["PUT"])
+@bp.route("/update_profile", methods=["PUT"])
 @login_required
 def update_profile():
-    """Update user profile - courses, study spots, and study times"""
+    """Update user profile - courses, study spots, study times and match weights"""
     try:
         user_id = session.get("user_id")
         if not user_id:
@@ -1050,10 +1293,21 @@ def update_profile():
             if not isinstance(study_times, list):
                 return jsonify({"error": "study_times must be a list"}), 400
             # Validate study times against allowed values
-            for time in study_times:
-                if time not in STUDY_TIMES:
-                    return jsonify({"error": f"Invalid study time: {time}"}), 400
+            for slot in study_times:
+                if slot not in STUDY_TIMES:
+                    return jsonify({"error": f"Invalid study time: {slot}"}), 400
             update_fields["study_times"] = study_times
+
+        # Personal block weights for matching; null restores the defaults
+        if "match_weights" in data:
+            if data["match_weights"] is None:
+                update_fields["match_weights"] = None
+            else:
+                try:
+                    weights = parse_weights(data["match_weights"])
+                except ValueError as e:
+                    return jsonify({"error": str(e)}), 400
+                update_fields["match_weights"] = dict(zip(WEIGHT_KEYS, weights))
         
         if not update_fields:
             return jsonify({"error": "No valid fields to update"}), 400
@@ -1061,18 +1315,14 @@ def update_profile():
         # Add updated_at timestamp
         update_fields["updated_at"] = datetime.utcnow()
         
-        # Update the user in database
-        result = students_collection.update_one(
-            {"_id": ObjectId(user_id)},
-            {"$set": update_fields}
-        )
+        # Update the user and read it back in one round trip
+        updated_user = repository.update_profile(user_id, update_fields)
         
-        if result.matched_count == 0:
+        if updated_user is None:
             return jsonify({"error": "User not found"}), 404
-        
-        # Fetch and return updated user data
-        updated_user = students_collection.find_one({"_id": ObjectId(user_id)})
-        updated_user["_id"] = str(updated_user["_id"])
+
+        if update_fields.keys() & {"course_ids", "study_spots", "study_times"}:
+            new_matches.submit(ObjectId(user_id))
         
         return jsonify({
             "message": "Profile updated successfully",
@@ -1080,27 +1330,32 @@ def update_profile():
         }), 200
         
     except Exception as e:
-        print(f"Error updating profile: {e}")
+        request_log.exception("update_profile failed")
         return jsonify({"error": f"Error updating profile: {str(e)}"}), 500
 
 
 # Error handlers
-@app.errorhandler(404)
+@bp.app_errorhandler(404)
 def not_found(error):
+    request_log.info("not found", extra={"method": request.method, "path": request.path})
     return jsonify({"error": "Endpoint not found"}), 404
 
-@app.errorhandler(500)
+@bp.app_errorhandler(500)
 def internal_error(error):
+    request_log.error("internal server error", extra={"method": request.method, "path": request.path, "error": str(error)})
     return jsonify({"error": "Internal server error", "message": str(error)}), 500
 
-@app.errorhandler(Exception)
+@bp.app_errorhandler(Exception)
 def handle_exception(error):
-    # Log the error for debugging
-    print(f"Unhandled exception: {error}")
-    import traceback
-    traceback.print_exc()
+    request_log.error(
+        "unhandled exception",
+        exc_info=error,
+        extra={"method": request.method, "path": request.path},
+    )
     return jsonify({"error": "An unexpected error occurred", "message": str(error)}), 500
 
+app = create_app()
+
 if __name__ == "__main__":
     port = int(os.getenv("PORT", 5001))
     app.run(host="0.0.0.0", port=port, debug=os.getenv("FLASK_ENV") == "development")
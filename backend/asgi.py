@@ -0,0 +1,252 @@
+"""
+ASGI entry point: async read endpoints in front of the Flask app.
+
+    uvicorn asgi:application --host 0.0.0.0 --port $PORT --workers 2
+    # or through the gunicorn config
+    GUNICORN_WORKER_CLASS=uvicorn gunicorn -c gunicorn.conf.py asgi:application
+
+The read-heavy endpoints below are served on the event loop with the async
+Mongo driver, so one worker overlaps hundreds of Atlas round trips instead
+of parking a thread or process on each:
+
+    GET  /search_courses
+    POST /get_course_names
+    GET  /me
+
+GET /get_matches/<student_id> runs app.serve_matches in a thread, so it
+shares the Flask route's single-flight dedupe and new-match seeding. Only
+its impression logging uses the async driver.
+
+Every other request (and OPTIONS preflights) goes to the unchanged Flask app
+through asgiref's WsgiToAsgi. Responses, CORS headers and session handling
+match the Flask routes: the session cookie is verified with the Flask app's
+own signing serializer. The sync entry point (gunicorn app:app) is still the
+default deployment.
+"""
+
+import asyncio
+from http.cookies import SimpleCookie
+from urllib.parse import parse_qs
+
+from asgiref.wsgi import WsgiToAsgi
+from bson import ObjectId
+from itsdangerous import BadSignature
+
+import admission
+import async_db
+import catalog
+import catalog_snapshot
+import logs
+import ranker
+import repository
+import tracing
+from app import app as flask_app, _cors_origin_allowed, serve_matches, start_background_workers
+
+wsgi_fallback = WsgiToAsgi(flask_app)
+
+request_log = logs.get_logger("requests")
+
+
+class Request:
+    def __init__(self, scope, body):
+        self.method = scope["method"]
+        self.path = scope["path"]
+        self.args = {k: v[0] for k, v in parse_qs(scope["query_string"].decode("latin-1")).items()}
+        self.headers = {k.decode("latin-1").lower(): v.decode("latin-1") for k, v in scope["headers"]}
+        self.body = body
+
+    def json(self):
+        return flask_app.json.loads(self.body or b"null")
+
+    def session(self):
+        """Decode the Flask session cookie; {} when missing or tampered with"""
+        cookie = SimpleCookie(self.headers.get("cookie", ""))
+        morsel = cookie.get(flask_app.config["SESSION_COOKIE_NAME"])
+        if morsel is None:
+            return {}
+        serializer = flask_app.session_interface.get_signing_serializer(flask_app)
+        max_age = int(flask_app.permanent_session_lifetime.total_seconds())
+        try:
+            return serializer.loads(morsel.value, max_age=max_age)
+        except BadSignature:
+            return {}
+
+
+async def read_body(receive):
+    chunks = []
+    while True:
+        message = await receive()
+        chunks.append(message.get("body", b""))
+        if not message.get("more_body"):
+            return b"".join(chunks)
+
+
+async def send_json(send, request, body, status=200, extra_headers=()):
+    # Same encoding as jsonify() (the app's JSON provider, trailing newline)
+    payload = f"{flask_app.json.dumps(body)}\n".encode("utf-8")
+    headers = [(b"content-type", b"application/json"), (b"content-length", str(len(payload)).encode())]
+    headers += [(k.lower().encode("latin-1"), v.encode("latin-1")) for k, v in extra_headers]
+    origin = request.headers.get("origin")
+    if _cors_origin_allowed(origin):
+        headers += [
+            (b"access-control-allow-origin", origin.encode("latin-1")),
+            (b"access-control-allow-credentials", b"true"),
+            (b"access-control-allow-headers", b"Content-Type, Authorization"),
+            (b"access-control-allow-methods", b"GET, POST, PUT, DELETE, OPTIONS"),
+            (b"access-control-max-age", b"3600"),
+            (b"vary", b"Origin"),
+        ]
+    await send({"type": "http.response.start", "status": status, "headers": headers})
+    await send({"type": "http.response.body", "body": payload})
+
+
+# Async handlers return (body, status[, headers]), mirroring the Flask routes
+
+
+def gated(name):
+    """admission.limit() for async handlers"""
+
+    def decorator(handler):
+        async def wrapped(request, *args):
+            gate = admission.get_gate(name)
+            if gate.limit <= 0:
+                return await handler(request, *args)
+            fd, reason = await gate.acquire_async()
+            if fd is None:
+                gate.rejected(reason)
+                body = {"error": "Server is busy, please try again shortly"}
+                return body, 503, [("Retry-After", str(admission.RETRY_AFTER_SECONDS))]
+            gate.entered()
+            try:
+                return await handler(request, *args)
+            finally:
+                gate.release(fd)
+
+        return wrapped
+
+    return decorator
+
+
+async def search_courses(request):
+    query = request.args.get("q", "").strip()
+    if len(query) < catalog.MIN_QUERY_LENGTH:
+        return {"courses": []}, 200
+
+    snapshot = catalog_snapshot.get_snapshot()
+    if snapshot is not None:
+        courses = snapshot.search(query, catalog.SEARCH_LIMIT)
+    else:
+        cursor = async_db.get_collection("courses").find(catalog.search_filter(query), catalog.COURSE_PROJECTION)
+        courses = await cursor.limit(catalog.SEARCH_LIMIT).to_list(None)
+    return {"courses": catalog.format_search_results(courses)}, 200
+
+
+async def get_course_names(request):
+    data = request.json() or {}
+    course_codes = data.get("course_codes", [])
+    if not course_codes:
+        return {"courses": {}}, 200
+
+    snapshot = catalog_snapshot.get_snapshot()
+    if snapshot is not None:
+        courses = snapshot.find_codes(course_codes)
+    else:
+        cursor = async_db.get_collection("courses").find(catalog.names_filter(course_codes), catalog.COURSE_PROJECTION)
+        courses = await cursor.to_list(None)
+    return {"courses": catalog.format_course_names(courses)}, 200
+
+
+async def me(request):
+    user_id = request.session().get("user_id")
+    if not user_id:
+        return {"error": "Authentication required"}, 401
+    try:
+        user = await async_db.get_collection("students").find_one(
+            {"_id": ObjectId(user_id)}, repository.PROFILE_PROJECTION
+        )
+        if user:
+            return user, 200
+        return {"error": "User not found"}, 404
+    except Exception as e:
+        return {"error": f"Error fetching user data: {str(e)}"}, 500
+
+
+async def log_match_events(events):
+    if not events:
+        return
+    from pymongo import WriteConcern
+
+    try:
+        collection = async_db.get_collection(ranker.EVENTS_COLLECTION)
+        await collection.with_options(write_concern=WriteConcern(w=0)).insert_many(events, ordered=False)
+    except Exception as e:
+        request_log.warning("could not log match events", extra={"events": len(events), "error": str(e)})
+
+
+@gated("get_matches")
+async def get_matches(request, student_id):
+    user_id = request.session().get("user_id")
+    if not user_id:
+        return {"error": "Authentication required"}, 401
+    try:
+        # The same deduplicated computation and new-match seeding as the Flask
+        # route; it waits on other workers' runs, so it stays off the event loop
+        body, status = await asyncio.to_thread(serve_matches, student_id, request.args)
+        await log_match_events(ranker.impression_events(user_id, body.get("matches", [])))
+        return body, status
+    except Exception as e:
+        return {"error": f"Error computing matches: {str(e)}"}, 500
+
+
+def route(method, path):
+    """Return (handler, args) for an async endpoint, or None to fall back to Flask"""
+    if method == "GET" and path == "/search_courses":
+        return search_courses, ()
+    if method == "POST" and path == "/get_course_names":
+        return get_course_names, ()
+    if method == "GET" and path == "/me":
+        return me, ()
+    if method == "GET" and path.startswith("/get_matches/"):
+        student_id = path[len("/get_matches/"):]
+        if student_id and "/" not in student_id:
+            return get_matches, (student_id,)
+    return None
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            start_background_workers(flask_app)
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await async_db.close()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def application(scope, receive, send):
+    if scope["type"] == "lifespan":
+        return await lifespan(receive, send)
+
+    matched = route(scope["method"], scope["path"]) if scope["type"] == "http" else None
+    if matched is None:
+        return await wsgi_fallback(scope, receive, send)
+
+    handler, args = matched
+    request = Request(scope, await read_body(receive))
+    rule = "/get_matches/<student_id>" if handler is get_matches else request.path
+    span, token = tracing.start_request(
+        f"{request.method} {rule}", request.headers.get("traceparent"), **{"http.method": request.method, "http.route": rule}
+    )
+    error = None
+    try:
+        body, status, *headers = await handler(request, *args)
+    except Exception as e:
+        error = e
+        body, status, headers = {"error": "An unexpected error occurred", "message": str(e)}, 500, []
+    extra_headers = [*(headers[0] if headers else ()), ("traceparent", span.traceparent)]
+    try:
+        await send_json(send, request, body, status, extra_headers)
+    finally:
+        tracing.finish_request(span, token, status, error)
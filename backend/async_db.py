@@ -0,0 +1,45 @@
+"""Async MongoDB access for the ASGI read path.
+
+Uses pymongo's native asyncio client (AsyncMongoClient), configured from the
+same MONGO_* settings as db.py. One client per worker process, created on
+first use inside the worker's event loop. With STORAGE_BACKEND=sqlite the
+embedded store is wrapped instead, each call running on a worker thread.
+"""
+import os
+
+import db
+
+_client = None
+_client_pid = None
+
+
+def get_client():
+    global _client, _client_pid
+    pid = os.getpid()
+    if _client is None or _client_pid != pid:
+        if db.STORAGE_BACKEND == "sqlite":
+            import sqlite_store
+
+            _client = sqlite_store.AsyncClient(db.get_client())
+        else:
+            from pymongo import AsyncMongoClient
+
+            options = db.client_options()
+            # One event loop multiplexes many more in-flight requests than a
+            # gthread worker, so the async pool is sized separately
+            options["maxPoolSize"] = int(os.getenv("ASYNC_MONGO_MAX_POOL_SIZE", 50))
+            _client = AsyncMongoClient(db.get_mongo_uri(), **options)
+        _client_pid = pid
+    return _client
+
+
+def get_collection(name):
+    return get_client()[db.DB_NAME][name]
+
+
+async def close():
+    global _client, _client_pid
+    if _client is not None and _client_pid == os.getpid():
+        await _client.close()
+    _client = None
+    _client_pid = None
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+Sync vs async serving of the read-heavy endpoints.
+
+Starts the same code twice through gunicorn.conf.py: `app:app` on gthread
+workers and `asgi:application` on uvicorn workers, with equal process
+counts, then drives both with many concurrent clients. The gap grows with
+Atlas round-trip time and with --concurrency, since the sync server can
+only wait on WORKERS x THREADS queries at once.
+
+Usage:
+    cd backend
+    python benchmarks/bench_async.py --concurrency 200 --duration 20
+    # include authenticated endpoints with a logged-in session cookie
+    python benchmarks/bench_async.py --session <cookie value> --student-id <id>
+"""
+
+import argparse
+import os
+import signal
+import statistics
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_workers import drive, free_port, start_gunicorn  # noqa: E402
+
+SERVERS = [
+    ("sync (gthread)", "gthread", "app:app"),
+    ("async (uvicorn)", "uvicorn", "asgi:application"),
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--duration", type=float, default=20)
+    parser.add_argument("--session", help="value of a logged-in `session` cookie")
+    parser.add_argument("--student-id", help="student id for /get_matches")
+    args = parser.parse_args()
+
+    mix = {"/search_courses?q=intro": 3, "/search_courses?q=calc": 2}
+    cookies = None
+    if args.session:
+        cookies = {"session": args.session}
+        mix["/me"] = 2
+        if args.student_id:
+            mix[f"/get_matches/{args.student_id}"] = 1
+
+    print(f"{'server':<18}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>8}")
+    results = {}
+    for label, worker_class, app_module in SERVERS:
+        proc, base = start_gunicorn(worker_class, free_port(), args.workers, args.threads, app_module)
+        try:
+            latencies, errors = drive(base, mix, args.concurrency, args.duration, cookies)
+        finally:
+            proc.send_signal(signal.SIGTERM)
+            proc.wait(timeout=30)
+        q = statistics.quantiles(latencies, n=100) if len(latencies) > 1 else latencies * 99
+        results[label] = len(latencies) / args.duration
+        print(f"{label:<18}{results[label]:>10.1f}{q[49]:>10.1f}{q[94]:>10.1f}{q[98]:>10.1f}{errors:>8}")
+
+    sync_rps, async_rps = results[SERVERS[0][0]], results[SERVERS[1][0]]
+    if sync_rps:
+        print(f"\nasync/sync throughput: {async_rps / sync_rps:.2f}x at concurrency {args.concurrency}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Serialization cost of /get_students-sized responses.
+
+Builds realistic student documents (ObjectId, datetimes, Chinese course
+names, list fields) and times three ways of turning them into a response:
+
+    legacy   str(_id) loop + Flask's default provider (what handlers used to do)
+    default  Flask's default provider with an ObjectId-aware default()
+    fast     json_provider.FastJSONProvider (orjson when installed)
+
+No database or network is needed.
+
+Usage:
+    cd backend
+    python benchmarks/bench_json.py --students 1000 10000 --repeat 5
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bson import ObjectId  # noqa: E402
+from flask import Flask  # noqa: E402
+from flask.json.provider import DefaultJSONProvider  # noqa: E402
+
+import json_provider  # noqa: E402
+from app import COLLEGE_DEPARTMENTS, STUDY_SPOTS, STUDY_TIMES  # noqa: E402
+
+
+def make_students(count, seed=0):
+    rnd = random.Random(seed)
+    courses = [f"1132{dept}{n:06d}" for dept in ("CS  ", "EE  ", "MATH", "PHYS", "CHEM") for n in range(0, 4000, 100)]
+    colleges = list(COLLEGE_DEPARTMENTS)
+    start = datetime(2025, 2, 1)
+    students = []
+    for i in range(count):
+        college = rnd.choice(colleges)
+        created = start + timedelta(seconds=rnd.randint(0, 10_000_000), microseconds=rnd.randint(0, 999_999))
+        students.append(
+            {
+                "_id": ObjectId(),
+                "name": f"學生 {i} Student",
+                "email": f"s{i}@m{rnd.randint(109, 114)}.nthu.edu.tw",
+                "college": college,
+                "department": rnd.choice(COLLEGE_DEPARTMENTS[college]),
+                "course_ids": rnd.sample(courses, rnd.randint(3, 8)),
+                "study_spots": rnd.sample(STUDY_SPOTS, rnd.randint(1, 3)),
+                "study_times": rnd.sample(STUDY_TIMES, rnd.randint(1, 3)),
+                "created_at": created,
+                "updated_at": created + timedelta(days=rnd.randint(0, 30)),
+                "email_verified": True,
+            }
+        )
+    return students
+
+
+class ObjectIdProvider(DefaultJSONProvider):
+    @staticmethod
+    def default(value):
+        if isinstance(value, ObjectId):
+            return str(value)
+        return DefaultJSONProvider.default(value)
+
+
+def legacy(app, students):
+    out = []
+    for s in students:
+        s = dict(s)
+        s["_id"] = str(s["_id"])
+        out.append(s)
+    return app.json.response({"students": out, "count": len(out)}).get_data()
+
+
+def direct(app, students):
+    return app.json.response({"students": students, "count": len(students)}).get_data()
+
+
+def timed(fn, app, students, repeat):
+    runs = []
+    with app.app_context():
+        for _ in range(repeat):
+            begin = time.perf_counter()
+            body = fn(app, students)
+            runs.append((time.perf_counter() - begin) * 1000)
+    return statistics.median(runs), len(body)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--students", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    apps = {}
+    for name, provider in (("legacy", DefaultJSONProvider), ("default", ObjectIdProvider), ("fast", json_provider.FastJSONProvider)):
+        app = Flask(name)
+        app.json = provider(app)
+        apps[name] = app
+
+    backend = "orjson" if json_provider.orjson is not None else "stdlib fallback"
+    print(f"fast provider: {backend}")
+    print(f"{'students':>10}{'variant':>10}{'median ms':>12}{'bytes':>12}{'speedup':>10}")
+    for count in args.students:
+        students = make_students(count)
+        base = None
+        for name, fn in (("legacy", legacy), ("default", direct), ("fast", direct)):
+            ms, size = timed(fn, apps[name], students, args.repeat)
+            base = base or ms
+            print(f"{count:>10}{name:>10}{ms:>12.1f}{size:>12}{base / ms:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Measure cold start: interpreter launch -> `import app` -> first request served.
+
+Each run is a fresh subprocess, so module caches and imports are paid every
+time, the same as a gunicorn worker boot. Exits non-zero when the median
+import-to-first-request time exceeds the budget, so it can gate deploys.
+
+Usage:
+    cd backend
+    python benchmarks/bench_startup.py --runs 5 --budget-ms 1500
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHILD = """
+import json
+import app
+import logs
+client = app.app.test_client()
+client.get("/health")
+# Flush and stop the log writer thread so its lines cannot interleave with the report
+logs.shutdown()
+print("STARTUP_REPORT " + json.dumps(app.startup_report.as_dict()), flush=True)
+"""
+
+
+def run_once():
+    begin = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-c", CHILD], cwd=BACKEND_DIR, capture_output=True, text=True, timeout=120
+    )
+    wall_ms = (time.perf_counter() - begin) * 1000
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr)
+    for line in result.stdout.splitlines():
+        if line.startswith("STARTUP_REPORT "):
+            # raw_decode ignores anything a stray thread wrote after the report
+            report, _ = json.JSONDecoder().raw_decode(line[len("STARTUP_REPORT "):])
+            report["wall_ms"] = round(wall_ms, 1)
+            return report
+    raise RuntimeError("child did not print a startup report")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, default=float(os.getenv("STARTUP_BUDGET_MS", 1500)))
+    args = parser.parse_args()
+
+    reports = [run_once() for _ in range(args.runs)]
+
+    phase_names = list(reports[0]["phases_ms"])
+    print(f"{'phase':<20}{'median ms':>12}")
+    for name in phase_names:
+        print(f"{name:<20}{statistics.median(r['phases_ms'][name] for r in reports):>12.1f}")
+    first_request = statistics.median(r["first_request_ms"] for r in reports)
+    wall = statistics.median(r["wall_ms"] for r in reports)
+    print(f"{'first_request':<20}{first_request:>12.1f}")
+    print(f"{'process wall':<20}{wall:>12.1f}")
+
+    if first_request > args.budget_ms:
+        print(f"❌ import-to-first-request {first_request:.1f}ms exceeds budget {args.budget_ms:.0f}ms")
+        return 1
+    print(f"✅ within budget ({args.budget_ms:.0f}ms)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
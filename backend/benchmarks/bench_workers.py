@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+Compare gunicorn worker classes under the StudyBuddy request mix.
+
+For each worker class a fresh gunicorn is started from gunicorn.conf.py
+(same env as production, only the worker model overridden), checked via
+/health, then driven by N concurrent clients for a fixed duration.
+Reports throughput, latency percentiles and error counts per class.
+
+Usage:
+    cd backend
+    python benchmarks/bench_workers.py --classes sync gthread gevent \\
+        --concurrency 32 --duration 20
+
+The default mix leans on the cheap read endpoints and the Mongo-backed
+search/readiness calls; pass --mix to weight other paths, e.g.
+    --mix /get_options=4 "/search_courses?q=calculus=3" /ready=2
+
+Without a cluster, run against the embedded store; results are then
+deterministic and free of network latency:
+    STORAGE_BACKEND=sqlite SQLITE_PATH=/tmp/bench.sqlite3 python benchmarks/bench_workers.py
+"""
+
+import argparse
+import os
+import random
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+
+import requests
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DEFAULT_MIX = {
+    "/get_options": 4,
+    "/search_courses?q=intro": 3,
+    "/ready": 2,
+    "/health": 1,
+}
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def parse_mix(items):
+    if not items:
+        return DEFAULT_MIX
+    mix = {}
+    for item in items:
+        path, _, weight = item.rpartition("=")
+        mix[path] = float(weight)
+    return mix
+
+
+def start_gunicorn(worker_class, port, workers, threads, app_module="app:app"):
+    env = dict(os.environ)
+    env.update(
+        PORT=str(port),
+        WEB_CONCURRENCY=str(workers),
+        GUNICORN_WORKER_CLASS=worker_class,
+        GUNICORN_THREADS=str(threads),
+    )
+    env.pop("MONGO_MAX_POOL_SIZE", None)
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", app_module],
+        cwd=BACKEND_DIR,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    base = f"http://127.0.0.1:{port}"
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        try:
+            if requests.get(f"{base}/health", timeout=5).status_code == 200:
+                return proc, base
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+    proc.send_signal(signal.SIGTERM)
+    raise RuntimeError(f"gunicorn ({worker_class}) did not become ready")
+
+
+def drive(base, mix, concurrency, duration, cookies=None):
+    paths = list(mix)
+    weights = [mix[p] for p in paths]
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    stop_at = time.perf_counter() + duration
+
+    def client(seed):
+        rng = random.Random(seed)
+        session = requests.Session()
+        session.cookies.update(cookies or {})
+        local, local_errors = [], 0
+        while time.perf_counter() < stop_at:
+            path = rng.choices(paths, weights)[0]
+            begin = time.perf_counter()
+            try:
+                ok = session.get(base + path, timeout=30).status_code < 500
+            except requests.RequestException:
+                ok = False
+            local.append((time.perf_counter() - begin) * 1000)
+            local_errors += not ok
+        with lock:
+            latencies.extend(local)
+            errors[0] += local_errors
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return latencies, errors[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--classes", nargs="+", default=["sync", "gthread", "gevent"])
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=20)
+    parser.add_argument("--mix", nargs="*")
+    args = parser.parse_args()
+    mix = parse_mix(args.mix)
+
+    print(f"{'worker class':<14}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>8}")
+    for worker_class in args.classes:
+        proc, base = start_gunicorn(worker_class, free_port(), args.workers, args.threads)
+        try:
+            latencies, errors = drive(base, mix, args.concurrency, args.duration)
+        finally:
+            proc.send_signal(signal.SIGTERM)
+            proc.wait(timeout=30)
+        latencies.sort()
+        q = statistics.quantiles(latencies, n=100) if len(latencies) > 1 else latencies * 99
+        print(
+            f"{worker_class:<14}{len(latencies) / args.duration:>10.1f}"
+            f"{q[49]:>10.1f}{q[94]:>10.1f}{q[98]:>10.1f}{errors:>8}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+"""Course catalog queries and response shaping.
+
+Shared by the Flask routes and the async read path so both return
+byte-identical course payloads.
+"""
+import re
+
+SEARCH_LIMIT = 50
+MIN_QUERY_LENGTH = 2
+
+# NTHU JSON uses Chinese field names
+COURSE_PROJECTION = {"_id": 0, "科號": 1, "課程中文名稱": 1, "課程英文名稱": 1}
+
+
+def search_filter(query):
+    # Search across code and names with partial match, case insensitive
+    regex = {"$regex": re.escape(query), "$options": "i"}
+    return {"$or": [{"科號": regex}, {"課程英文名稱": regex}, {"課程中文名稱": regex}]}
+
+
+def format_search_results(courses):
+    results = []
+    for c in courses:
+        code = c.get("科號", "")
+        name_en = c.get("課程英文名稱", "")
+        name_zh = c.get("課程中文名稱", "")
+        display = f"{code} - {name_en or name_zh}"
+        results.append({"code": code, "name_en": name_en, "name_zh": name_zh, "display": display})
+    return results
+
+
+def names_filter(course_codes):
+    return {"科號": {"$in": course_codes}}
+
+
+def format_course_names(courses):
+    # Create a mapping of course code to name
+    course_map = {}
+    for c in courses:
+        code = c.get("科號", "")
+        name_en = c.get("課程英文名稱", "")
+        name_zh = c.get("課程中文名稱", "")
+        # Use English name if available, otherwise Chinese name
+        display_name = name_en or name_zh or code
+        course_map[code] = display_name
+    return course_map
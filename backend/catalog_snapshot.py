@@ -0,0 +1,276 @@
+#!/usr/bin/env python3
+"""
+Memory-mapped binary course catalog shared by every worker on a host.
+
+Catalog ingest writes a versioned snapshot file. Workers mmap it read-only,
+so the pages are shared through the OS page cache instead of being copied
+into each process, and opening a snapshot is near-instant. /search_courses
+and /get_course_names read it directly and fall back to MongoDB when no
+snapshot has been published.
+
+File layout (little-endian, see HEADER):
+
+    header      magic, format version, course count, generation,
+                bigram count, then offset/length of each section
+    strings     UTF-8 blob holding every code and name
+    records     per course: (offset, length) of code, English and Chinese
+                name in `strings`, as 6 x uint32
+    code_index  course indices sorted by code (binary search for code -> name)
+    bigram_keys sorted uint64 keys of lowercased character bigrams
+    bigram_offs uint32 start of each key's posting list (+1 sentinel)
+    postings    uint32 course indices per bigram, ascending
+
+Publishing writes catalog-<generation>.bin, then atomically replaces the
+`current` pointer file. Readers check the pointer at most every
+CATALOG_SNAPSHOT_CHECK_SECONDS and swap to the new mapping. In-flight
+requests finish on the old one, which is unmapped once unreferenced.
+
+Usage (build from the courses already in MongoDB):
+    python catalog_snapshot.py build
+"""
+
+import bisect
+import mmap
+import os
+import struct
+import sys
+import threading
+import time
+
+import logs
+
+SNAPSHOT_DIR = os.getenv(
+    "CATALOG_SNAPSHOT_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "catalog")
+)
+CHECK_SECONDS = float(os.getenv("CATALOG_SNAPSHOT_CHECK_SECONDS", 5))
+KEEP_SNAPSHOTS = 2
+
+MAGIC = b"SBCATLG\x00"
+FORMAT_VERSION = 1
+SECTIONS = ("strings", "records", "code_index", "bigram_keys", "bigram_offs", "postings")
+HEADER = struct.Struct("<8sIIQII" + "Q" * (2 * len(SECTIONS)))
+POINTER_NAME = "current"
+
+log = logs.get_logger("catalog")
+
+
+def course_fields(course):
+    """(code, name_en, name_zh) from either a raw feed doc or an ingested doc"""
+    code = (course.get("科號") or course.get("code") or "").strip()
+    name_en = (course.get("課程英文名稱") or course.get("name_en") or "").strip()
+    name_zh = (course.get("課程中文名稱") or course.get("name_zh") or "").strip()
+    return code, name_en, name_zh
+
+
+def _bigrams(text):
+    return {(ord(a) << 21) | ord(b) for a, b in zip(text, text[1:])}
+
+
+def build_bytes(courses, generation):
+    """Serialize courses into the snapshot format"""
+    from array import array
+
+    rows = {}
+    for course in courses:
+        code, name_en, name_zh = course_fields(course)
+        if code and code not in rows:
+            rows[code] = (code, name_en, name_zh)
+    rows = sorted(rows.values())
+
+    strings = bytearray()
+    records = array("I")
+    postings_by_key = {}
+    for index, fields in enumerate(rows):
+        for text in fields:
+            encoded = text.encode("utf-8")
+            records.extend((len(strings), len(encoded)))
+            strings += encoded
+        keys = set()
+        for text in fields:
+            keys |= _bigrams(text.lower())
+        for key in keys:
+            postings_by_key.setdefault(key, []).append(index)
+
+    # Rows are already sorted by code, so the code index is the identity
+    code_index = array("I", range(len(rows)))
+    bigram_keys = array("Q", sorted(postings_by_key))
+    bigram_offs = array("I", [0])
+    postings = array("I")
+    for key in bigram_keys:
+        postings.extend(postings_by_key[key])
+        bigram_offs.append(len(postings))
+
+    if sys.byteorder != "little":
+        for arr in (records, code_index, bigram_keys, bigram_offs, postings):
+            arr.byteswap()
+
+    blobs = [bytes(strings), records.tobytes(), code_index.tobytes(), bigram_keys.tobytes(), bigram_offs.tobytes(), postings.tobytes()]
+    offsets, lengths, position = [], [], HEADER.size
+    for blob in blobs:
+        # 8-byte alignment keeps the uint64 section castable
+        position += -position % 8
+        offsets.append(position)
+        lengths.append(len(blob))
+        position += len(blob)
+
+    out = bytearray(position)
+    out[: HEADER.size] = HEADER.pack(MAGIC, FORMAT_VERSION, len(rows), generation, len(bigram_keys), 0, *offsets, *lengths)
+    for blob, offset in zip(blobs, offsets):
+        out[offset : offset + len(blob)] = blob
+    return bytes(out)
+
+
+class CatalogSnapshot:
+    """Read-only view over one mmapped snapshot file"""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        header = HEADER.unpack_from(self._mm, 0)
+        magic, version, self.count, self.generation, self.bigram_count = header[:5]
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise ValueError(f"{path} is not a v{FORMAT_VERSION} catalog snapshot")
+        n = len(SECTIONS)
+        offsets, lengths = header[6 : 6 + n], header[6 + n :]
+        view = memoryview(self._mm)
+        sections = {name: view[o : o + l] for name, o, l in zip(SECTIONS, offsets, lengths)}
+        self._strings = sections["strings"]
+        self._records = sections["records"].cast("I")
+        self._code_index = sections["code_index"].cast("I")
+        self._bigram_keys = sections["bigram_keys"].cast("Q")
+        self._bigram_offs = sections["bigram_offs"].cast("I")
+        self._postings = sections["postings"].cast("I")
+
+    def _text(self, index, field):
+        base = index * 6 + field * 2
+        offset, length = self._records[base], self._records[base + 1]
+        return bytes(self._strings[offset : offset + length]).decode("utf-8")
+
+    def course(self, index):
+        return self._text(index, 0), self._text(index, 1), self._text(index, 2)
+
+    def _as_doc(self, index):
+        code, name_en, name_zh = self.course(index)
+        return {"科號": code, "課程英文名稱": name_en, "課程中文名稱": name_zh}
+
+    def _posting_range(self, key):
+        i = bisect.bisect_left(self._bigram_keys, key)
+        if i == self.bigram_count or self._bigram_keys[i] != key:
+            return None
+        return self._bigram_offs[i], self._bigram_offs[i + 1]
+
+    def search(self, query, limit):
+        """Course docs (feed field names) whose code or name contains query, case-insensitive"""
+        needle = query.lower()
+        ranges = []
+        for key in _bigrams(needle):
+            found = self._posting_range(key)
+            if found is None:
+                return []
+            ranges.append(found)
+        if not ranges:
+            return []
+        # Walk the rarest bigram's postings and confirm each hit on the real text
+        start, end = min(ranges, key=lambda r: r[1] - r[0])
+        results = []
+        for position in range(start, end):
+            index = self._postings[position]
+            if any(needle in text.lower() for text in self.course(index)):
+                results.append(self._as_doc(index))
+                if len(results) >= limit:
+                    break
+        return results
+
+    def find_codes(self, codes):
+        """Course docs for the given codes (binary search on the code index)"""
+        docs = []
+        for code in set(codes):
+            lo, hi = 0, self.count
+            while lo < hi:
+                mid = (lo + hi) // 2
+                if self._text(self._code_index[mid], 0) < code:
+                    lo = mid + 1
+                else:
+                    hi = mid
+            if lo < self.count and self._text(self._code_index[lo], 0) == code:
+                docs.append(self._as_doc(self._code_index[lo]))
+        return docs
+
+
+def publish(courses, directory=None):
+    """Write a new snapshot generation and point readers at it; returns its path"""
+    directory = directory or SNAPSHOT_DIR
+    os.makedirs(directory, exist_ok=True)
+    generation = time.time_ns()
+    name = f"catalog-{generation}.bin"
+    path = os.path.join(directory, name)
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(build_bytes(courses, generation))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+    pointer_tmp = os.path.join(directory, f"{POINTER_NAME}.tmp")
+    with open(pointer_tmp, "w") as f:
+        f.write(name)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(pointer_tmp, os.path.join(directory, POINTER_NAME))
+
+    # Older generations can be unlinked even while mapped; pages stay valid
+    # until the last reader drops its mapping
+    snapshots = sorted(n for n in os.listdir(directory) if n.startswith("catalog-") and n.endswith(".bin"))
+    for stale in snapshots[:-KEEP_SNAPSHOTS]:
+        try:
+            os.remove(os.path.join(directory, stale))
+        except OSError:
+            pass
+    return path
+
+
+_current = None
+_pointer_mtime = None
+_checked_at = 0.0
+_lock = threading.Lock()
+
+
+def get_snapshot():
+    """The newest published snapshot for this process, or None"""
+    global _current, _pointer_mtime, _checked_at
+    now = time.monotonic()
+    if now - _checked_at < CHECK_SECONDS:
+        return _current
+    with _lock:
+        if now - _checked_at < CHECK_SECONDS:
+            return _current
+        _checked_at = now
+        pointer = os.path.join(SNAPSHOT_DIR, POINTER_NAME)
+        try:
+            mtime = os.stat(pointer).st_mtime_ns
+            if mtime != _pointer_mtime:
+                with open(pointer) as f:
+                    name = f.read().strip()
+                if _current is None or os.path.basename(_current.path) != name:
+                    _current = CatalogSnapshot(os.path.join(SNAPSHOT_DIR, name))
+                    log.info("opened catalog snapshot", extra={"generation": _current.generation, "courses": _current.count})
+                _pointer_mtime = mtime
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            log.warning("could not open catalog snapshot", extra={"error": str(e)})
+    return _current
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] != ["build"]:
+        print(__doc__)
+        sys.exit(1)
+    import db
+
+    projection = {"_id": 0, "科號": 1, "課程英文名稱": 1, "課程中文名稱": 1, "code": 1, "name_en": 1, "name_zh": 1}
+    path = publish(db.get_collection("courses").find({}, projection))
+    snapshot = CatalogSnapshot(path)
+    print(f"✅ Published {snapshot.count} courses to {path}")
@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+"""
+Incremental change feed for per-process structures built from a collection.
+
+Writes from /register, /add_student and /update_profile land in whichever
+worker served them. Every other worker learns about them through this
+feed instead of rescanning students. Consumers are plain callables that
+take a list of changes:
+
+    {"op": "upsert" | "delete", "_id": ObjectId, "doc": dict | None, "at": datetime}
+
+Two transports, chosen automatically:
+
+    stream  MongoDB change streams (replica sets, including Atlas). Updates
+            carry the full post-image and deletes are seen. Events are
+            drained into batches of up to STREAM_BATCH (or whatever
+            arrived within STREAM_BATCH_SECONDS), so a bulk import reaches
+            consumers as a few large deltas. The resume token, advanced
+            after each batch is dispatched, survives reconnects.
+    poll    Standalone servers and embedded stores. Every POLL_SECONDS the
+            feed queries documents whose updated_at or created_at is at or
+            after the watermark minus POLL_OVERLAP_SECONDS (both fields
+            indexed). The overlap picks up writes that were stamped
+            before a later write but committed after it. Documents
+            already delivered with the same timestamp are skipped.
+            Deletes are not visible in this mode.
+
+Lag (now minus the time of the newest applied change) and event counts are
+exported as studybuddy_change_feed_* metrics.
+
+Try it against a local single-node mongod, in either mode:
+
+    mongod --dbpath /tmp/db                          # poll mode
+    mongod --dbpath /tmp/db --replSet rs0            # then rs.initiate(): stream mode
+    MONGO_URI=mongodb://localhost:27017 python change_feed.py
+
+then register or edit a student and watch the deltas print.
+"""
+
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+import logs
+import metrics
+
+POLL_SECONDS = float(os.getenv("CHANGE_FEED_POLL_SECONDS", 2))
+# How far behind the watermark each poll re-reads, for late commits and clock skew between app servers
+POLL_OVERLAP_SECONDS = float(os.getenv("CHANGE_FEED_POLL_OVERLAP_SECONDS", 10))
+STREAM_BATCH = int(os.getenv("CHANGE_FEED_STREAM_BATCH", 1000))
+STREAM_BATCH_SECONDS = float(os.getenv("CHANGE_FEED_STREAM_BATCH_SECONDS", 0.5))
+# Always read, so the poll can order documents
+TIMESTAMP_FIELDS = ("updated_at", "created_at")
+
+# Server says change streams need a replica set / sharded cluster
+_STREAMS_UNSUPPORTED = {40573, 40324}
+
+metrics.describe("studybuddy_change_feed_lag_seconds", "Seconds between a write and this worker applying it")
+metrics.describe("studybuddy_change_feed_events_total", "Changes delivered to consumers")
+
+log = logs.get_logger("change_feed")
+
+
+class ChangeFeed:
+    def __init__(
+        self, collection, name, projection=None, mode="auto", poll_seconds=POLL_SECONDS, overlap_seconds=POLL_OVERLAP_SECONDS
+    ):
+        """projection: fields consumers read from each document (None for whole documents)"""
+        self.collection = collection
+        self.name = name
+        self.projection = {**projection, **{f: 1 for f in TIMESTAMP_FIELDS}} if projection else None
+        self.mode = mode
+        self.poll_seconds = poll_seconds
+        self.overlap = timedelta(seconds=overlap_seconds)
+        self.consumers = []
+        self.watermark = datetime.utcnow()
+        # _id -> timestamp delivered, for documents inside the overlap window
+        self._delivered = {}
+        self._resume_token = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def register(self, consumer):
+        self.consumers.append(consumer)
+        return consumer
+
+    def dispatch(self, changes):
+        if not changes:
+            return
+        for consumer in self.consumers:
+            try:
+                consumer(changes)
+            except Exception:
+                log.exception("change feed consumer failed", extra={"feed": self.name, "consumer": repr(consumer)})
+        newest = max(c["at"] for c in changes)
+        self._record(len(changes), (datetime.utcnow() - newest).total_seconds())
+
+    def _record(self, count, lag):
+        metrics.set_gauge("studybuddy_change_feed_lag_seconds", max(lag, 0.0), feed=self.name, mode=self.mode)
+        if count:
+            metrics.inc("studybuddy_change_feed_events_total", count, feed=self.name, mode=self.mode)
+
+    # Change streams
+
+    def _pipeline(self):
+        pipeline = [{"$match": {"operationType": {"$in": ["insert", "update", "replace", "delete"]}}}]
+        if self.projection:
+            fields = {f"fullDocument.{f}": 1 for f in ("_id", *self.projection)}
+            pipeline.append({"$project": {"operationType": 1, "documentKey": 1, "wallTime": 1, **fields}})
+        return pipeline
+
+    @staticmethod
+    def _change(event):
+        """Feed change for a stream event, or None when there is nothing to deliver"""
+        at = event.get("wallTime") or datetime.utcnow()
+        if event["operationType"] == "delete":
+            return {"op": "delete", "_id": event["documentKey"]["_id"], "doc": None, "at": at}
+        doc = event.get("fullDocument")
+        if doc is None:  # deleted before the lookup ran
+            return None
+        return {"op": "upsert", "_id": doc["_id"], "doc": doc, "at": at}
+
+    def drain(self, stream):
+        """Read events until the stream is idle, STREAM_BATCH arrive or STREAM_BATCH_SECONDS pass; returns changes"""
+        changes = []
+        deadline = None
+        while len(changes) < STREAM_BATCH and not self._stop.is_set():
+            event = stream.try_next()
+            if event is None:
+                break
+            deadline = deadline or time.monotonic() + STREAM_BATCH_SECONDS
+            change = self._change(event)
+            if change is not None:
+                changes.append(change)
+            if time.monotonic() >= deadline:
+                break
+        return changes
+
+    def _stream(self):
+        with self.collection.watch(
+            self._pipeline(), full_document="updateLookup", resume_after=self._resume_token, max_await_time_ms=1000
+        ) as stream:
+            while not self._stop.is_set():
+                changes = self.drain(stream)
+                if changes:
+                    self.dispatch(changes)
+                else:
+                    self._record(0, 0.0)  # caught up
+                # Only past events that consumers have seen
+                self._resume_token = stream.resume_token
+
+    # Watermark polling
+
+    def poll_once(self):
+        """Fetch and dispatch everything changed since the watermark (less the overlap); returns the number of changes"""
+        since = self.watermark - self.overlap
+        cursor = self.collection.find(
+            {"$or": [{"updated_at": {"$gte": since}}, {"created_at": {"$gte": since}}]}, self.projection
+        )
+        changes = []
+        for doc in cursor:
+            at = max(t for t in (doc.get("updated_at"), doc.get("created_at")) if t is not None)
+            if self._delivered.get(doc["_id"]) == at:
+                continue  # already delivered on an earlier poll
+            changes.append({"op": "upsert", "_id": doc["_id"], "doc": doc, "at": at})
+        if changes:
+            self.watermark = max(self.watermark, max(c["at"] for c in changes))
+            self._delivered.update((c["_id"], c["at"]) for c in changes)
+            horizon = self.watermark - self.overlap
+            self._delivered = {i: at for i, at in self._delivered.items() if at >= horizon}
+            self.dispatch(changes)
+        else:
+            self._record(0, 0.0)
+        return len(changes)
+
+    def _poll(self):
+        for field in TIMESTAMP_FIELDS:
+            self.collection.create_index(field)
+        while not self._stop.is_set():
+            self.poll_once()
+            self._stop.wait(self.poll_seconds)
+
+    def _streams_unsupported(self, error):
+        from pymongo.errors import OperationFailure
+
+        return isinstance(error, OperationFailure) and (
+            error.code in _STREAMS_UNSUPPORTED or "replica set" in str(error).lower()
+        )
+
+    def run(self):
+        backoff = 1
+        while not self._stop.is_set():
+            try:
+                if self.mode in ("auto", "stream"):
+                    try:
+                        self.mode = "stream"
+                        self._stream()
+                        continue
+                    except Exception as e:
+                        if not self._streams_unsupported(e):
+                            raise
+                        log.info("change streams unavailable, polling updated_at", extra={"feed": self.name})
+                        self.mode = "poll"
+                self._poll()
+                backoff = 1
+            except Exception as e:
+                log.warning(
+                    "change feed error", extra={"feed": self.name, "mode": self.mode, "error": str(e), "retry_s": backoff}
+                )
+                self._stop.wait(backoff)
+                backoff = min(backoff * 2, 60)
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self.run, name=f"change-feed-{self.name}", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+
+if __name__ == "__main__":
+    import db
+
+    feed = ChangeFeed(db.get_collection("students"), "students")
+
+    def show(changes):
+        for c in changes:
+            print(f"{c['op']:>6} {c['_id']} at {c['at']} ({feed.mode})", flush=True)
+
+    feed.register(show)
+    feed.start()
+    while True:
+        time.sleep(5)
+        print(f"lag {metrics.get('studybuddy_change_feed_lag_seconds', feed=feed.name, mode=feed.mode)}s", flush=True)
@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+"""
+Content-based course similarity, so related courses count toward matches.
+
+Two students in different sections of one subject, or in "Linear Algebra"
+and "Linear Algebra II", share no course code but clearly belong together.
+At catalog ingest every course becomes a TF-IDF vector over
+
+    - lowercased English name words
+    - Chinese name character bigrams
+    - its department ("dept:CS") and subject ("subj:CS5351", the code
+      without semester and section)
+
+and each course keeps its NEIGHBOURS most similar courses scoring at
+least MIN_SIMILARITY. The table is symmetrized and published as one .npz
+file (CSR over the catalog's codes) that workers reload when it changes.
+
+Matching then uses a soft cosine for the course block: with N the
+neighbour table restricted to the courses in a request and
+S = I + COURSE_SIMILARITY_WEIGHT * N, the course overlap of a and b is
+a S b instead of a . b (see matching.soft_course_similarities). Without a
+published table, or with the weight at 0, scores are exactly the plain
+weighted cosine.
+
+Usage (build from the courses already in MongoDB):
+    python course_similarity.py build
+"""
+
+import os
+import re
+import sys
+import threading
+import time
+
+import logs
+
+TABLE_PATH = os.getenv(
+    "COURSE_SIMILARITY_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "course_similarity.npz"),
+)
+CHECK_SECONDS = float(os.getenv("COURSE_SIMILARITY_CHECK_SECONDS", 5))
+NEIGHBOURS = int(os.getenv("COURSE_NEIGHBOURS", 10))
+MIN_SIMILARITY = float(os.getenv("COURSE_MIN_SIMILARITY", 0.3))
+# How much a related course counts relative to the same course (0 disables)
+SIMILARITY_WEIGHT = float(os.getenv("COURSE_SIMILARITY_WEIGHT", 0.5))
+
+# Rows of X @ X.T computed at once while building the table
+BUILD_CHUNK = 1024
+
+# "1132OAES 510000" -> semester, department, course number, section
+CODE_PATTERN = re.compile(r"^(\d{4,5})([A-Z]+)\s*(\d{4})(\d{2})$")
+WORD_PATTERN = re.compile(r"[a-z][a-z0-9+#]*")
+
+log = logs.get_logger("course_similarity")
+CJK_PATTERN = re.compile(r"[一-鿿]+")
+STOP_WORDS = frozenset({"and", "of", "the", "in", "to", "for", "on", "with", "an", "a"})
+
+
+def course_tokens(code, name_en, name_zh):
+    """Analyzer tokens for one course"""
+    tokens = [w for w in WORD_PATTERN.findall(name_en.lower()) if w not in STOP_WORDS]
+    for run in CJK_PATTERN.findall(name_zh):
+        tokens += [run[i : i + 2] for i in range(len(run) - 1)] if len(run) > 1 else [run]
+    parsed = CODE_PATTERN.match(code)
+    if parsed:
+        _, dept, number, _ = parsed.groups()
+        tokens += [f"dept:{dept}", f"subj:{dept}{number}"]
+    return tokens
+
+
+def build(courses, neighbours=NEIGHBOURS, min_similarity=MIN_SIMILARITY):
+    """(codes, symmetric CSR neighbour table) for raw feed or ingested course docs"""
+    import numpy as np
+    from scipy.sparse import coo_matrix
+    from sklearn.feature_extraction.text import TfidfVectorizer
+
+    from catalog_snapshot import course_fields
+
+    rows = {}
+    for course in courses:
+        code, name_en, name_zh = course_fields(course)
+        if code and code not in rows:
+            rows[code] = course_tokens(code, name_en, name_zh)
+    codes = sorted(rows)
+    n = len(codes)
+    if n < 2:
+        return codes, coo_matrix((n, n), dtype=np.float32).tocsr()
+
+    vectors = TfidfVectorizer(analyzer=lambda tokens: tokens, sublinear_tf=True).fit_transform(
+        [rows[c] for c in codes]
+    )
+    keep_rows, keep_cols, keep_data = [], [], []
+    k = min(neighbours, n - 1)
+    for start in range(0, n, BUILD_CHUNK):
+        stop = min(start + BUILD_CHUNK, n)
+        sims = (vectors[start:stop] @ vectors.T).toarray()
+        local = np.arange(stop - start)
+        sims[local, start + local] = 0.0
+        top = np.argpartition(-sims, k - 1, axis=1)[:, :k]
+        picked = np.take_along_axis(sims, top, axis=1)
+        keep = picked >= min_similarity
+        keep_rows.append(np.repeat(np.arange(start, stop), k)[keep.ravel()])
+        keep_cols.append(top[keep])
+        keep_data.append(picked[keep])
+    table = coo_matrix(
+        (np.concatenate(keep_data), (np.concatenate(keep_rows), np.concatenate(keep_cols))), shape=(n, n)
+    ).tocsr()
+    # A pair kept from either side counts both ways, so the kernel stays symmetric
+    return codes, table.maximum(table.T).astype(np.float32).tocsr()
+
+
+def publish(courses, path=None):
+    """Build the neighbour table and atomically replace the published file; returns its path"""
+    import numpy as np
+
+    path = path or TABLE_PATH
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    codes, table = build(courses)
+    tmp_path = f"{path}.tmp.npz"
+    np.savez(tmp_path, codes=np.array(codes), indptr=table.indptr, indices=table.indices, data=table.data)
+    os.replace(tmp_path, path)
+    return path
+
+
+class NeighbourTable:
+    def __init__(self, path):
+        import numpy as np
+        from scipy.sparse import csr_matrix
+
+        with np.load(path, allow_pickle=False) as f:
+            codes = f["codes"].tolist()
+            self.matrix = csr_matrix((f["data"], f["indices"], f["indptr"]), shape=(len(codes), len(codes)))
+        self.path = path
+        self.codes = codes
+        self.index = {code: i for i, code in enumerate(codes)}
+
+    @property
+    def count(self):
+        return len(self.codes)
+
+    def kernel(self, codes, weight=SIMILARITY_WEIGHT):
+        """(len(codes), len(codes)) CSR matrix I + weight * neighbour similarities among codes"""
+        import numpy as np
+        from scipy.sparse import coo_matrix, identity
+
+        size = len(codes)
+        positions, rows = [], []
+        for position, code in enumerate(codes):
+            row = self.index.get(code)
+            if row is not None:
+                positions.append(position)
+                rows.append(row)
+        kernel = identity(size, dtype=np.float32, format="csr")
+        if len(rows) < 2 or weight <= 0:
+            return kernel
+        positions = np.asarray(positions)
+        sub = self.matrix[rows][:, rows].tocoo()
+        related = coo_matrix(
+            (sub.data * weight, (positions[sub.row], positions[sub.col])), shape=(size, size)
+        ).tocsr()
+        return kernel + related
+
+    def reach(self, codes, weight=SIMILARITY_WEIGHT):
+        """{related code: weight * summed similarity to codes}, the off-diagonal part of a row of codes @ S"""
+        reach = {}
+        if weight <= 0:
+            return reach
+        for code in set(codes):
+            row = self.index.get(code)
+            if row is None:
+                continue
+            start, stop = self.matrix.indptr[row], self.matrix.indptr[row + 1]
+            for col, similarity in zip(self.matrix.indices[start:stop].tolist(), self.matrix.data[start:stop].tolist()):
+                reach[self.codes[col]] = reach.get(self.codes[col], 0.0) + weight * similarity
+        return reach
+
+
+_current = None
+_table_mtime = None
+_checked_at = 0.0
+_lock = threading.Lock()
+
+
+def get_table():
+    """The published neighbour table for this process, or None"""
+    global _current, _table_mtime, _checked_at
+    now = time.monotonic()
+    if now - _checked_at < CHECK_SECONDS:
+        return _current
+    with _lock:
+        if now - _checked_at < CHECK_SECONDS:
+            return _current
+        _checked_at = now
+        try:
+            mtime = os.stat(TABLE_PATH).st_mtime_ns
+            if mtime != _table_mtime:
+                _current = NeighbourTable(TABLE_PATH)
+                _table_mtime = mtime
+                log.info("opened course similarity table", extra={"courses": _current.count, "links": int(_current.matrix.nnz)})
+        except FileNotFoundError:
+            _current = None
+            _table_mtime = None
+        except Exception as e:
+            log.warning("could not open course similarity table", extra={"error": str(e)})
+    return _current
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] != ["build"]:
+        print(__doc__)
+        sys.exit(1)
+    import db
+
+    projection = {"_id": 0, "科號": 1, "課程英文名稱": 1, "課程中文名稱": 1, "code": 1, "name_en": 1, "name_zh": 1}
+    path = publish(db.get_collection("courses").find({}, projection))
+    table = NeighbourTable(path)
+    print(f"✅ Published similarity for {table.count} courses ({table.matrix.nnz} links) to {path}")
@@ -1,5 +1,18 @@
-import requests
+"""
+Mock students for local testing.
+
+    python create_mock_data.py                        # add the sample students via the API
+    python create_mock_data.py generate 10000 -o students.jsonl [--csv]
+    python create_mock_data.py import students.jsonl [--dry-run] [--batch-size 1000]
+
+`import` writes straight to MongoDB (MONGO_URI) through student_import,
+validating and inserting a batch at a time.
+"""
+import argparse
+import csv
 import json
+import sys
+import time
 from datetime import datetime
 import random
 
@@ -57,6 +70,8 @@ mock_students = [
 
 def add_mock_students():
     """Add mock students to the database via API"""
+    import requests
+
     base_url = "http://127.0.0.1:5001"
     
     for student in mock_students:
@@ -72,6 +87,8 @@ def add_mock_students():
 
 def test_matching():
     """Test the matching functionality after adding students"""
+    import requests
+
     base_url = "http://127.0.0.1:5001"
     
     try:
@@ -92,9 +109,99 @@ def test_matching():
     except Exception as e:
         print(f"Error testing matches: {e}")
 
+def generate_students(count, seed=0):
+    """Random students that pass /add_student validation"""
+    from app import COLLEGE_DEPARTMENTS, STUDY_SPOTS, STUDY_TIMES
+
+    rnd = random.Random(seed)
+    course_ids = sorted({c for s in mock_students for c in s["course_ids"]})
+    colleges = list(COLLEGE_DEPARTMENTS)
+    for i in range(count):
+        college = rnd.choice(colleges)
+        yield {
+            "name": f"Mock Student {i}",
+            "email": f"mock{i}@m{rnd.randint(109, 114)}.nthu.edu.tw",
+            "college": college,
+            "department": rnd.choice(COLLEGE_DEPARTMENTS[college]),
+            "course_ids": rnd.sample(course_ids, rnd.randint(1, len(course_ids))),
+            "study_spots": rnd.sample(STUDY_SPOTS, rnd.randint(1, 3)),
+            "study_times": rnd.sample(STUDY_TIMES, rnd.randint(1, 3)),
+        }
+
+
+def write_students(students, out, as_csv=False):
+    import student_import
+
+    if not as_csv:
+        for student in students:
+            out.write(json.dumps(student, ensure_ascii=False) + "\n")
+        return
+    writer = csv.DictWriter(out, fieldnames=student_import.REQUIRED_FIELDS)
+    writer.writeheader()
+    for student in students:
+        row = dict(student)
+        for field in student_import.LIST_FIELDS:
+            row[field] = student_import.LIST_SEPARATOR.join(row[field])
+        writer.writerow(row)
+
+
+def import_file(path, fmt=None, dry_run=False, batch_size=None):
+    """Bulk import a JSON Lines or CSV file, printing failed rows and a summary"""
+    import student_import
+    from app import COLLEGE_DEPARTMENTS
+
+    fmt = fmt or student_import.detect_format(path)
+    started = time.perf_counter()
+    counts = {"inserted": 0, "valid": 0, "error": 0}
+    with open(path, encoding="utf-8-sig", newline="") as f:
+        results = student_import.import_students(
+            student_import.read_rows(f, fmt),
+            COLLEGE_DEPARTMENTS,
+            batch_size=batch_size or student_import.BATCH_SIZE,
+            dry_run=dry_run,
+        )
+        for result in results:
+            counts[result["status"]] += 1
+            if result["status"] == "error":
+                print(f"✗ Row {result['row']}: {result['error']}")
+    elapsed = time.perf_counter() - started
+    print(f"✓ {counts['inserted']} inserted, {counts['valid']} valid (dry run), {counts['error']} rejected in {elapsed:.2f}s")
+    return counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Mock students and bulk import")
+    commands = parser.add_subparsers(dest="command")
+    generate = commands.add_parser("generate", help="write random valid students as JSON Lines or CSV")
+    generate.add_argument("count", type=int)
+    generate.add_argument("-o", "--output", help="file to write (default stdout)")
+    generate.add_argument("--csv", action="store_true")
+    generate.add_argument("--seed", type=int, default=0)
+    bulk = commands.add_parser("import", help="bulk import a JSON Lines or CSV file")
+    bulk.add_argument("path")
+    bulk.add_argument("--format", choices=["jsonl", "csv"])
+    bulk.add_argument("--dry-run", action="store_true")
+    bulk.add_argument("--batch-size", type=int)
+    args = parser.parse_args(argv)
+
+    if args.command == "generate":
+        students = generate_students(args.count, args.seed)
+        if args.output:
+            with open(args.output, "w", encoding="utf-8", newline="") as out:
+                write_students(students, out, args.csv)
+        else:
+            write_students(students, sys.stdout, args.csv)
+    elif args.command == "import":
+        counts = import_file(args.path, args.format, args.dry_run, args.batch_size)
+        return 1 if counts["error"] else 0
+    else:
+        print("Adding mock students with real NTHU course IDs...")
+        add_mock_students()
+        print("\n" + "="*50)
+        test_matching()
+        print("Done!")
+    return 0
+
+
 if __name__ == "__main__":
-    print("Adding mock students with real NTHU course IDs...")
-    add_mock_students()
-    print("\n" + "="*50)
-    test_matching()
-    print("Done!")
+    sys.exit(main())
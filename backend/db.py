@@ -0,0 +1,165 @@
+"""Lazy MongoDB access for the Flask app and helper scripts.
+
+Nothing here touches the network at import time. The client is created on
+first use, so worker boot never waits on DNS/SRV lookups or server
+selection, and a missing database shows up on the readiness probe instead
+of killing the process.
+
+STORAGE_BACKEND=sqlite swaps the cluster for an embedded single-file store
+(sqlite_store.py, path SQLITE_PATH) with the same collection API, for
+offline runs, benchmarks and small deployments.
+"""
+import os
+import threading
+
+from dotenv import load_dotenv
+
+import logs
+import tracing
+
+load_dotenv()
+
+DB_NAME = "study_partner"
+
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "mongo").strip().lower()
+SQLITE_PATH = os.getenv(
+    "SQLITE_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "studybuddy.sqlite3")
+)
+
+_client = None
+_client_pid = None
+_client_lock = threading.Lock()
+
+log = logs.get_logger("db")
+
+
+def get_mongo_uri():
+    """Return MONGO_URI with the TLS parameters our hosts need."""
+    uri = os.getenv("MONGO_URI")
+    # Ensure URI has tlsAllowInvalidCertificates parameter for Render compatibility
+    if uri and "tlsAllowInvalidCertificates" not in uri:
+        separator = "&" if "?" in uri else "?"
+        uri = f"{uri}{separator}tls=true&tlsAllowInvalidCertificates=true"
+    return uri
+
+
+def pool_options():
+    """Connection pool sizing for this process.
+
+    Each worker process owns one client, so MONGO_MAX_POOL_SIZE should be
+    about the number of requests a worker serves at once (threads for
+    gthread, a fraction of worker_connections for gevent). gunicorn.conf.py
+    sets a default from the worker model; the env var always wins.
+    """
+    return {
+        "maxPoolSize": int(os.getenv("MONGO_MAX_POOL_SIZE", 10)),
+        "minPoolSize": int(os.getenv("MONGO_MIN_POOL_SIZE", 0)),
+        "maxIdleTimeMS": int(os.getenv("MONGO_MAX_IDLE_TIME_MS", 300000)),
+        "waitQueueTimeoutMS": int(os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS", 10000)),
+    }
+
+
+def client_options():
+    """Timeouts, pool settings and command tracing shared by the sync and async clients"""
+    return {
+        "serverSelectionTimeoutMS": int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", 20000)),
+        "connectTimeoutMS": int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", 20000)),
+        "socketTimeoutMS": int(os.getenv("MONGO_SOCKET_TIMEOUT_MS", 20000)),
+        "event_listeners": [tracing.MONGO_LISTENER] if tracing.MONGO_LISTENER else [],
+        **pool_options(),
+    }
+
+
+def get_client():
+    """Return this process's MongoClient, creating it on first call.
+
+    The client is keyed by pid: a client inherited across fork() (gunicorn
+    --preload, multiprocessing) is never reused, because its sockets and
+    monitor threads belong to the parent.
+    """
+    global _client, _client_pid
+    pid = os.getpid()
+    if _client is None or _client_pid != pid:
+        with _client_lock:
+            if _client is None or _client_pid != pid:
+                if STORAGE_BACKEND == "sqlite":
+                    import sqlite_store
+
+                    log.info("using embedded sqlite store", extra={"path": SQLITE_PATH})
+                    _client = sqlite_store.SQLiteClient(SQLITE_PATH)
+                else:
+                    from pymongo import MongoClient
+
+                    uri = get_mongo_uri()
+                    # The URI carries credentials; it is never logged
+                    log.info("connecting to mongodb")
+                    _client = MongoClient(uri, **client_options())
+                _client_pid = pid
+    return _client
+
+
+def reset_after_fork():
+    """Forget a client inherited from the parent process.
+
+    Called from gunicorn's post_fork hook and os.register_at_fork. The
+    inherited client is dropped, not closed: closing it would tear down
+    sockets the parent is still using.
+    """
+    global _client, _client_pid, _client_lock
+    _client = None
+    _client_pid = None
+    # The parent may have held the lock at fork time
+    _client_lock = threading.Lock()
+
+
+def close():
+    """Close this process's client (gunicorn worker_exit)"""
+    global _client, _client_pid
+    with _client_lock:
+        if _client is not None and _client_pid == os.getpid():
+            _client.close()
+        _client = None
+        _client_pid = None
+
+
+def get_db():
+    return get_client()[DB_NAME]
+
+
+def get_collection(name):
+    return get_db()[name]
+
+
+def ping(timeout_ms=2000):
+    """Round-trip to the server; returns (ok, error_message)"""
+    import pymongo
+
+    try:
+        # pymongo.timeout also bounds server selection, so an unreachable
+        # cluster fails the probe quickly instead of after 20s
+        with pymongo.timeout(timeout_ms / 1000):
+            get_client().admin.command("ping")
+        return True, None
+    except Exception as e:
+        return False, str(e)
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=reset_after_fork)
+
+
+class LazyCollection:
+    """Stand-in for a pymongo Collection that resolves it on first attribute access.
+
+    Lets modules keep their `students_collection.find(...)` style globals
+    without opening a connection when they are imported.
+    """
+
+    def __init__(self, name):
+        self._name = name
+
+    def __getattr__(self, attr):
+        return getattr(get_collection(self._name), attr)
+
+    def __repr__(self):
+        return f"LazyCollection({self._name!r})"
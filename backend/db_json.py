@@ -29,6 +29,9 @@ def fetch_and_store_courses():
             courses_collection.insert_one(course_data)
             
         print(f"Successfully stored {courses_collection.count_documents({})} courses")
+
+        import catalog_snapshot
+        print(f"Published catalog snapshot: {catalog_snapshot.publish(course_data if isinstance(course_data, list) else [course_data])}")
         
         # Display sample course structure
         sample_course = courses_collection.find_one()
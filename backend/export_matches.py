@@ -0,0 +1,293 @@
+#!/usr/bin/env python3
+"""
+Export every student's top matches for analytics.
+
+Scores all current-semester students against each other with the weighted
+cosine of calculate_weighted_similarity (DEFAULT_WEIGHTS) and writes each
+student's best --top partners, with their per-block shared-feature
+counts, as flat rows:
+
+    student_id, department, college, rank, partner_id, partner_department,
+    partner_college, score, shared_courses, shared_spots, shared_times
+
+A student with no partner scoring above zero gets one row with rank 0 and
+empty partner fields, so "who has no good match" is a simple filter.
+
+The students are encoded once into the shared feature_matrix file format.
+Worker processes mmap it and each scores a chunk of --chunk-rows students
+against everyone. Small-vocabulary blocks (spots, times) go through one
+dense product and the course block through a sparse one. Only the current
+chunks' top lists are held in memory, and rows stream out as chunks
+finish, so memory stays flat as the population grows.
+
+Usage:
+    python export_matches.py matches.ndjson            # .ndjson or .ndjson.gz
+    pip install -r requirements-ml.txt                 # pyarrow, for Parquet
+    python export_matches.py matches.parquet --top 10 --workers 8
+"""
+
+import argparse
+import gzip
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import feature_matrix
+import repository
+from matching import DEFAULT_WEIGHTS, TOP_N
+
+DEFAULT_CHUNK_ROWS = 256
+# Blocks with at most this many columns are multiplied as dense arrays
+DENSE_VOCAB = 512
+
+COLUMNS = (
+    "student_id",
+    "department",
+    "college",
+    "rank",
+    "partner_id",
+    "partner_department",
+    "partner_college",
+    "score",
+    "shared_courses",
+    "shared_spots",
+    "shared_times",
+)
+
+
+# Scoring (runs in worker processes)
+
+_state = {}
+
+
+def _init(path, weights, top):
+    import numpy as np
+
+    matrix = feature_matrix.FeatureMatrix(path)
+    weights = np.asarray(weights, dtype=np.float32)
+    dense, sparse, blocks, base = [], [], [], 0
+    for block, names in enumerate(matrix.vocab):
+        part = matrix.matrix[:, base : base + len(names)]
+        blocks.append(part.tocsr())
+        if len(names) <= DENSE_VOCAB:
+            # Scaling columns by w makes a plain dot product carry w^2
+            dense.append(part.toarray() * weights[block])
+        else:
+            sparse.append((part.tocsr(), part.T.tocsr(), float(weights[block] ** 2)))
+        base += len(names)
+    norms = np.sqrt(matrix.counts.astype(np.float32) @ np.square(weights))
+    # Dividing by inf leaves students without features at score 0
+    norms[norms == 0] = np.inf
+    _state.update(
+        matrix=matrix,
+        dense=np.hstack(dense) if dense else None,
+        sparse=sparse,
+        blocks=blocks,
+        norms=norms,
+        top=top,
+    )
+
+
+def top_chunk(bounds):
+    """(start, partner rows, scores, shared counts) for students start..stop; -1 marks no partner"""
+    import numpy as np
+
+    start, stop = bounds
+    count = _state["matrix"].count
+    dense, norms, top = _state["dense"], _state["norms"], _state["top"]
+
+    scores = dense[start:stop] @ dense.T if dense is not None else np.zeros((stop - start, count), np.float32)
+    for part, part_t, weight in _state["sparse"]:
+        shared = (part[start:stop] @ part_t).tocoo()
+        scores[shared.row, shared.col] += weight * shared.data
+    scores /= norms[start:stop, None]
+    scores /= norms[None, :]
+    local = np.arange(stop - start)
+    scores[local, start + local] = 0.0  # never your own match
+
+    k = min(top, count - 1)
+    if k <= 0:
+        empty = np.full((stop - start, 0), -1)
+        return start, empty, empty.astype(np.float32), np.zeros((stop - start, 0, 3), np.int32)
+    partners = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    picked = np.take_along_axis(scores, partners, axis=1)
+    order = np.argsort(-picked, axis=1, kind="stable")
+    partners = np.take_along_axis(partners, order, axis=1)
+    picked = np.take_along_axis(picked, order, axis=1)
+    partners[picked <= 0] = -1
+
+    # Shared-feature counts only for the chosen pairs
+    rows = np.repeat(np.arange(start, stop), k)
+    cols = partners.ravel()
+    valid = cols >= 0
+    shared = np.zeros((len(rows), len(_state["blocks"])), np.int32)
+    for block, part in enumerate(_state["blocks"]):
+        if valid.any():
+            pairs = part[rows[valid]].multiply(part[cols[valid]])
+            shared[valid, block] = np.asarray(pairs.sum(axis=1)).ravel()
+    return start, partners, picked, shared.reshape(stop - start, k, -1)
+
+
+def score_chunks(path, count, weights=DEFAULT_WEIGHTS, top=TOP_N, chunk_rows=DEFAULT_CHUNK_ROWS, workers=1):
+    """Yield top_chunk results in row order, scoring in `workers` processes"""
+    ranges = [(start, min(start + chunk_rows, count)) for start in range(0, count, chunk_rows)]
+    if workers <= 1:
+        _init(path, weights, top)
+        yield from map(top_chunk, ranges)
+        return
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init, initargs=(path, weights, top)) as pool:
+        yield from pool.map(top_chunk, ranges)
+
+
+# Output
+
+
+def export_rows(students, start, partners, scores, shared):
+    """Flat export rows for one scored chunk"""
+    for offset in range(len(partners)):
+        student = students[start + offset]
+        base = {
+            "student_id": str(student["_id"]),
+            "department": student.get("department", ""),
+            "college": student.get("college", ""),
+        }
+        ranked = [(rank, int(p)) for rank, p in enumerate(partners[offset], start=1) if p >= 0]
+        if not ranked:
+            yield {
+                **base,
+                "rank": 0,
+                "partner_id": None,
+                "partner_department": None,
+                "partner_college": None,
+                "score": 0.0,
+                "shared_courses": 0,
+                "shared_spots": 0,
+                "shared_times": 0,
+            }
+            continue
+        for rank, p in ranked:
+            partner = students[p]
+            courses, spots, times = (int(n) for n in shared[offset, rank - 1])
+            yield {
+                **base,
+                "rank": rank,
+                "partner_id": str(partner["_id"]),
+                "partner_department": partner.get("department", ""),
+                "partner_college": partner.get("college", ""),
+                "score": round(float(scores[offset, rank - 1]), 6),
+                "shared_courses": courses,
+                "shared_spots": spots,
+                "shared_times": times,
+            }
+
+
+class NDJSONWriter:
+    def __init__(self, path):
+        opener = gzip.open if path.endswith(".gz") else open
+        self._file = opener(path, "wt", encoding="utf-8")
+
+    def write(self, rows):
+        self._file.writelines(json.dumps(row, ensure_ascii=False) + "\n" for row in rows)
+
+    def close(self):
+        self._file.close()
+
+
+class ParquetWriter:
+    """One row group per scored chunk"""
+
+    def __init__(self, path):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        self._pa = pa
+        self.schema = pa.schema(
+            [
+                ("student_id", pa.string()),
+                ("department", pa.string()),
+                ("college", pa.string()),
+                ("rank", pa.int16()),
+                ("partner_id", pa.string()),
+                ("partner_department", pa.string()),
+                ("partner_college", pa.string()),
+                ("score", pa.float32()),
+                ("shared_courses", pa.int16()),
+                ("shared_spots", pa.int16()),
+                ("shared_times", pa.int16()),
+            ]
+        )
+        self._writer = pq.ParquetWriter(path, self.schema, compression="zstd")
+
+    def write(self, rows):
+        rows = list(rows)
+        if rows:
+            columns = {name: [row[name] for row in rows] for name in COLUMNS}
+            self._writer.write_table(self._pa.Table.from_pydict(columns, schema=self.schema))
+
+    def close(self):
+        self._writer.close()
+
+
+def open_writer(path, fmt=None):
+    fmt = fmt or ("parquet" if path.endswith(".parquet") else "ndjson")
+    if fmt == "parquet":
+        try:
+            return ParquetWriter(path)
+        except ImportError:
+            raise SystemExit("❌ Parquet output needs pyarrow: pip install -r requirements-ml.txt")
+    return NDJSONWriter(path)
+
+
+def export(students, writer, top=TOP_N, chunk_rows=DEFAULT_CHUNK_ROWS, workers=1, progress=None):
+    """Score students and write their top matches; returns rows written"""
+    students = [s for s in students if "_id" in s]
+    if not students:
+        return 0
+    directory = tempfile.mkdtemp(prefix="studybuddy-export-")
+    written = 0
+    try:
+        path = feature_matrix.publish(students, directory=directory)
+        for start, partners, scores, shared in score_chunks(
+            path, len(students), DEFAULT_WEIGHTS, top, chunk_rows, workers
+        ):
+            rows = list(export_rows(students, start, partners, scores, shared))
+            writer.write(rows)
+            written += len(rows)
+            if progress:
+                progress(start + len(partners), len(students))
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("output", help="output file (.ndjson, .ndjson.gz or .parquet)")
+    parser.add_argument("--format", choices=("ndjson", "parquet"), help="default: from the file extension")
+    parser.add_argument("--top", type=int, default=TOP_N, help="partners per student")
+    parser.add_argument("--chunk-rows", type=int, default=DEFAULT_CHUNK_ROWS, help="students scored per task")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    began = time.perf_counter()
+    students = list(repository.all_match_students())
+    print(f"📊 Scoring {len(students)} students ({args.workers} workers, top {args.top})", flush=True)
+
+    def progress(done, total):
+        print(f"\r⏳ {done}/{total} students", end="", file=sys.stderr, flush=True)
+
+    writer = open_writer(args.output, args.format)
+    try:
+        written = export(students, writer, args.top, args.chunk_rows, args.workers, progress)
+    finally:
+        writer.close()
+    print(f"\n✅ Wrote {written} rows to {args.output} in {time.perf_counter() - began:.1f}s", flush=True)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,499 @@
+#!/usr/bin/env python3
+"""
+Student x feature matrix shared by every worker on a host.
+
+One builder encodes all students into a sparse binary CSR matrix (columns:
+courses, then spots, then times) and publishes it as a single file.
+Workers mmap that file and read the arrays as zero-copy NumPy views, so
+the matrix costs memory once per host, not once per worker. Every worker
+sees the same generation. The default directory is on /dev/shm (tmpfs)
+when available, so the pages never touch disk.
+
+The matrix holds 0/1 values, not weighted ones. Per-block dot products
+(courses, spots, times) are computed with one sparse product, and the
+weights from matching.py are applied afterwards. This gives exactly the
+weighted cosine of calculate_weighted_similarity for every student at
+once, and callers can choose other weights without a rebuild.
+
+Publishing and reading follow catalog_snapshot.py: features-<generation>.bin
+plus an atomically replaced `current` pointer. Rebuilds are coordinated
+with an flock, so only one worker builds at a time.
+
+Student writes reach the matrix as deltas. The change-feed consumer
+copies the current generation, replaces, appends or drops only the
+changed students' rows, and publishes the result. A full scan runs only
+when the last one is older than FEATURE_MATRIX_MAX_AGE_SECONDS, as a
+fallback for anything a delta missed. Run a full build by hand with:
+
+    python feature_matrix.py build
+"""
+
+import fcntl
+import json
+import mmap
+import os
+import struct
+import sys
+import threading
+import time
+
+import logs
+
+_DEFAULT_DIR = "/dev/shm/studybuddy-features" if os.path.isdir("/dev/shm") else os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "data", "features"
+)
+MATRIX_DIR = os.getenv("FEATURE_MATRIX_DIR", _DEFAULT_DIR)
+# Age of the last full scan before the refresher rebuilds from scratch
+MAX_AGE_SECONDS = float(os.getenv("FEATURE_MATRIX_MAX_AGE_SECONDS", 600))
+CHECK_SECONDS = float(os.getenv("FEATURE_MATRIX_CHECK_SECONDS", 2))
+KEEP_GENERATIONS = 2
+
+MAGIC = b"SBFEAT\x00\x01"
+PREFIX = struct.Struct("<8sI")
+POINTER_NAME = "current"
+# Generation number of the last full build (deltas do not move it)
+FULL_POINTER_NAME = "full"
+LOCK_NAME = "build.lock"
+
+BLOCKS = ("course_ids", "study_spots", "study_times")
+
+log = logs.get_logger("feature_matrix")
+
+
+def _column_map(vocab):
+    column = {}
+    for block, names in enumerate(vocab):
+        base = sum(len(v) for v in vocab[:block])
+        for offset, name in enumerate(names):
+            column[(block, name)] = base + offset
+    return column
+
+
+def _encode_rows(students, column):
+    """(ids, indptr, indices, counts) for students, with every feature already in column"""
+    import numpy as np
+
+    indptr = np.zeros(len(students) + 1, dtype=np.int32)
+    indices = []
+    counts = np.zeros((len(students), len(BLOCKS)), dtype=np.int32)
+    # Raw 12-byte ObjectIds (uint8, not "S12", which would drop trailing NULs)
+    ids = np.zeros((len(students), 12), dtype=np.uint8)
+    for row, student in enumerate(students):
+        ids[row] = np.frombuffer(student["_id"].binary, dtype=np.uint8)
+        cols = set()
+        for block, field in enumerate(BLOCKS):
+            features = set(student.get(field, []))
+            counts[row, block] = len(features)
+            cols.update(column[(block, f)] for f in features)
+        indices.extend(sorted(cols))
+        indptr[row + 1] = len(indices)
+    return ids, indptr, np.asarray(indices, dtype=np.int32), counts
+
+
+def build_bytes(students, generation):
+    """Encode students into the matrix file format"""
+    students = [s for s in students if "_id" in s]
+    vocab = [sorted({f for s in students for f in s.get(field, [])}) for field in BLOCKS]
+    ids, indptr, indices, counts = _encode_rows(students, _column_map(vocab))
+    return _pack(ids, indptr, indices, counts, vocab, generation)
+
+
+def delta_bytes(matrix, upserts, removed, generation):
+    """Encode matrix with `upserts` replacing or adding rows and the `removed` ObjectIds dropped.
+
+    New features are appended to their block's vocabulary, and existing
+    columns shift by the growth of the blocks before them. Replaced rows
+    move to the end.
+    """
+    import numpy as np
+
+    vocab = [list(names) for names in matrix.vocab]
+    for block, field in enumerate(BLOCKS):
+        known = set(vocab[block])
+        vocab[block] += sorted({f for s in upserts for f in s.get(field, [])} - known)
+    old_sizes = [len(names) for names in matrix.vocab]
+    old_base = np.cumsum([0] + old_sizes[:-1])
+    new_base = np.cumsum([0] + [len(names) for names in vocab[:-1]])
+    shift = np.repeat(new_base - old_base, old_sizes).astype(np.int32)
+
+    keep = np.ones(matrix.count, dtype=bool)
+    keep[matrix.rows_of([s["_id"] for s in upserts] + list(removed))] = False
+    kept = matrix.matrix[keep]
+    new_ids, new_indptr, new_indices, new_counts = _encode_rows(upserts, _column_map(vocab))
+
+    ids = np.concatenate([matrix.ids[keep], new_ids])
+    indptr = np.concatenate([kept.indptr, new_indptr[1:] + kept.indptr[-1]]).astype(np.int32)
+    indices = np.concatenate([kept.indices + shift[kept.indices], new_indices]).astype(np.int32)
+    counts = np.concatenate([matrix.counts[keep], new_counts])
+    return _pack(ids, indptr, indices, counts, vocab, generation)
+
+
+def _pack(ids, indptr, indices, counts, vocab, generation):
+    import numpy as np
+
+    data = np.ones(len(indices), dtype=np.float32)
+    arrays = {"ids": ids, "indptr": indptr, "indices": indices, "data": data, "counts": counts}
+    layout, position, blobs = {}, 0, []
+    for name, arr in arrays.items():
+        position += -position % 16
+        layout[name] = [position, arr.dtype.str, list(arr.shape)]
+        blobs.append((position, arr.tobytes()))
+        position += arr.nbytes
+
+    header = json.dumps(
+        {"generation": generation, "count": len(ids), "vocab": vocab, "arrays": layout}, ensure_ascii=False
+    ).encode("utf-8")
+    data_start = PREFIX.size + len(header)
+    data_start += -data_start % 16
+    out = bytearray(data_start + position)
+    out[: PREFIX.size] = PREFIX.pack(MAGIC, len(header))
+    out[PREFIX.size : PREFIX.size + len(header)] = header
+    for offset, blob in blobs:
+        out[data_start + offset : data_start + offset + len(blob)] = blob
+    return bytes(out)
+
+
+class FeatureMatrix:
+    """Read-only, zero-copy view over one published matrix file"""
+
+    def __init__(self, path):
+        import numpy as np
+        from scipy.sparse import csr_matrix
+
+        self.path = path
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, header_len = PREFIX.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a feature matrix file")
+        header = json.loads(self._mm[PREFIX.size : PREFIX.size + header_len].decode("utf-8"))
+        data_start = PREFIX.size + header_len
+        data_start += -data_start % 16
+
+        arrays = {}
+        for name, (offset, dtype, shape) in header["arrays"].items():
+            count = int(np.prod(shape)) if shape else 1
+            arrays[name] = np.frombuffer(self._mm, dtype=dtype, count=count, offset=data_start + offset).reshape(shape)
+
+        self.generation = header["generation"]
+        self.count = header["count"]
+        self.vocab = header["vocab"]
+        self.ids = arrays["ids"]
+        self.counts = arrays["counts"]
+        self.feature_count = sum(len(v) for v in self.vocab)
+        self.matrix = csr_matrix(
+            (arrays["data"], arrays["indices"], arrays["indptr"]), shape=(self.count, self.feature_count), copy=False
+        )
+        self._columns = None
+        self._rows = None
+
+    @property
+    def columns(self):
+        if self._columns is None:
+            columns, base = {}, 0
+            for block, names in enumerate(self.vocab):
+                for offset, name in enumerate(names):
+                    columns[(block, name)] = base + offset
+                base += len(names)
+            self._columns = columns
+        return self._columns
+
+    def row_of(self, student_id):
+        """Row index for an ObjectId, or None"""
+        if self._rows is None:
+            self._rows = {row.tobytes(): i for i, row in enumerate(self.ids)}
+        return self._rows.get(student_id.binary)
+
+    def rows_of(self, student_ids):
+        """Row indices of the given ObjectIds that are in the matrix, as an array"""
+        import numpy as np
+
+        rows = (self.row_of(sid) for sid in student_ids)
+        return np.fromiter((r for r in rows if r is not None), dtype=np.int64)
+
+    def encodes(self, student):
+        """True when student's row holds exactly its current features"""
+        row = self.row_of(student["_id"])
+        if row is None:
+            return False
+        expected = set()
+        for block, field in enumerate(BLOCKS):
+            for f in set(student.get(field, [])):
+                col = self.columns.get((block, f))
+                if col is None:
+                    return False
+                expected.add(col)
+        start, stop = self.matrix.indptr[row], self.matrix.indptr[row + 1]
+        return expected == set(self.matrix.indices[start:stop].tolist())
+
+    def block_dots(self, student, rows=None, related=None):
+        """(N, 3) shared-feature counts per block between student and every row (or only `rows`), and student's block sizes.
+
+        related maps further course codes to partial weights (see
+        course_similarity.NeighbourTable.reach), so the course block
+        counts related courses too.
+        """
+        import numpy as np
+        from scipy.sparse import csr_matrix
+
+        cols, blocks, values = [], [], []
+        own_counts = np.zeros(len(BLOCKS), dtype=np.float64)
+        for block, field in enumerate(BLOCKS):
+            features = set(student.get(field, []))
+            own_counts[block] = len(features)
+            for f in features:
+                col = self.columns.get((block, f))
+                if col is not None:
+                    cols.append(col)
+                    blocks.append(block)
+                    values.append(1.0)
+        for code, weight in (related or {}).items():
+            col = self.columns.get((BLOCKS.index("course_ids"), code))
+            if col is not None:
+                cols.append(col)
+                blocks.append(BLOCKS.index("course_ids"))
+                values.append(weight)
+        # Duplicate entries add up: an own course that is also related to another counts 1 + its similarity
+        selector = csr_matrix(
+            (np.asarray(values, dtype=np.float32), (cols, blocks)), shape=(self.feature_count, len(BLOCKS))
+        )
+        matrix = self.matrix if rows is None else self.matrix[rows]
+        return (matrix @ selector).toarray(), own_counts
+
+    def cosine_from_dots(self, dots, own_counts, weights, rows=None):
+        import numpy as np
+
+        counts = self.counts if rows is None else self.counts[rows]
+        squared = np.square(np.asarray(weights, dtype=np.float64))
+        numerator = dots @ squared
+        norms = np.sqrt(counts @ squared) * np.sqrt(own_counts @ squared)
+        return np.divide(numerator, norms, out=np.zeros(len(counts)), where=norms > 0)
+
+    def cosine(self, student, weights, rows=None):
+        """Weighted cosine between student and every row, or only `rows` (same values as calculate_weighted_similarity)"""
+        dots, own_counts = self.block_dots(student, rows)
+        return self.cosine_from_dots(dots, own_counts, weights, rows)
+
+    def object_ids(self, rows):
+        from bson import ObjectId
+
+        return [ObjectId(self.ids[r].tobytes()) for r in rows]
+
+
+def publish(students, directory=None):
+    """Write a new generation from a full scan and repoint readers; returns its path"""
+    directory = directory or MATRIX_DIR
+    os.makedirs(directory, exist_ok=True)
+    # Stamped before the students cursor is read, so a full build includes
+    # every write that happened before its number
+    generation = time.time_ns()
+    path = _install(directory, generation, build_bytes(students, generation))
+    _write_pointer(directory, FULL_POINTER_NAME, str(generation))
+    return path
+
+
+def _write_pointer(directory, name, value):
+    tmp = os.path.join(directory, f"{name}.tmp")
+    with open(tmp, "w") as f:
+        f.write(value)
+    os.replace(tmp, os.path.join(directory, name))
+
+
+def _install(directory, generation, payload):
+    name = f"features-{generation}.bin"
+    path = os.path.join(directory, name)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(payload)
+    os.replace(tmp_path, path)
+    _write_pointer(directory, POINTER_NAME, name)
+
+    generations = sorted(n for n in os.listdir(directory) if n.startswith("features-") and n.endswith(".bin"))
+    for stale in generations[:-KEEP_GENERATIONS]:
+        try:
+            os.remove(os.path.join(directory, stale))
+        except OSError:
+            pass
+    return path
+
+
+def full_generation(directory=None):
+    """Generation number of the last full build, or None"""
+    try:
+        with open(os.path.join(directory or MATRIX_DIR, FULL_POINTER_NAME)) as f:
+            return int(f.read().strip())
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def full_build_age_seconds(directory=None):
+    """Seconds since the last full build started, or None"""
+    generation = full_generation(directory)
+    return None if generation is None else time.time() - generation / 1e9
+
+
+def _open_published(directory):
+    try:
+        with open(os.path.join(directory, POINTER_NAME)) as f:
+            return FeatureMatrix(os.path.join(directory, f.read().strip()))
+    except FileNotFoundError:
+        return None
+
+
+def apply_changes(upserts, removed, directory=None):
+    """Publish a delta generation for changed students; returns True if one was written.
+
+    upserts are student documents as the full build encodes them, removed
+    are ObjectIds to drop. Every worker's change feed delivers the same
+    writes; the first to take the lock publishes them, and the others find
+    the rows already current and skip. Without a published matrix this is
+    a no-op and the refresher's full build picks the changes up.
+    """
+    directory = directory or MATRIX_DIR
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, LOCK_NAME), "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            matrix = _open_published(directory)
+            if matrix is None:
+                return False
+            pending = [s for s in upserts if not matrix.encodes(s)]
+            gone = [i for i in removed if matrix.row_of(i) is not None]
+            if not pending and not gone:
+                return False
+            generation = max(time.time_ns(), matrix.generation + 1)
+            _install(directory, generation, delta_bytes(matrix, pending, gone, generation))
+            return True
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def rebuild_if_older_than(changed_at, load_students):
+    """Full rebuild unless the last full build already includes a write made at changed_at (epoch seconds).
+
+    Every worker may ask for the same rebuild; the first to take the lock
+    rebuilds while the others find the new generation and skip.
+    """
+    generation = full_generation()
+    if generation is not None and generation / 1e9 >= changed_at:
+        return False
+    os.makedirs(MATRIX_DIR, exist_ok=True)
+    with open(os.path.join(MATRIX_DIR, LOCK_NAME), "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            generation = full_generation()
+            if generation is not None and generation / 1e9 >= changed_at:
+                return False
+            publish(load_students())
+            return True
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def change_consumer(prepare):
+    """Change-feed consumer that patches changed students into the shared matrix.
+
+    prepare(doc) returns the student as the full build would encode it,
+    or None when the student no longer belongs in the matrix.
+    """
+
+    def on_changes(changes):
+        latest = {}
+        for change in changes:
+            student = prepare(change["doc"]) if change["op"] == "upsert" else None
+            latest[change["_id"]] = student
+        upserts = [s for s in latest.values() if s is not None]
+        removed = [i for i, s in latest.items() if s is None]
+        apply_changes(upserts, removed)
+
+    return on_changes
+
+
+def rebuild_if_stale(load_students, max_age=None, force=False):
+    """Full rebuild when the last full build is older than max_age; only one process builds at a time.
+
+    Returns True if this call published a new generation.
+    """
+    max_age = MAX_AGE_SECONDS if max_age is None else max_age
+    age = full_build_age_seconds()
+    if not force and age is not None and age < max_age:
+        return False
+    os.makedirs(MATRIX_DIR, exist_ok=True)
+    with open(os.path.join(MATRIX_DIR, LOCK_NAME), "w") as lock:
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return False  # another worker is building
+        try:
+            # Re-check under the lock: someone may have just published
+            age = full_build_age_seconds()
+            if not force and age is not None and age < max_age:
+                return False
+            publish(load_students())
+            return True
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+_current = None
+_pointer_mtime = None
+_checked_at = 0.0
+_lock = threading.Lock()
+
+
+def get_matrix():
+    """The newest published matrix for this process, or None"""
+    global _current, _pointer_mtime, _checked_at
+    now = time.monotonic()
+    if now - _checked_at < CHECK_SECONDS:
+        return _current
+    with _lock:
+        if now - _checked_at < CHECK_SECONDS:
+            return _current
+        _checked_at = now
+        pointer = os.path.join(MATRIX_DIR, POINTER_NAME)
+        try:
+            mtime = os.stat(pointer).st_mtime_ns
+            if mtime != _pointer_mtime:
+                with open(pointer) as f:
+                    name = f.read().strip()
+                if _current is None or os.path.basename(_current.path) != name:
+                    _current = FeatureMatrix(os.path.join(MATRIX_DIR, name))
+                _pointer_mtime = mtime
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            log.warning("could not open feature matrix", extra={"error": str(e)})
+    return _current
+
+
+_refresher = None
+
+
+def start_refresher(load_students):
+    """Background thread (one per worker) that keeps the shared matrix fresh"""
+    global _refresher
+    if _refresher is not None and _refresher.is_alive():
+        return
+
+    def run():
+        while True:
+            try:
+                rebuild_if_stale(load_students)
+            except Exception:
+                log.exception("feature matrix rebuild failed")
+            time.sleep(max(MAX_AGE_SECONDS / 4, 1))
+
+    _refresher = threading.Thread(target=run, name="feature-matrix-refresher", daemon=True)
+    _refresher.start()
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] != ["build"]:
+        print(__doc__)
+        sys.exit(1)
+    import repository
+
+    rebuild_if_stale(repository.all_match_students, force=True)
+    matrix = get_matrix()
+    print(f"✅ Published {matrix.count} students x {matrix.feature_count} features (generation {matrix.generation})")
@@ -0,0 +1,141 @@
+"""
+Cross-worker cache coherence through generation counters.
+
+Each cache namespace ("profiles", "catalog", "semester", ...) has a
+counter in the `cache_generations` collection. Writers call bump() after
+changing the data behind a namespace. A per-process GenerationCache tags
+every entry with the generation it was loaded at, and drops the entry
+once the counter has moved on. Entries are also reloaded after
+CACHE_MAX_AGE_SECONDS, so a write whose bump() failed (or was never
+called) is served stale for at most that long.
+
+Readers refresh all counters with one find() at most every
+CACHE_GENERATION_CHECK_SECONDS, so another worker's write shows up
+within that interval. The worker that wrote sees its own bump at once.
+When the counters cannot be read, caches are bypassed rather than
+served stale.
+
+    profiles = generations.GenerationCache("profiles", size=4096)
+    doc = profiles.get_or_load(student_id, lambda: load_profile(student_id))
+    ...
+    generations.bump("profiles")
+
+Cached values are shared between requests; callers must not mutate them.
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+import db
+import logs
+import metrics
+
+CHECK_SECONDS = float(os.getenv("CACHE_GENERATION_CHECK_SECONDS", 1))
+MAX_AGE_SECONDS = float(os.getenv("CACHE_MAX_AGE_SECONDS", 300))
+
+generations_collection = db.LazyCollection("cache_generations")
+
+metrics.describe("studybuddy_cache_requests_total", "Generation-checked cache lookups by namespace and result")
+
+log = logs.get_logger("cache")
+
+_known = {}
+_checked_at = float("-inf")
+_healthy = False
+_lock = threading.Lock()
+
+
+def _refresh():
+    """Re-read every counter if the last check is older than CHECK_SECONDS; False when unreadable"""
+    global _checked_at, _healthy
+    if time.monotonic() - _checked_at < CHECK_SECONDS:
+        return _healthy
+    with _lock:
+        now = time.monotonic()
+        if now - _checked_at < CHECK_SECONDS:
+            return _healthy
+        try:
+            for doc in generations_collection.find({}, {"generation": 1}):
+                # Never step back behind a bump this worker already saw
+                _known[doc["_id"]] = max(_known.get(doc["_id"], 0), doc.get("generation", 0))
+            _healthy = True
+        except Exception as e:
+            if _healthy:
+                log.warning("cache generations unavailable, bypassing caches", extra={"error": str(e)})
+            _healthy = False
+        _checked_at = now
+    return _healthy
+
+
+def current(namespace):
+    """Generation of namespace as of the last check, or None when counters are unreadable"""
+    if not _refresh():
+        return None
+    return _known.get(namespace, 0)
+
+
+def bump(*namespaces):
+    """Invalidate every worker's cached entries for the namespaces"""
+    global _healthy, _checked_at
+    from pymongo import ReturnDocument
+
+    for namespace in namespaces:
+        try:
+            doc = generations_collection.find_one_and_update(
+                {"_id": namespace},
+                {"$inc": {"generation": 1}, "$set": {"updated_at": datetime.utcnow()}},
+                projection={"generation": 1},
+                upsert=True,
+                return_document=ReturnDocument.AFTER,
+            )
+            with _lock:
+                _known[namespace] = max(_known.get(namespace, 0), doc["generation"])
+        except Exception as e:
+            # Other workers cannot be told; at least stop trusting this one's caches
+            log.warning("could not bump cache generation", extra={"namespace": namespace, "error": str(e)})
+            with _lock:
+                _healthy = False
+                _checked_at = time.monotonic()
+
+
+class GenerationCache:
+    """Bounded LRU whose entries expire when their namespace's generation moves, or after max_age seconds"""
+
+    def __init__(self, namespace, size=1024, max_age=MAX_AGE_SECONDS):
+        self.namespace = namespace
+        self.size = size
+        self.max_age = max_age
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_load(self, key, load):
+        # Read the generation before loading, so a bump racing the load
+        # leaves the entry tagged with the older generation
+        generation = current(self.namespace)
+        if generation is None:
+            metrics.inc("studybuddy_cache_requests_total", namespace=self.namespace, result="bypass")
+            return load()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == generation and time.monotonic() - entry[1] < self.max_age:
+                self._entries.move_to_end(key)
+                metrics.inc("studybuddy_cache_requests_total", namespace=self.namespace, result="hit")
+                return entry[2]
+        metrics.inc(
+            "studybuddy_cache_requests_total", namespace=self.namespace, result="stale" if entry is not None else "miss"
+        )
+        loaded_at = time.monotonic()
+        value = load()
+        with self._lock:
+            self._entries[key] = (generation, loaded_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
@@ -0,0 +1,227 @@
+"""
+Study-group formation over the weighted matching feature space.
+
+Each student becomes a sparse one-hot row over courses, spots and times,
+scaled by the matching block weights and L2-normalized, so a dot product
+between two rows is exactly their weighted cosine from matching.py.
+
+Grouping a population of n students (at most GROUP_PARTITION_SIZE; larger
+populations are first split, see below):
+
+1. Pick the group count k closest to n / size such that every group can
+   hold between MIN_GROUP_SIZE and MAX_GROUP_SIZE students.
+2. Cluster the rows with k-means (scikit-learn) to get k group centres.
+3. Balanced greedy assignment: every (student, centre) affinity is
+   sorted once, best first, and each student goes to the best centre
+   that still has room. Capacities are floor(n/k) or ceil(n/k), so group
+   sizes differ by at most one.
+
+k-means with k ~ n/4 costs O(n^2), so a population larger than
+GROUP_PARTITION_SIZE is sorted by department and courses, cut into
+near-equal consecutive partitions, and each partition is grouped on its
+own. Cost is then linear in n.
+
+Results are cached per (scope, size). Requests reuse a body without
+reading any students while the "profiles" cache generation is unchanged.
+After a profile write, the scope's students are re-read and fingerprinted,
+and groups are only re-formed when that fingerprint (ids and features)
+changed.
+"""
+import hashlib
+import math
+import os
+import threading
+from collections import OrderedDict
+
+import generations
+from matching import DEFAULT_WEIGHTS
+
+MIN_GROUP_SIZE = 3
+MAX_GROUP_SIZE = 5
+DEFAULT_GROUP_SIZE = int(os.getenv("GROUP_SIZE", 4))
+# Largest population clustered in one k-means run
+PARTITION_SIZE = int(os.getenv("GROUP_PARTITION_SIZE", 500))
+
+# Centres considered per student in the first greedy pass; the rest fall
+# through to a second pass over centres that still have room
+CANDIDATE_CENTRES = 8
+
+CACHE_SIZE = 128
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+# (scope, size, term) -> body, dropped whenever any profile changes
+_bodies = generations.GenerationCache("profiles", size=CACHE_SIZE)
+
+FIELDS = ("course_ids", "study_spots", "study_times")
+
+
+def fingerprint(students):
+    digest = hashlib.sha1()
+    for s in sorted(students, key=lambda s: str(s["_id"])):
+        digest.update(str(s["_id"]).encode())
+        for field in FIELDS:
+            digest.update(b"\x00" + "\x01".join(sorted(s.get(field, []))).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def feature_rows(students, weights=DEFAULT_WEIGHTS):
+    """(n, features) CSR matrix whose row dot products are weighted cosines"""
+    import numpy as np
+    from scipy.sparse import csr_matrix
+    from sklearn.preprocessing import normalize
+
+    columns, rows, cols, data = {}, [], [], []
+    for i, student in enumerate(students):
+        for block, (field, weight) in enumerate(zip(FIELDS, weights)):
+            for value in set(student.get(field, [])):
+                col = columns.setdefault((block, value), len(columns))
+                rows.append(i)
+                cols.append(col)
+                data.append(weight)
+    matrix = csr_matrix((np.array(data, dtype=np.float64), (rows, cols)), shape=(len(students), max(len(columns), 1)))
+    return normalize(matrix)
+
+
+def group_count(n, size):
+    """Group count nearest n/size whose floor/ceil sizes stay within the bounds"""
+    low = math.ceil(n / MAX_GROUP_SIZE)
+    high = max(n // MIN_GROUP_SIZE, low)
+    return min(max(round(n / size), low), high)
+
+
+def balanced_assign(affinity, k):
+    """Group index per row, best affinity first, with group sizes floor(n/k) or ceil(n/k)"""
+    import numpy as np
+
+    n = affinity.shape[0]
+    base, big_left = divmod(n, k)
+    counts = np.zeros(k, dtype=np.int64)
+    assignment = np.full(n, -1, dtype=np.int64)
+
+    def run(rows, centres):
+        nonlocal big_left
+        scores = affinity[rows[:, None], centres]
+        order = np.argsort(-scores, axis=None, kind="stable")
+        for flat in order:
+            r, c = divmod(int(flat), centres.shape[1])
+            student, group = rows[r], centres[r, c]
+            if assignment[student] >= 0:
+                continue
+            if counts[group] < base:
+                pass
+            elif counts[group] == base and big_left > 0:
+                big_left -= 1
+            else:
+                continue
+            assignment[student] = group
+            counts[group] += 1
+
+    m = min(CANDIDATE_CENTRES, k)
+    all_rows = np.arange(n)
+    run(all_rows, np.argpartition(-affinity, m - 1, axis=1)[:, :m] if m < k else np.tile(np.arange(k), (n, 1)))
+    left = np.flatnonzero(assignment < 0)
+    if len(left):
+        open_groups = np.flatnonzero((counts < base) | ((counts == base) & (big_left > 0)))
+        run(left, np.tile(open_groups, (len(left), 1)))
+    return assignment
+
+
+def _shared(members, field):
+    common = set(members[0].get(field, []))
+    for m in members[1:]:
+        common &= set(m.get(field, []))
+    return sorted(common)
+
+
+def partitions(students, limit=None):
+    """Index lists of at most `limit` (PARTITION_SIZE) students, similar students (department, courses) kept together"""
+    import numpy as np
+
+    limit = limit or PARTITION_SIZE
+    order = sorted(
+        range(len(students)),
+        key=lambda i: (students[i].get("department") or "", sorted(students[i].get("course_ids", []))),
+    )
+    count = math.ceil(len(order) / limit)
+    return [part.tolist() for part in np.array_split(np.array(order, dtype=np.int64), count)]
+
+
+def form_groups(students, size=DEFAULT_GROUP_SIZE):
+    """Partition students into balanced groups; returns a list of member index lists and cohesion scores"""
+    import numpy as np
+    from sklearn.cluster import KMeans
+
+    n = len(students)
+    if n > PARTITION_SIZE:
+        groups = []
+        for part in partitions(students):
+            for members, cohesion in form_groups([students[i] for i in part], size):
+                groups.append(([part[i] for i in members], cohesion))
+        groups.sort(key=lambda g: -g[1])
+        return groups
+    if n < MIN_GROUP_SIZE:
+        return [(list(range(n)), 0.0)] if n else []
+    k = group_count(n, size)
+    rows = feature_rows(students)
+    if k == 1:
+        assignment = np.zeros(n, dtype=np.int64)
+    else:
+        kmeans = KMeans(n_clusters=k, n_init=3, random_state=0).fit(rows)
+        centres = kmeans.cluster_centers_
+        affinity = np.asarray(rows @ centres.T)
+        assignment = balanced_assign(affinity, k)
+
+    groups = []
+    for g in range(k):
+        members = np.flatnonzero(assignment == g)
+        if not len(members):
+            continue
+        block = rows[members]
+        sims = (block @ block.T).toarray()
+        pairs = len(members) * (len(members) - 1)
+        cohesion = float((sims.sum() - np.trace(sims)) / pairs) if pairs else 0.0
+        groups.append((members.tolist(), cohesion))
+    groups.sort(key=lambda g: -g[1])
+    return groups
+
+
+def groups_for(scope, load_students, term, size=DEFAULT_GROUP_SIZE):
+    """Groups body for a scope; load_students() is only called after a profile write"""
+    size = min(max(size, MIN_GROUP_SIZE), MAX_GROUP_SIZE)
+    return _bodies.get_or_load((scope, size, term), lambda: build_groups_response(load_students(), scope, size))
+
+
+def build_groups_response(students, scope, size=DEFAULT_GROUP_SIZE):
+    """Groups body for /get_groups, cached while the students are unchanged"""
+    size = min(max(size, MIN_GROUP_SIZE), MAX_GROUP_SIZE)
+    key = (scope, size)
+    stamp = fingerprint(students)
+    with _cache_lock:
+        cached = _cache.get(key)
+        if cached and cached[0] == stamp:
+            _cache.move_to_end(key)
+            body = cached[1]
+        else:
+            body = None
+    if body is None:
+        groups = []
+        for members, cohesion in form_groups(students, size):
+            people = [students[i] for i in members]
+            groups.append(
+                {
+                    "members": [
+                        {"student_id": str(p["_id"]), "name": p.get("name", ""), "department": p.get("department", "")}
+                        for p in people
+                    ],
+                    "shared_courses": _shared(people, "course_ids"),
+                    "shared_spots": _shared(people, "study_spots"),
+                    "shared_times": _shared(people, "study_times"),
+                    "cohesion": round(cohesion * 100, 1),
+                }
+            )
+        body = {"scope": scope, "group_size": size, "total_students": len(students), "groups": groups}
+        with _cache_lock:
+            _cache[key] = (stamp, body)
+            while len(_cache) > CACHE_SIZE:
+                _cache.popitem(last=False)
+    return body
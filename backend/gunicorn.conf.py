@@ -0,0 +1,82 @@
+"""
+gunicorn configuration for the StudyBuddy API.
+
+    gunicorn -c gunicorn.conf.py app:app
+
+Everything is driven by environment variables so Railway/Render/Procfile
+deployments only differ in env, never in the start command.
+
+Worker models (GUNICORN_WORKER_CLASS):
+
+    sync     One request per process. Any slow call (SMTP send, NTHU feed
+             download, Atlas round trip) blocks the whole worker. Only
+             useful for CPU-bound debugging.
+    gthread  Default. GUNICORN_THREADS requests per process on OS threads.
+             pymongo, smtplib and requests release the GIL while waiting,
+             so slow I/O only occupies one thread.
+    gevent   Cooperative greenlets, GUNICORN_WORKER_CONNECTIONS per process.
+             Best for many concurrent, mostly-waiting requests. Requires
+             `gevent`; do not combine with GUNICORN_PRELOAD, because the app
+             would be imported before gevent monkey-patches the stdlib.
+    uvicorn  ASGI worker for the async read path; start `asgi:application`
+             instead of `app:app` (see asgi.py). Other endpoints run on
+             asgiref's thread pool against the sync client.
+
+Other settings:
+
+    PORT                         bind port (default 5001)
+    WEB_CONCURRENCY              worker processes (default 2)
+    GUNICORN_THREADS             threads per gthread worker (default 4)
+    GUNICORN_WORKER_CONNECTIONS  greenlets per gevent worker (default 100)
+    GUNICORN_TIMEOUT             worker timeout in seconds (default 120)
+    GUNICORN_PRELOAD             "1" to import the app once in the master
+
+MongoDB: every worker opens its own MongoClient after fork (db.get_client
+is keyed by pid and post_fork below drops any inherited client), so
+--preload is safe. MONGO_MAX_POOL_SIZE defaults to the number of requests
+one worker can run at once; set it explicitly to override.
+"""
+
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5001')}"
+workers = int(os.getenv("WEB_CONCURRENCY", 2))
+worker_class = os.getenv("GUNICORN_WORKER_CLASS", "gthread")
+threads = int(os.getenv("GUNICORN_THREADS", 4))
+worker_connections = int(os.getenv("GUNICORN_WORKER_CONNECTIONS", 100))
+timeout = int(os.getenv("GUNICORN_TIMEOUT", 120))
+graceful_timeout = 30
+keepalive = 5
+preload_app = os.getenv("GUNICORN_PRELOAD", "0") == "1"
+
+if worker_class == "gevent":
+    # Greenlets waiting on Mongo share the pool; cap it well below
+    # worker_connections so a burst queues instead of opening 100 sockets
+    _concurrent_requests = min(worker_connections, 50)
+    if preload_app:
+        print("⚠️ GUNICORN_PRELOAD is ignored with gevent workers", flush=True)
+        preload_app = False
+elif worker_class == "uvicorn":
+    worker_class = "uvicorn.workers.UvicornWorker"
+    # The sync pool only serves the Flask fallback endpoints here; the async
+    # read path has its own pool (ASYNC_MONGO_MAX_POOL_SIZE)
+    _concurrent_requests = threads
+elif worker_class == "gthread":
+    _concurrent_requests = threads
+else:
+    _concurrent_requests = 1
+
+# Workers inherit the master's environment, so this reaches db.pool_options()
+os.environ.setdefault("MONGO_MAX_POOL_SIZE", str(_concurrent_requests + 2))
+
+
+def post_fork(server, worker):
+    import db
+
+    db.reset_after_fork()
+
+
+def worker_exit(server, worker):
+    import db
+
+    db.close()
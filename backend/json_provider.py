@@ -0,0 +1,73 @@
+"""
+Flask JSON provider backed by orjson.
+
+ObjectId and datetime values are encoded directly, so handlers can return
+Mongo documents as they come back from the driver:
+
+    ObjectId("65f0...")          -> "65f0..."
+    datetime(2025, 1, 1, 9, 30)  -> "2025-01-01T09:30:00Z"   (naive values are UTC)
+
+orjson is optional. Without it the provider falls back to Flask's encoder
+with the same ObjectId and datetime handling, so responses look the same,
+only slower.
+"""
+
+from datetime import date, datetime, timezone
+
+from bson import ObjectId
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+if orjson is not None:
+    OPTIONS = orjson.OPT_NAIVE_UTC | orjson.OPT_UTC_Z | orjson.OPT_SERIALIZE_NUMPY
+
+
+def _default(value):
+    """Types orjson does not know natively"""
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return bytes(value).hex()
+    if hasattr(value, "item"):  # numpy scalars outside arrays
+        return value.item()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def _isoformat(value):
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return value.astimezone(timezone.utc).isoformat().replace("+00:00", "Z")
+    return value.isoformat()
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    sort_keys = False
+
+    @staticmethod
+    def default(value):
+        if isinstance(value, (date, datetime)):
+            return _isoformat(value)
+        return _default(value)
+
+    def dumps(self, obj, **kwargs):
+        if orjson is None:
+            kwargs.setdefault("separators", (",", ":"))
+            return super().dumps(obj, **kwargs)
+        return orjson.dumps(obj, default=_default, option=OPTIONS).decode("utf-8")
+
+    def loads(self, s, **kwargs):
+        if orjson is None:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        if orjson is None:
+            return super().response(obj)
+        payload = orjson.dumps(obj, default=_default, option=OPTIONS | orjson.OPT_APPEND_NEWLINE)
+        return self._app.response_class(payload, mimetype=self.mimetype)
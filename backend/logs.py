@@ -0,0 +1,187 @@
+"""
+Structured, non-blocking logging for request paths.
+
+    log = logs.get_logger("email")
+    log.info("otp sent", extra={"email": email, "duration_ms": 412})
+
+Loggers live under "studybuddy". A record is only copied onto a bounded
+queue on the calling thread. One listener thread per process formats it
+as a JSON line and writes it to stdout, so a slow or blocked stdout never
+stalls a request. When the queue is full, records are dropped and counted
+in studybuddy_log_records_dropped_total.
+
+Each JSON record has ts, level, logger, msg and any `extra` fields. It
+also has trace_id and span_id from tracing.py; the trace id is the
+request id, and is returned in the traceparent response header.
+
+    LOG_LEVEL          minimum level (default INFO)
+    LOG_SAMPLE_RATES   keep this fraction of INFO-and-below records from
+                       noisy loggers, e.g. "email=0.1,courses=0.5"; warnings
+                       and errors are always kept
+    LOG_QUEUE_SIZE     records buffered before dropping (default 10000)
+
+Never pass secrets to a logger. As a safety net, fields named like
+secrets (otp, password, token, ...) are replaced with "[REDACTED]", and
+so are "otp: 123456" style values in message text.
+"""
+
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import re
+import sys
+import threading
+from datetime import datetime, timezone
+
+import metrics
+
+ROOT = "studybuddy"
+LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", 10000))
+
+SECRET_FIELDS = frozenset({"otp", "password", "passwd", "secret", "token", "authorization", "cookie", "api_key"})
+SECRET_PATTERN = re.compile(r"(?i)\b(otp|password|passwd|secret|token|api[_-]?key)(\s*[:=]\s*)(\S+)")
+REDACTED = "[REDACTED]"
+
+# Attributes every LogRecord has; anything else came from `extra`
+_RECORD_FIELDS = frozenset(vars(logging.makeLogRecord({}))) | {"message", "asctime", "trace_id", "span_id"}
+
+metrics.describe("studybuddy_log_records_dropped_total", "Log records dropped because the log queue was full")
+metrics.describe("studybuddy_log_records_sampled_out_total", "Log records skipped by LOG_SAMPLE_RATES")
+
+
+def parse_sample_rates(value):
+    """{"studybuddy.<name>": rate} from "name=rate,name=rate" """
+    rates = {}
+    for item in (value or "").split(","):
+        name, _, rate = item.partition("=")
+        if name.strip() and rate.strip():
+            rates[f"{ROOT}.{name.strip()}"] = min(max(float(rate), 0.0), 1.0)
+    return rates
+
+
+SAMPLE_RATES = parse_sample_rates(os.getenv("LOG_SAMPLE_RATES", ""))
+
+
+class SamplingFilter(logging.Filter):
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = SAMPLE_RATES.get(record.name)
+        if rate is None or random.random() < rate:
+            return True
+        metrics.inc("studybuddy_log_records_sampled_out_total", logger=record.name)
+        return False
+
+
+def redact_text(text):
+    return SECRET_PATTERN.sub(lambda m: f"{m.group(1)}{m.group(2)}{REDACTED}", text)
+
+
+class RedactingFilter(logging.Filter):
+    """Blank secret-looking extra fields and message values before the record leaves the thread"""
+
+    def filter(self, record):
+        for key in vars(record).keys() - _RECORD_FIELDS:
+            value = getattr(record, key)
+            if key.lower() in SECRET_FIELDS:
+                setattr(record, key, REDACTED)
+            elif isinstance(value, str):
+                setattr(record, key, redact_text(value))
+        record.msg = redact_text(record.getMessage())
+        record.args = None
+        return True
+
+
+class JSONFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+            "trace_id": getattr(record, "trace_id", None),
+            "span_id": getattr(record, "span_id", None),
+            "pid": record.process,
+        }
+        entry.update({key: value for key, value in vars(record).items() if key not in _RECORD_FIELDS})
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            metrics.inc("studybuddy_log_records_dropped_total")
+
+    def prepare(self, record):
+        # Traceback text is rendered here, while the frames still exist, and
+        # redacted like the message (exception strings often quote input)
+        if record.exc_info:
+            record.exc_text = redact_text(logging.Formatter().formatException(record.exc_info))
+            record.exc_info = None
+        return record
+
+
+_listener = None
+_listener_pid = None
+_lock = threading.Lock()
+
+
+def configure(stream=None):
+    """Attach the queue handler to the studybuddy logger and start this process's writer thread"""
+    global _listener, _listener_pid
+    with _lock:
+        if _listener is not None and _listener_pid == os.getpid():
+            return
+        logger = logging.getLogger(ROOT)
+        for handler in list(logger.handlers):
+            if isinstance(handler, DroppingQueueHandler):
+                logger.removeHandler(handler)
+        records = queue.Queue(maxsize=QUEUE_SIZE)
+        handler = DroppingQueueHandler(records)
+        handler.addFilter(SamplingFilter())
+        handler.addFilter(RedactingFilter())
+        output = logging.StreamHandler(stream or sys.stdout)
+        output.setFormatter(JSONFormatter())
+        logger.addHandler(handler)
+        logger.setLevel(LEVEL)
+        logger.propagate = False
+        _listener = logging.handlers.QueueListener(records, output, respect_handler_level=True)
+        _listener.start()
+        _listener_pid = os.getpid()
+
+
+def _after_fork():
+    # The writer thread does not survive fork; the child starts its own
+    global _listener, _lock
+    _lock = threading.Lock()
+    if _listener is not None:
+        _listener = None
+        configure()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_after_fork)
+
+
+def shutdown():
+    """Write out queued records and stop the writer thread"""
+    global _listener
+    with _lock:
+        if _listener is not None and _listener_pid == os.getpid():
+            _listener.stop()
+        _listener = None
+
+
+def get_logger(name):
+    configure()
+    return logging.getLogger(f"{ROOT}.{name}")
@@ -0,0 +1,345 @@
+"""Study partner scoring shared by the Flask routes and the async read path.
+
+Pure functions over student documents; no database access, so both the
+sync and async servers fetch candidates their own way and rank them here.
+"""
+import os
+
+# Fields get_matches actually reads from each student document
+MATCH_PROJECTION = {
+    "name": 1,
+    "email": 1,
+    "department": 1,
+    "college": 1,
+    "course_ids": 1,
+    "study_spots": 1,
+    "study_times": 1,
+    "match_weights": 1,
+}
+
+TOP_N = 3
+
+# Block weights for courses, spots and times
+DEFAULT_WEIGHTS = (3.0, 1.0, 1.5)
+# A student's own weights live on their profile as match_weights
+WEIGHT_KEYS = ("courses", "spots", "times")
+MAX_WEIGHT = 10.0
+
+# Hard filters /get_matches accepts as query parameters
+FILTER_FIELDS = {"department": "department", "college": "college", "course": "course_ids"}
+
+# Candidates re-scored in full after the shared matrix shortlists them
+CANDIDATE_POOL = int(os.getenv("MATCH_CANDIDATE_POOL", 200))
+
+
+def parse_weights(value):
+    """(courses, spots, times) weights from a match_weights object; raises ValueError"""
+    if not isinstance(value, dict) or set(value) - set(WEIGHT_KEYS):
+        raise ValueError(f"match_weights must be an object with keys {', '.join(WEIGHT_KEYS)}")
+    weights = []
+    for key, default in zip(WEIGHT_KEYS, DEFAULT_WEIGHTS):
+        weight = value.get(key, default)
+        if isinstance(weight, bool) or not isinstance(weight, (int, float)) or not 0 <= weight <= MAX_WEIGHT:
+            raise ValueError(f"match_weights.{key} must be a number from 0 to {MAX_WEIGHT:g}")
+        weights.append(float(weight))
+    if not any(weights):
+        raise ValueError("match_weights cannot all be 0")
+    return tuple(weights)
+
+
+def user_weights(student):
+    """The student's stored block weights, or DEFAULT_WEIGHTS"""
+    try:
+        return parse_weights(student["match_weights"]) if student.get("match_weights") else DEFAULT_WEIGHTS
+    except ValueError:
+        return DEFAULT_WEIGHTS
+
+
+def parse_filters(args):
+    """Active hard filters from /get_matches query parameters"""
+    filters = {key: args.get(key, "").strip() for key in FILTER_FIELDS}
+    filters = {key: value for key, value in filters.items() if value}
+    if args.get("shared_time", "").lower() in ("1", "true", "yes"):
+        filters["shared_time"] = True
+    return filters
+
+
+def filter_query(filters, target=None):
+    """Candidate query for the indexed filters; shared_time is included only when target is given"""
+    query = {FILTER_FIELDS[key]: value for key, value in filters.items() if key in FILTER_FIELDS}
+    if filters.get("shared_time") and target is not None:
+        query["study_times"] = {"$in": target.get("study_times", [])}
+    return query
+
+
+def filters_key(filters):
+    return "&".join(f"{key}={filters[key]}" for key in sorted(filters))
+
+
+def passes_filters(student, target, filters):
+    """Whether one candidate satisfies the hard filters"""
+    if "department" in filters and student.get("department") != filters["department"]:
+        return False
+    if "college" in filters and student.get("college") != filters["college"]:
+        return False
+    if "course" in filters and filters["course"] not in student.get("course_ids", []):
+        return False
+    if filters.get("shared_time"):
+        return bool(set(student.get("study_times", [])) & set(target.get("study_times", [])))
+    return True
+
+
+def collect_unique_features(students):
+    all_courses = set()
+    all_spots = set()
+    all_times = set()
+
+    for student in students:
+        all_courses.update(student.get("course_ids", []))
+        all_spots.update(student.get("study_spots", []))
+        all_times.update(student.get("study_times", []))
+    return list(all_courses), list(all_spots), list(all_times)
+
+
+def encode_features(student, all_courses, all_spots, all_times):
+    import numpy as np
+
+    vector = []
+    vector += [1 if c in student.get("course_ids", []) else 0 for c in all_courses]
+    vector += [1 if s in student.get("study_spots", []) else 0 for s in all_spots]
+    vector += [1 if t in student.get("study_times", []) else 0 for t in all_times]
+    return np.array(vector)
+
+
+def calculate_weighted_similarity(
+    vector1,
+    vector2,
+    all_courses,
+    all_spots,
+    course_weight=DEFAULT_WEIGHTS[0],
+    spot_weight=DEFAULT_WEIGHTS[1],
+    time_weight=DEFAULT_WEIGHTS[2],
+):
+    import numpy as np
+
+    len_courses = len(all_courses)
+    len_spots = len(all_spots)
+
+    weighted_v1 = vector1.copy().astype(float)
+    weighted_v2 = vector2.copy().astype(float)
+
+    weighted_v1[:len_courses] *= course_weight
+    weighted_v2[:len_courses] *= course_weight
+
+    weighted_v1[len_courses : len_courses + len_spots] *= spot_weight
+    weighted_v2[len_courses : len_courses + len_spots] *= spot_weight
+
+    weighted_v1[len_courses + len_spots :] *= time_weight
+    weighted_v2[len_courses + len_spots :] *= time_weight
+
+    # Same result as sklearn's cosine_similarity (0 for an all-zero vector)
+    # without importing sklearn for a single pair
+    norms = np.linalg.norm(weighted_v1) * np.linalg.norm(weighted_v2)
+    if norms == 0:
+        return 0.0
+    return float(np.dot(weighted_v1, weighted_v2) / norms)
+
+
+def soft_course_similarities(target, others, kernel_of, weights=DEFAULT_WEIGHTS):
+    """Weighted cosine where related courses count as partial overlap.
+
+    kernel_of(codes) gives S = I + w * N over those codes (see
+    course_similarity); the course block uses a S b in place of a . b.
+    With S = I this equals calculate_weighted_similarity. Returns
+    (similarities, related) where related[i] lists candidate i's courses
+    that the target does not take but are related to one it does.
+    """
+    import numpy as np
+    from scipy.sparse import csr_matrix
+
+    students = [target, *others]
+    courses = sorted({c for s in students for c in s.get("course_ids", [])})
+    column = {c: i for i, c in enumerate(courses)}
+    rows, cols = [], []
+    for r, student in enumerate(students):
+        for c in set(student.get("course_ids", [])):
+            rows.append(r)
+            cols.append(column[c])
+    onehot = csr_matrix((np.ones(len(rows), dtype=np.float32), (rows, cols)), shape=(len(students), len(courses)))
+
+    # One sparse product gives every student's softened course row
+    soft = onehot @ kernel_of(courses)
+    course_self = np.asarray(soft.multiply(onehot).sum(axis=1)).ravel()
+    course_dot = np.asarray(onehot[1:].multiply(soft[0]).sum(axis=1)).ravel()
+
+    w_course, w_spot, w_time = (w * w for w in weights)
+    spots, times = set(target.get("study_spots", [])), set(target.get("study_times", []))
+    spot_dot = np.array([len(spots & set(s.get("study_spots", []))) for s in others], dtype=np.float64)
+    time_dot = np.array([len(times & set(s.get("study_times", []))) for s in others], dtype=np.float64)
+    spot_self = np.array([len(set(s.get("study_spots", []))) for s in students], dtype=np.float64)
+    time_self = np.array([len(set(s.get("study_times", []))) for s in students], dtype=np.float64)
+
+    norms = np.sqrt(w_course * course_self + w_spot * spot_self + w_time * time_self)
+    dots = w_course * course_dot + w_spot * spot_dot + w_time * time_dot
+    denominators = norms[0] * norms[1:]
+    similarities = np.divide(dots, denominators, out=np.zeros(len(others)), where=denominators > 0)
+
+    target_courses = set(target.get("course_ids", []))
+    reach = soft[0].toarray().ravel()
+    related = [
+        sorted(c for c in set(s.get("course_ids", [])) - target_courses if reach[column[c]] > 0) for s in others
+    ]
+    return np.minimum(similarities, 1.0).tolist(), related
+
+
+def profile_cosines(target, others):
+    """Plain cosine at DEFAULT_WEIGHTS with exact course overlap: the ranker's "cosine" feature.
+
+    Independent of the target's match_weights, the related-course table
+    and timetables, so train_ranker.py computes the same value from the
+    stored profiles.
+    """
+    from scipy.sparse import identity
+
+    def exact(codes):
+        return identity(len(codes), dtype="float32", format="csr")
+
+    return soft_course_similarities(target, others, exact, DEFAULT_WEIGHTS)[0]
+
+
+def blend_timetable(target, others, similarities, course_slots):
+    """Mix shared free time into the scores; returns (scores, shared free slots or None)"""
+    import numpy as np
+    import timetable
+
+    busy, known = timetable.busy_matrix([target, *others], course_slots)
+    if not known[0]:
+        return similarities, None
+    shared, target_free = timetable.shared_free_slots(busy[0], busy[1:])
+    if not target_free:
+        return similarities, None
+    candidate_known = known[1:]
+    if not candidate_known.any():
+        return similarities, None
+    # Candidates with no known schedule get the mean ratio of those with one,
+    # so both groups are ranked on the same blended scale
+    ratio = np.where(candidate_known, shared / target_free, (shared / target_free)[candidate_known].mean())
+    w = timetable.TIMETABLE_WEIGHT
+    return (1 - w) * np.asarray(similarities) + w * ratio, shared
+
+
+def score_candidates(target, others, all_courses, all_spots, all_times, course_slots=None, weights=DEFAULT_WEIGHTS):
+    """Score every candidate against target; returns match dicts, best first.
+
+    With course_slots (code -> timetable bitmap), shared free time is
+    blended into the similarity. When a course similarity table is
+    published, related courses count as partial overlap. When a learned
+    ranker is configured, it only decides the order; its features come
+    from the profiles (profile_cosines), not from the displayed score.
+    """
+    import course_similarity
+    import ranker
+
+    table = course_similarity.get_table() if course_similarity.SIMILARITY_WEIGHT > 0 else None
+    related = None
+    if table is not None:
+        similarities, related = soft_course_similarities(target, others, table.kernel, weights)
+    else:
+        tf = encode_features(target, all_courses, all_spots, all_times)
+        similarities = [
+            calculate_weighted_similarity(
+                tf, encode_features(student, all_courses, all_spots, all_times), all_courses, all_spots, *weights
+            )
+            for student in others
+        ]
+    shared_free = None
+    if course_slots:
+        similarities, shared_free = blend_timetable(target, others, similarities, course_slots)
+    learned = ranker.rerank(target, others, profile_cosines(target, others)) if ranker.get_model() else None
+
+    matches = []
+    for i, (student, similarity) in enumerate(zip(others, similarities)):
+        matches.append(
+            {
+                "student_id": str(student["_id"]),
+                "name": student["name"],
+                "email": student["email"],
+                "department": student["department"],
+                "similarity": round(float(similarity) * 100, 1),
+                "shared_courses": list(set(target.get("course_ids", [])) & set(student.get("course_ids", []))),
+                "shared_spots": list(set(target.get("study_spots", [])) & set(student.get("study_spots", []))),
+                "shared_times": list(set(target.get("study_times", [])) & set(student.get("study_times", []))),
+            }
+        )
+        if related is not None:
+            matches[-1]["related_courses"] = related[i]
+        if shared_free is not None:
+            matches[-1]["shared_free_slots"] = int(shared_free[i])
+    if learned is None:
+        matches.sort(key=lambda x: x["similarity"], reverse=True)
+    else:
+        order = sorted(range(len(matches)), key=lambda i: learned[i], reverse=True)
+        matches = [matches[i] for i in order]
+    return matches
+
+
+def shortlist(matrix, target, target_id, pool=CANDIDATE_POOL, exclude=None, rows=None, shared_time=False):
+    """ObjectIds of the `pool` best rows of the shared feature matrix by the target's weighted cosine.
+
+    Returns (ids, rows considered). Only `rows` are scored when given
+    (students already passing the indexed filters), and shared_time masks
+    out rows without a study time in common with the target. The target's
+    own row and the rows of `exclude` (a partner_filters.PartnerFilter)
+    are left out.
+
+    With a published course similarity table the course block already
+    counts related courses (a S b, as in soft_course_similarities), so
+    students who share only related courses reach the pool. Candidate
+    norms stay the plain ones; the pool is re-scored exactly afterwards.
+    """
+    import numpy as np
+
+    import course_similarity
+    from feature_matrix import BLOCKS
+
+    table = course_similarity.get_table() if course_similarity.SIMILARITY_WEIGHT > 0 else None
+    related = table.reach(target.get("course_ids", [])) if table is not None else None
+    dots, own_counts = matrix.block_dots(target, rows, related)
+    scores = matrix.cosine_from_dots(dots, own_counts, user_weights(target), rows)
+    row_ids = np.arange(matrix.count) if rows is None else np.asarray(rows)
+    hidden = [matrix.row_of(target_id), *(exclude.rows(matrix) if exclude else ())]
+    masked = np.isin(row_ids, [r for r in hidden if r is not None])
+    if shared_time:
+        masked |= dots[:, BLOCKS.index("study_times")] == 0
+    scores[masked] = -np.inf
+    considered = len(scores) - int(masked.sum())
+    k = min(pool, considered)
+    if k <= 0:
+        return [], considered
+    top = np.argpartition(-scores, k - 1)[:k]
+    return matrix.object_ids(row_ids[top]), considered
+
+
+def build_match_response(target, others, top_n=TOP_N, course_slots=None, total_checked=None, filters=None):
+    """Return (body, status) for get_matches given the target and the candidate students.
+
+    Scores use the target's own match_weights. Candidates were already
+    narrowed by the filters; they are re-checked here because the shared
+    matrix may lag the database.
+    """
+    if filters:
+        others = [s for s in others if passes_filters(s, target, filters)]
+    all_courses, all_spots, all_times = collect_unique_features([target, *others])
+    if not all_courses:
+        return {"error": "No course data available"}, 400
+    if not others:
+        return {"message": "No other students available", "matches": []}, 200
+
+    weights = user_weights(target)
+    matches = score_candidates(target, others, all_courses, all_spots, all_times, course_slots, weights)
+    if total_checked is None:
+        total_checked = len(others)
+    body = {"target_student": target["name"], "matches": matches[:top_n], "total_checked": total_checked}
+    if filters:
+        body["filters"] = filters
+    return body, 200
@@ -0,0 +1,57 @@
+"""Process-local metrics, rendered in Prometheus text format at /metrics.
+
+Each gunicorn worker keeps its own values; every sample carries a `pid`
+label, so scrapes from different workers can be told apart.
+"""
+import os
+import threading
+
+_lock = threading.Lock()
+_gauges = {}
+_counters = {}
+_help = {}
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+def describe(name, text):
+    _help[name] = text
+
+
+def set_gauge(name, value, **labels):
+    with _lock:
+        _gauges[_key(name, labels)] = float(value)
+
+
+def inc(name, amount=1, **labels):
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0.0) + amount
+
+
+def get(name, **labels):
+    key = _key(name, labels)
+    with _lock:
+        return _gauges.get(key, _counters.get(key))
+
+
+def _format_labels(labels):
+    labels = labels + (("pid", str(os.getpid())),)
+    return "{" + ",".join(f'{k}="{v}"' for k, v in labels) + "}"
+
+
+def render():
+    lines = []
+    with _lock:
+        for kind, series in (("gauge", _gauges), ("counter", _counters)):
+            seen = set()
+            for (name, labels), value in sorted(series.items()):
+                if name not in seen:
+                    seen.add(name)
+                    if name in _help:
+                        lines.append(f"# HELP {name} {_help[name]}")
+                    lines.append(f"# TYPE {name} {kind}")
+                lines.append(f"{name}{_format_labels(labels)} {value}")
+    return "\n".join(lines) + "\n"
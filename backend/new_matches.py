@@ -0,0 +1,340 @@
+"""
+Live "new match" detection.
+
+Every student who has seen their matches keeps a stored top-N list in
+`top_matches` (partner ids and weighted-cosine scores, plus the lowest
+score as `threshold`). When a student registers or edits their profile,
+the worker that handled the write scores that one student against every
+row of the shared feature matrix in a single sparse product. Weighted
+cosine is symmetric, so the same vector says where the changed student
+lands in everybody else's list: any user whose threshold it beats gets
+it spliced into their list, and a row in `match_notifications`.
+
+A sender thread in each worker claims pending notifications every
+MATCH_NOTIFY_INTERVAL_SECONDS and mails each user one digest of their new
+partners through Flask-Mail. Claims are atomic per notification, so
+workers never send the same one twice. Only delivered notifications are
+stamped sent_at. A failed send releases its claim for the next run, up to
+NOTIFY_MAX_ATTEMPTS tries. A claim older than MATCH_NOTIFY_CLAIM_SECONDS
+(its worker died mid-run) can be taken again.
+
+Viewing matches seeds the viewer's own list once (seed()); each worker
+remembers up to SEEDED_CACHE_SIZE students it has seeded, so repeat views
+queue nothing. The work queue holds at most MATCH_QUEUE_SIZE students;
+beyond that, submissions are dropped and counted in
+studybuddy_new_match_queue_dropped_total.
+
+Scores here are the plain weighted cosine used for shortlisting; the
+ranker and timetable blend still decide the order users see on /get_matches.
+"""
+
+import os
+import queue
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from html import escape
+
+import db
+import feature_matrix
+import logs
+import matching
+import metrics
+import partner_filters
+import repository
+import tracing
+
+TOP_N = matching.TOP_N
+NOTIFY_INTERVAL_SECONDS = float(os.getenv("MATCH_NOTIFY_INTERVAL_SECONDS", 900))
+NOTIFY_BATCH = 500
+CLAIM_SECONDS = float(os.getenv("MATCH_NOTIFY_CLAIM_SECONDS", 3600))
+NOTIFY_MAX_ATTEMPTS = 5
+QUEUE_SIZE = int(os.getenv("MATCH_QUEUE_SIZE", 10000))
+SEEDED_CACHE_SIZE = 100000
+
+top_matches_collection = db.LazyCollection("top_matches")
+notifications_collection = db.LazyCollection("match_notifications")
+
+log = logs.get_logger("matches")
+
+metrics.describe("studybuddy_new_match_queue_dropped_total", "Students not queued for new-match detection (queue full)")
+
+
+def _store_list(entries):
+    """Document fields for a top-N list of (partner ObjectId, score), best first"""
+    entries = entries[:TOP_N]
+    threshold = entries[-1][1] if len(entries) >= TOP_N else 0.0
+    return {
+        "matches": [{"student_id": sid, "score": float(score)} for sid, score in entries],
+        "threshold": float(threshold),
+        "updated_at": datetime.utcnow(),
+    }
+
+
+def own_top(matrix, scores, own_row):
+    """(partner id, score) for the best TOP_N rows, excluding own_row and zero scores"""
+    import numpy as np
+
+    scores = scores.copy()
+    if own_row is not None:
+        scores[own_row] = 0.0
+    k = min(TOP_N, int((scores > 0).sum()))
+    if k == 0:
+        return []
+    top = np.argpartition(-scores, k - 1)[:k]
+    top = top[np.argsort(-scores[top])]
+    return list(zip(matrix.object_ids(top), scores[top].tolist()))
+
+
+def entered_lists(matrix, scores, student_id, own_row):
+    """Users whose stored list the student now belongs in: {user ObjectId: score}"""
+    import numpy as np
+
+    candidates = np.flatnonzero(scores > 0)
+    if own_row is not None:
+        candidates = candidates[candidates != own_row]
+    if not len(candidates):
+        return {}
+    ids = matrix.object_ids(candidates)
+    stored = top_matches_collection.find({"_id": {"$in": ids}}, {"threshold": 1})
+    thresholds = {doc["_id"]: doc.get("threshold", 0.0) for doc in stored}
+    if not thresholds:
+        return {}
+    # Vectorized comparison against each user's current cut-off
+    known = np.array([sid in thresholds for sid in ids])
+    cutoffs = np.array([thresholds.get(sid, np.inf) for sid in ids])
+    beats = known & (scores[candidates] > cutoffs)
+    return {ids[i]: float(scores[candidates[i]]) for i in np.flatnonzero(beats)}
+
+
+def splice(stored_matches, student_id, score):
+    """Insert or rescore student_id in a stored list; returns (entries, is_new)"""
+    entries = [(m["student_id"], m["score"]) for m in stored_matches if m["student_id"] != student_id]
+    was_listed = len(entries) < len(stored_matches)
+    entries.append((student_id, score))
+    entries.sort(key=lambda e: -e[1])
+    entries = entries[:TOP_N]
+    return entries, not was_listed and any(sid == student_id for sid, _ in entries)
+
+
+def process(student_id, propagate=True):
+    """Refresh student_id's own list and, if propagate, splice it into other users' lists.
+
+    Returns the number of notifications queued.
+    """
+    from pymongo import UpdateOne
+
+    # Seeding is a no-op once a list exists; check before any scoring
+    if not propagate and top_matches_collection.find_one({"_id": student_id}, {"_id": 1}):
+        return 0
+    student = repository.match_student(student_id)
+    if not student:
+        return 0
+    matrix = feature_matrix.get_matrix()
+    if matrix is None:
+        return 0
+
+    scores = matrix.cosine(student, matching.DEFAULT_WEIGHTS)
+    own_row = matrix.row_of(student_id)
+    # Contacted or blocked pairs neither enter each other's lists nor get notified
+    scores[partner_filters.load(student_id).rows(matrix)] = 0.0
+    top_matches_collection.update_one(
+        {"_id": student_id}, {"$set": _store_list(own_top(matrix, scores, own_row))}, upsert=True
+    )
+    if not propagate:
+        return 0
+
+    entrants = entered_lists(matrix, scores, student_id, own_row)
+    if not entrants:
+        return 0
+    updates, notifications = [], []
+    now = datetime.utcnow()
+    for doc in top_matches_collection.find({"_id": {"$in": list(entrants)}}, {"matches": 1}):
+        entries, is_new = splice(doc.get("matches", []), student_id, entrants[doc["_id"]])
+        updates.append(UpdateOne({"_id": doc["_id"]}, {"$set": _store_list(entries)}))
+        if is_new:
+            notifications.append(
+                {"user_id": doc["_id"], "partner_id": student_id, "score": entrants[doc["_id"]], "created_at": now, "claimed_by": None}
+            )
+    if updates:
+        top_matches_collection.bulk_write(updates, ordered=False)
+    if notifications:
+        notifications_collection.insert_many(notifications, ordered=False)
+    return len(notifications)
+
+
+# Background work: one queue consumer and one sender per worker
+
+_queue = queue.Queue(maxsize=QUEUE_SIZE)
+_threads = []
+# Students this worker has seeded (or queued for seeding), oldest first
+_seeded = OrderedDict()
+_seeded_lock = threading.Lock()
+
+
+def submit(student_id, propagate=True):
+    """Queue a changed (propagate) or merely viewed (seed only) student; never blocks the request"""
+    try:
+        _queue.put_nowait((student_id, propagate))
+        return True
+    except queue.Full:
+        metrics.inc("studybuddy_new_match_queue_dropped_total", propagate=str(propagate).lower())
+        if propagate:
+            log.warning("new-match queue full; change not propagated", extra={"student_id": str(student_id)})
+        return False
+
+
+def seed(student_id):
+    """Queue seeding of a viewer's own list, unless this worker already did it"""
+    with _seeded_lock:
+        if student_id in _seeded:
+            _seeded.move_to_end(student_id)
+            return
+        _seeded[student_id] = True
+        while len(_seeded) > SEEDED_CACHE_SIZE:
+            _seeded.popitem(last=False)
+    if not submit(student_id, propagate=False):
+        _forget_seed(student_id)
+
+
+def _forget_seed(student_id):
+    with _seeded_lock:
+        _seeded.pop(student_id, None)
+
+
+def _consume():
+    while True:
+        student_id, propagate = _queue.get()
+        try:
+            queued = process(student_id, propagate)
+            if queued:
+                log.info("student entered top matches", extra={"student_id": str(student_id), "users": queued})
+        except Exception:
+            if not propagate:
+                _forget_seed(student_id)  # retry on the next view
+            log.exception("new-match detection failed", extra={"student_id": str(student_id)})
+
+
+def _claimable(now):
+    """Unsent notifications that are unclaimed, or whose claim has expired"""
+    return {
+        "sent_at": None,
+        "attempts": {"$not": {"$gte": NOTIFY_MAX_ATTEMPTS}},
+        "$or": [{"claimed_by": None}, {"claimed_at": {"$lt": now - timedelta(seconds=CLAIM_SECONDS)}}],
+    }
+
+
+def claim_pending(limit=NOTIFY_BATCH):
+    """Atomically claim up to `limit` unsent notifications for this worker; returns (token, notifications)"""
+    token = f"{os.getpid()}-{uuid.uuid4().hex}"
+    now = datetime.utcnow()
+    pending = notifications_collection.find(_claimable(now), {"_id": 1}).limit(limit)
+    ids = [doc["_id"] for doc in pending]
+    if not ids:
+        return token, []
+    # The filter is re-checked per document, so two workers never both take one
+    notifications_collection.update_many(
+        {"_id": {"$in": ids}, **_claimable(now)}, {"$set": {"claimed_by": token, "claimed_at": now}}
+    )
+    return token, list(notifications_collection.find({"claimed_by": token, "sent_at": None}))
+
+
+def digest_html(user, partners):
+    # Names and departments are whatever students typed; escape them
+    rows = "".join(
+        f"<li><strong>{escape(p.get('name', 'A student'))}</strong> ({escape(p.get('department', ''))})</li>"
+        for p in partners
+    )
+    return f"""
+    <html>
+    <body style="font-family: Arial, sans-serif; line-height: 1.6; color: #333; max-width: 600px; margin: 0 auto;">
+        <div style="background: linear-gradient(135deg, #6366f1 0%, #8b5cf6 100%); padding: 30px; text-align: center; border-radius: 10px 10px 0 0;">
+            <h1 style="color: white; margin: 0; font-size: 28px;">📚 StudyBuddy</h1>
+            <p style="color: rgba(255,255,255,0.9); margin: 10px 0 0 0;">New Study Partner Matches</p>
+        </div>
+        <div style="background: #ffffff; padding: 30px; border: 1px solid #e5e7eb; border-top: none; border-radius: 0 0 10px 10px;">
+            <h2 style="color: #1f2937; margin-top: 0;">Hi {escape(user.get('name', ''))}! 👋</h2>
+            <p style="font-size: 16px;">New students just joined your top matches:</p>
+            <ul style="font-size: 15px;">{rows}</ul>
+            <p style="font-size: 16px;">Open StudyBuddy to see your matches and say hello.</p>
+        </div>
+    </body>
+    </html>
+    """
+
+
+def send_digests(app_instance, mail):
+    """Claim pending notifications and send one email per user; returns emails sent"""
+    from flask_mail import Message
+
+    token, claimed = claim_pending()
+    if not claimed:
+        return 0
+    by_user = {}
+    for n in claimed:
+        by_user.setdefault(n["user_id"], []).append(n)
+    people = {s["_id"]: s for s in repository.get_senders([*by_user, *(n["partner_id"] for n in claimed)])}
+    delivered, failed, orphaned, sent = [], [], [], 0
+    with app_instance.app_context():
+        for user_id, notifications in by_user.items():
+            ids = [n["_id"] for n in notifications]
+            user = people.get(user_id)
+            partners = [people[p] for p in dict.fromkeys(n["partner_id"] for n in notifications) if p in people]
+            if not user or not partners:
+                orphaned += ids  # user or partners deleted since; nothing left to send
+                continue
+            try:
+                with tracing.span("smtp send", "client", **{"smtp.purpose": "match_digest"}):
+                    mail.send(
+                        Message(
+                            subject=f"🎓 {len(partners)} new study partner match{'es' if len(partners) > 1 else ''} - StudyBuddy",
+                            recipients=[user["email"]],
+                            html=digest_html(user, partners),
+                        )
+                    )
+                delivered += ids
+                sent += 1
+            except Exception as e:
+                failed += ids
+                log.warning("match digest failed", extra={"recipient": user["email"], "error": str(e)})
+    if delivered:
+        notifications_collection.update_many(
+            {"_id": {"$in": delivered}, "claimed_by": token}, {"$set": {"sent_at": datetime.utcnow()}}
+        )
+    if failed:
+        notifications_collection.update_many(
+            {"_id": {"$in": failed}, "claimed_by": token},
+            {"$set": {"claimed_by": None}, "$unset": {"claimed_at": ""}, "$inc": {"attempts": 1}},
+        )
+    if orphaned:
+        notifications_collection.delete_many({"_id": {"$in": orphaned}, "claimed_by": token})
+    return sent
+
+
+def start(app_instance, mail):
+    """Start this worker's detection and digest threads (idempotent)"""
+    if _threads:
+        return
+
+    def send_loop():
+        try:
+            notifications_collection.create_index("claimed_by")
+        except Exception as e:
+            log.warning("match notification index setup failed", extra={"error": str(e)})
+        while True:
+            time.sleep(NOTIFY_INTERVAL_SECONDS)
+            try:
+                # Each run is its own trace (sampled like requests)
+                with tracing.span("send match digests"):
+                    sent = send_digests(app_instance, mail)
+                if sent:
+                    log.info("sent match digests", extra={"emails": sent})
+            except Exception:
+                log.exception("match digest run failed")
+
+    for target, name in ((_consume, "new-matches"), (send_loop, "match-digests")):
+        thread = threading.Thread(target=target, name=name, daemon=True)
+        thread.start()
+        _threads.append(thread)
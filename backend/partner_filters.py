@@ -0,0 +1,139 @@
+"""
+Per-user contact and block history, applied to matches.
+
+One document per student in `partner_filters`:
+
+    {_id: student, contacted: [ids], contacted_emails: [emails],
+     blocked: [ids], blocked_by: [ids]}
+
+so a match request loads everything it must hide with one find_one by _id.
+Blocks are recorded on both sides, which hides the pair from each other.
+The ids become a PartnerFilter, a sorted (N, 12) uint8 array of raw
+ObjectIds, the representation feature_matrix.py uses.
+It turns into matrix rows (set to -inf before top-k selection) or a $nin
+list for the no-matrix fallback, so filtering costs a few dict lookups,
+not a pass over the candidates.
+
+Partner emails are deduplicated per recipient address. claim_contact is
+an atomic $addToSet, so two concurrent sends to the same person cannot
+both go out. release_contact undoes a claim whose email failed.
+"""
+
+from datetime import datetime
+
+from bson import ObjectId
+
+import db
+
+filters_collection = db.LazyCollection("partner_filters")
+
+FILTER_PROJECTION = {"contacted": 1, "blocked": 1, "blocked_by": 1}
+
+
+class PartnerFilter:
+    """Sorted ObjectId bytes a student's matches must leave out"""
+
+    def __init__(self, ids=()):
+        import numpy as np
+
+        # uint8 rows, not "S12", which would drop trailing NUL bytes
+        raw = np.frombuffer(b"".join(oid.binary for oid in ids), dtype=np.uint8).reshape(-1, 12)
+        self.ids = np.unique(raw, axis=0)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, student_id):
+        import numpy as np
+
+        key = np.frombuffer(student_id.binary, dtype=np.uint8)
+        return bool((self.ids == key).all(axis=1).any())
+
+    def object_ids(self):
+        return [ObjectId(row.tobytes()) for row in self.ids]
+
+    def rows(self, matrix):
+        """Row indices of the filtered students in a shared feature matrix"""
+        rows = (matrix.row_of(oid) for oid in self.object_ids())
+        return [r for r in rows if r is not None]
+
+
+def from_doc(doc):
+    if not doc:
+        return PartnerFilter()
+    return PartnerFilter([*doc.get("contacted", []), *doc.get("blocked", []), *doc.get("blocked_by", [])])
+
+
+def load(student_id):
+    """PartnerFilter for student_id's matches (one indexed read)"""
+    return from_doc(filters_collection.find_one({"_id": ObjectId(student_id)}, FILTER_PROJECTION))
+
+
+def claim_contact(owner_id, email, partner_id=None):
+    """Record a partner email; False when owner already emailed this address"""
+    update = {"$addToSet": {"contacted_emails": email.lower()}, "$set": {"updated_at": datetime.utcnow()}}
+    if partner_id is not None:
+        update["$addToSet"]["contacted"] = partner_id
+    unclaimed = {"_id": ObjectId(owner_id), "contacted_emails": {"$ne": email.lower()}}
+    if filters_collection.update_one(unclaimed, update).modified_count:
+        return True
+    # No document yet, or the address is already recorded
+    from pymongo.errors import DuplicateKeyError
+
+    try:
+        filters_collection.insert_one(
+            {
+                "_id": ObjectId(owner_id),
+                "contacted_emails": [email.lower()],
+                "contacted": [partner_id] if partner_id is not None else [],
+                "updated_at": datetime.utcnow(),
+            }
+        )
+        return True
+    except DuplicateKeyError:
+        # A concurrent write (e.g. a block) created the document first
+        return bool(filters_collection.update_one(unclaimed, update).modified_count)
+
+
+def release_contact(owner_id, email, partner_id=None):
+    pull = {"contacted_emails": email.lower()}
+    if partner_id is not None:
+        pull["contacted"] = partner_id
+    filters_collection.update_one({"_id": ObjectId(owner_id)}, {"$pull": pull})
+
+
+def block(owner_id, other_id):
+    from pymongo import UpdateOne
+
+    owner_id, other_id = ObjectId(owner_id), ObjectId(other_id)
+    now = datetime.utcnow()
+    filters_collection.bulk_write(
+        [
+            UpdateOne({"_id": owner_id}, {"$addToSet": {"blocked": other_id}, "$set": {"updated_at": now}}, upsert=True),
+            UpdateOne({"_id": other_id}, {"$addToSet": {"blocked_by": owner_id}, "$set": {"updated_at": now}}, upsert=True),
+        ],
+        ordered=False,
+    )
+
+
+def unblock(owner_id, other_id):
+    from pymongo import UpdateOne
+
+    owner_id, other_id = ObjectId(owner_id), ObjectId(other_id)
+    filters_collection.bulk_write(
+        [
+            UpdateOne({"_id": owner_id}, {"$pull": {"blocked": other_id}}),
+            UpdateOne({"_id": other_id}, {"$pull": {"blocked_by": owner_id}}),
+        ],
+        ordered=False,
+    )
+
+
+def blocked_ids(owner_id):
+    doc = filters_collection.find_one({"_id": ObjectId(owner_id)}, {"blocked": 1})
+    return doc.get("blocked", []) if doc else []
+
+
+def is_blocked_by(owner_id, other_id):
+    """True when other_id has blocked owner_id"""
+    return bool(filters_collection.find_one({"_id": ObjectId(owner_id), "blocked_by": ObjectId(other_id)}, {"_id": 1}))
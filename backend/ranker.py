@@ -0,0 +1,116 @@
+"""Optional learned re-ranker for study partner matches.
+
+The weighted cosine in matching.py is always computed. When RANKER_MODEL_PATH
+points at an XGBoost model trained by train_ranker.py, candidates are
+re-ordered by the model's predicted probability that the user will contact
+them. All candidates are scored in a single inplace_predict call. The
+booster is loaded once per worker and reloaded only when the file changes.
+
+Without xgboost installed, or without a model file, rerank() is a no-op.
+"""
+import os
+import threading
+from datetime import datetime
+
+import logs
+
+MODEL_PATH = os.getenv("RANKER_MODEL_PATH", "")
+
+# Order matters: train_ranker.py and serving must agree on columns
+FEATURE_NAMES = [
+    # matching.profile_cosines: default weights, exact courses, no timetable
+    "cosine",
+    "shared_courses",
+    "shared_spots",
+    "shared_times",
+    "same_department",
+    "same_college",
+    "candidate_courses",
+    "candidate_spots",
+    "candidate_times",
+]
+
+# Engagement events feeding train_ranker.py
+EVENTS_COLLECTION = "match_events"
+IMPRESSION = "impression"
+CONTACT = "contact"
+
+_model = None
+_model_mtime = None
+_model_lock = threading.Lock()
+
+log = logs.get_logger("ranker")
+
+
+def pair_features(target, candidates, cosine_scores):
+    """Feature matrix (len(candidates) x len(FEATURE_NAMES)) for target vs each candidate"""
+    import numpy as np
+
+    t_courses = set(target.get("course_ids", []))
+    t_spots = set(target.get("study_spots", []))
+    t_times = set(target.get("study_times", []))
+    t_department = target.get("department")
+    t_college = target.get("college")
+
+    features = np.empty((len(candidates), len(FEATURE_NAMES)), dtype=np.float32)
+    features[:, 0] = cosine_scores
+    for i, c in enumerate(candidates):
+        c_courses = c.get("course_ids", [])
+        c_spots = c.get("study_spots", [])
+        c_times = c.get("study_times", [])
+        features[i, 1] = len(t_courses.intersection(c_courses))
+        features[i, 2] = len(t_spots.intersection(c_spots))
+        features[i, 3] = len(t_times.intersection(c_times))
+        features[i, 4] = t_department is not None and c.get("department") == t_department
+        features[i, 5] = t_college is not None and c.get("college") == t_college
+        features[i, 6] = len(c_courses)
+        features[i, 7] = len(c_spots)
+        features[i, 8] = len(c_times)
+    return features
+
+
+def get_model():
+    """Return the loaded Booster, or None when no model is configured/usable"""
+    global _model, _model_mtime
+    if not MODEL_PATH:
+        return None
+    try:
+        mtime = os.stat(MODEL_PATH).st_mtime
+    except OSError:
+        return None
+    if _model is not None and mtime == _model_mtime:
+        return _model
+    with _model_lock:
+        if _model is None or mtime != _model_mtime:
+            try:
+                import xgboost
+
+                booster = xgboost.Booster()
+                booster.load_model(MODEL_PATH)
+                _model, _model_mtime = booster, mtime
+                log.info("loaded match ranker", extra={"path": MODEL_PATH})
+            except Exception as e:
+                log.warning("match ranker unavailable, using cosine order", extra={"path": MODEL_PATH, "error": str(e)})
+                _model, _model_mtime = None, mtime
+    return _model
+
+
+def rerank(target, candidates, cosine_scores):
+    """Return model scores for candidates (one predict call), or None to keep cosine order"""
+    model = get_model()
+    if model is None or not candidates:
+        return None
+    features = pair_features(target, candidates, cosine_scores)
+    return model.inplace_predict(features)
+
+
+def impression_events(user_id, matches):
+    now = datetime.utcnow()
+    return [
+        {"user_id": user_id, "candidate_id": m["student_id"], "type": IMPRESSION, "rank": rank, "at": now}
+        for rank, m in enumerate(matches)
+    ]
+
+
+def contact_event(user_id, candidate_id):
+    return {"user_id": user_id, "candidate_id": candidate_id, "type": CONTACT, "at": datetime.utcnow()}
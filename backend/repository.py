@@ -0,0 +1,658 @@
+"""
+Data access for students, courses, course rosters, OTPs and match events.
+
+Every MongoDB query the Flask routes need lives here, each with an
+explicit projection, so a route only ever receives the fields it uses.
+Results are plain dicts described by the TypedDicts below. Batch helpers
+(`match_candidates`, `existing_emails`, `upsert_courses`, ...) replace
+per-item round trips.
+
+Course rosters are a materialized view of students.course_ids, plus
+past terms' archived_course_ids kept as history: one `course_members` row
+per (course, student) and a `course_rosters` counter per course. The student writes below keep both in step incrementally, so
+"who takes X" and "most popular courses" are indexed reads instead of an
+$unwind over every student.
+
+Match reads are partitioned by semester (see semester.py): candidates must
+take a current-semester course and course_ids come back trimmed to it.
+
+Profile and course-name reads go through per-process caches kept coherent
+across workers by generation counters (see generations.py). Every student
+write here bumps "profiles", and course upserts bump "catalog".
+
+Each query is counted, in studybuddy_db_queries_total at /metrics and in
+an optional per-thread tally:
+
+    with repository.count_queries() as counts:
+        client.get("/get_matches/...")
+    counts.total, counts.by_operation
+"""
+
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Iterable, List, Optional, Set, TypedDict
+
+from bson import ObjectId
+
+import catalog
+import db
+import generations
+import logs
+import metrics
+import ranker
+import semester
+import timetable
+from matching import MATCH_PROJECTION
+
+students_collection = db.LazyCollection("students")
+courses_collection = db.LazyCollection("courses")
+otp_collection = db.LazyCollection("otps")
+match_events_collection = db.LazyCollection(ranker.EVENTS_COLLECTION)
+rosters_collection = db.LazyCollection("course_rosters")
+members_collection = db.LazyCollection("course_members")
+
+log = logs.get_logger("db")
+
+OTP_TTL = timedelta(minutes=10)
+
+PROFILE_CACHE_SIZE = 4096
+CATALOG_CACHE_SIZE = 1024
+profile_cache = generations.GenerationCache("profiles", PROFILE_CACHE_SIZE)
+catalog_cache = generations.GenerationCache("catalog", CATALOG_CACHE_SIZE)
+
+# Fields a student document may carry; registration payloads are trimmed to these
+STUDENT_FIELDS = ("name", "email", "college", "department", "course_ids", "study_spots", "study_times")
+PROFILE_PROJECTION = {f: 1 for f in (*STUDENT_FIELDS, "match_weights", "email_verified", "created_at", "updated_at")}
+LOGIN_PROJECTION = {"name": 1, "email": 1}
+SENDER_PROJECTION = {"name": 1, "email": 1, "department": 1}
+
+
+class StudentProfile(TypedDict, total=False):
+    _id: ObjectId
+    name: str
+    email: str
+    college: str
+    department: str
+    course_ids: List[str]
+    study_spots: List[str]
+    study_times: List[str]
+    email_verified: bool
+    created_at: datetime
+    updated_at: datetime
+
+
+class MatchStudent(TypedDict, total=False):
+    """The seven fields matching reads (MATCH_PROJECTION)"""
+
+    _id: ObjectId
+    name: str
+    email: str
+    department: str
+    college: str
+    course_ids: List[str]
+    study_spots: List[str]
+    study_times: List[str]
+
+
+class LoginStudent(TypedDict):
+    _id: ObjectId
+    name: str
+    email: str
+
+
+class Sender(TypedDict, total=False):
+    _id: ObjectId
+    name: str
+    email: str
+    department: str
+
+
+metrics.describe("studybuddy_db_queries_total", "MongoDB operations issued through the repository")
+
+_tally = threading.local()
+
+
+class QueryCounts:
+    def __init__(self):
+        self.by_operation = {}
+
+    @property
+    def total(self):
+        return sum(self.by_operation.values())
+
+
+@contextmanager
+def count_queries():
+    """Tally the repository queries made by this thread inside the block"""
+    previous = getattr(_tally, "counts", None)
+    counts = _tally.counts = QueryCounts()
+    try:
+        yield counts
+    finally:
+        _tally.counts = previous
+
+
+def _count(collection, operation):
+    metrics.inc("studybuddy_db_queries_total", collection=collection, op=operation)
+    counts = getattr(_tally, "counts", None)
+    if counts is not None:
+        key = f"{collection}.{operation}"
+        counts.by_operation[key] = counts.by_operation.get(key, 0) + 1
+
+
+# Students
+
+
+def get_profile(student_id) -> Optional[StudentProfile]:
+    def load():
+        _count("students", "find_one")
+        return students_collection.find_one({"_id": ObjectId(student_id)}, PROFILE_PROJECTION)
+
+    return profile_cache.get_or_load(str(student_id), load)
+
+
+def list_profiles() -> List[StudentProfile]:
+    def load():
+        _count("students", "find")
+        return list(students_collection.find({}, PROFILE_PROJECTION))
+
+    return profile_cache.get_or_load("*", load)
+
+
+def find_login(email) -> Optional[LoginStudent]:
+    _count("students", "find_one")
+    return students_collection.find_one({"email": email}, LOGIN_PROJECTION)
+
+
+def email_exists(email) -> bool:
+    _count("students", "find_one")
+    return students_collection.find_one({"email": email}, {"_id": 1}) is not None
+
+
+def existing_emails(emails: Iterable[str]) -> Set[str]:
+    """Which of the given emails are already registered, in one query"""
+    emails = list(emails)
+    if not emails:
+        return set()
+    _count("students", "find")
+    return {s["email"] for s in students_collection.find({"email": {"$in": emails}}, {"_id": 0, "email": 1})}
+
+
+def student_id_by_email(email) -> Optional[ObjectId]:
+    _count("students", "find_one")
+    student = students_collection.find_one({"email": email}, {"_id": 1})
+    return student["_id"] if student else None
+
+
+def get_sender(student_id) -> Optional[Sender]:
+    _count("students", "find_one")
+    return students_collection.find_one({"_id": ObjectId(student_id)}, SENDER_PROJECTION)
+
+
+def get_senders(student_ids) -> List[Sender]:
+    """Batch fetch of names, emails and departments"""
+    _count("students", "find")
+    return list(students_collection.find({"_id": {"$in": list(student_ids)}}, SENDER_PROJECTION))
+
+
+def new_student_doc(data, now=None, **extra) -> StudentProfile:
+    """A student document holding only STUDENT_FIELDS (email lowercased) plus timestamps"""
+    doc = {field: data[field] for field in STUDENT_FIELDS if field in data}
+    if "email" in doc:
+        doc["email"] = str(doc["email"]).strip().lower()
+    doc["created_at"] = doc["updated_at"] = now or datetime.utcnow()
+    doc.update(extra)
+    return doc
+
+
+def insert_student(doc: StudentProfile) -> ObjectId:
+    _count("students", "insert_one")
+    student_id = students_collection.insert_one(doc).inserted_id
+    generations.bump("profiles")
+    add_roster_members(doc.get("course_ids", []), student_id)
+    return student_id
+
+
+def insert_students(docs: List[StudentProfile]):
+    """Unordered insert_many; raises BulkWriteError listing the rows that failed"""
+    from pymongo.errors import BulkWriteError
+
+    _count("students", "insert_many")
+    try:
+        result = students_collection.insert_many(docs, ordered=False)
+    except BulkWriteError as e:
+        generations.bump("profiles")
+        failed = {err["index"] for err in e.details.get("writeErrors", [])}
+        _add_roster_batch([doc for i, doc in enumerate(docs) if i not in failed])
+        raise
+    generations.bump("profiles")
+    _add_roster_batch(docs)
+    return result
+
+
+def ensure_student_indexes():
+    _ensure_unique_email()
+    # Multikey; serves the anchored semester regex and per-course lookups
+    _count("students", "create_index")
+    students_collection.create_index("course_ids")
+    # Hard filters on /get_matches
+    for field in ("department", "college"):
+        _count("students", "create_index")
+        students_collection.create_index(field)
+
+
+def _ensure_unique_email():
+    """Unique index on email, replacing the older non-unique one"""
+    from pymongo.errors import DuplicateKeyError, OperationFailure
+
+    _count("students", "index_information")
+    for name, spec in students_collection.index_information().items():
+        if list(spec["key"]) == [("email", 1)] and not spec.get("unique"):
+            _count("students", "drop_index")
+            students_collection.drop_index(name)
+    try:
+        _count("students", "create_index")
+        students_collection.create_index("email", unique=True)
+    except (DuplicateKeyError, OperationFailure) as e:
+        if getattr(e, "code", None) != 11000:
+            raise
+        # Existing duplicates must be merged by hand; keep email lookups indexed meanwhile
+        log.warning("duplicate student emails; email index left non-unique", extra={"error": str(e)})
+        students_collection.create_index("email")
+
+
+def update_profile(student_id, fields) -> Optional[StudentProfile]:
+    """$set fields and return the updated profile in the same round trip (None if missing)"""
+    from pymongo import ReturnDocument
+
+    _count("students", "find_one_and_update")
+    if "course_ids" not in fields:
+        updated = students_collection.find_one_and_update(
+            {"_id": ObjectId(student_id)},
+            {"$set": fields},
+            projection=PROFILE_PROJECTION,
+            return_document=ReturnDocument.AFTER,
+        )
+        if updated is not None:
+            generations.bump("profiles")
+        return updated
+    # Course changes need the previous list to update rosters; the $set
+    # fields applied to it give the same document AFTER would return
+    before = students_collection.find_one_and_update(
+        {"_id": ObjectId(student_id)},
+        {"$set": fields},
+        projection=PROFILE_PROJECTION,
+        return_document=ReturnDocument.BEFORE,
+    )
+    if before is None:
+        return None
+    generations.bump("profiles")
+    old, new = set(before.get("course_ids", [])), set(fields["course_ids"])
+    remove_roster_members(old - new, before["_id"])
+    add_roster_members(new - old, before["_id"])
+    return {**before, **fields}
+
+
+def match_student(student_id) -> Optional[MatchStudent]:
+    _count("students", "find_one")
+    student = students_collection.find_one({"_id": ObjectId(student_id)}, MATCH_PROJECTION)
+    return semester.trim(student, semester.current())
+
+
+def match_candidates(student_ids) -> List[MatchStudent]:
+    """Batch fetch of shortlisted students"""
+    term = semester.current()
+    _count("students", "find")
+    return [
+        semester.trim(s, term)
+        for s in students_collection.find({"_id": {"$in": list(student_ids)}}, MATCH_PROJECTION)
+    ]
+
+
+def match_students_except(student_id, exclude=(), filters=None) -> List[MatchStudent]:
+    """Every other current-semester student, narrowed by an extra candidate query"""
+    term = semester.current()
+    _count("students", "find")
+    query = {**(filters or {}), "_id": {"$nin": [ObjectId(student_id), *exclude]}}
+    if semester.active_filter(term):
+        query = {"$and": [query, semester.active_filter(term)]}
+    return [semester.trim(s, term) for s in students_collection.find(query, MATCH_PROJECTION)]
+
+
+def candidate_ids(filters) -> List[ObjectId]:
+    """Ids of current-semester students matching a candidate query (indexed; no documents fetched)"""
+    term = semester.current()
+    query = {"$and": [filters, semester.active_filter(term)]} if semester.active_filter(term) else filters
+    _count("students", "find")
+    return [s["_id"] for s in students_collection.find(query, {"_id": 1})]
+
+
+def students_in_course(code) -> List[MatchStudent]:
+    term = semester.current()
+    _count("students", "find")
+    return [semester.trim(s, term) for s in students_collection.find({"course_ids": code}, MATCH_PROJECTION)]
+
+
+def students_in_department(department) -> List[MatchStudent]:
+    """Current-semester students of one department (department is indexed)"""
+    term = semester.current()
+    _count("students", "find")
+    query = {"department": department, **semester.active_filter(term)}
+    return [semester.trim(s, term) for s in students_collection.find(query, MATCH_PROJECTION)]
+
+
+def all_match_students():
+    """Every current-semester student's match fields (feature matrix builds), streamed"""
+    term = semester.current()
+    _count("students", "find")
+    return (semester.trim(s, term) for s in students_collection.find(semester.active_filter(term), MATCH_PROJECTION))
+
+
+def matrix_student(doc):
+    """doc as all_match_students() would yield it, or None when it is not a current-semester student"""
+    term = semester.current()
+    if term is not None and not any(c.startswith(term) for c in doc.get("course_ids", [])):
+        return None  # outside semester.active_filter(term)
+    return semester.trim(doc, term)
+
+
+def archive_stale_courses(term, batch_size=1000):
+    """Move course codes older than term from course_ids to archived_course_ids.<semester>.
+
+    Rosters keep the archived enrollments as history. Returns (students
+    updated, codes archived).
+    """
+    from pymongo import UpdateOne
+
+    ops, archived = [], 0
+
+    def flush():
+        if ops:
+            _count("students", "bulk_write")
+            students_collection.bulk_write(ops, ordered=False)
+            ops.clear()
+
+    _count("students", "find")
+    updated = 0
+    for student in students_collection.find({"course_ids": {"$exists": True}}, {"course_ids": 1}):
+        stale = [c for c in student.get("course_ids", []) if semester.is_stale(c, term)]
+        if not stale:
+            continue
+        by_semester = {}
+        for code in stale:
+            by_semester.setdefault(f"archived_course_ids.{semester.semester_of(code)}", []).append(code)
+        ops.append(
+            UpdateOne(
+                {"_id": student["_id"]},
+                {
+                    "$pull": {"course_ids": {"$in": stale}},
+                    "$addToSet": {field: {"$each": codes} for field, codes in by_semester.items()},
+                },
+            )
+        )
+        updated += 1
+        archived += len(stale)
+        if len(ops) >= batch_size:
+            flush()
+    flush()
+    if updated:
+        generations.bump("profiles")
+    return updated, archived
+
+
+# Courses
+
+
+def search_courses(query, limit=catalog.SEARCH_LIMIT):
+    def load():
+        _count("courses", "find")
+        return list(courses_collection.find(catalog.search_filter(query), catalog.COURSE_PROJECTION).limit(limit))
+
+    return catalog_cache.get_or_load(("search", query.lower(), limit), load)
+
+
+def courses_by_code(codes):
+    def load():
+        _count("courses", "find")
+        return list(courses_collection.find(catalog.names_filter(codes), catalog.COURSE_PROJECTION))
+
+    return catalog_cache.get_or_load(("codes", tuple(sorted(set(codes)))), load)
+
+
+def course_slots(codes):
+    """{course code: timetable bitmap} for the given codes"""
+    if not codes:
+        return {}
+    _count("courses", "find")
+    return timetable.load_course_slots(courses_collection, codes)
+
+
+def upsert_courses(docs):
+    """Upsert ingested course docs by code in one bulk write; returns (new, updated)"""
+    from pymongo import UpdateOne
+
+    # Last one wins when the feed repeats a code
+    docs = {d["code"]: d for d in docs}.values()
+    if not docs:
+        return 0, 0
+    _count("courses", "bulk_write")
+    result = courses_collection.bulk_write(
+        [UpdateOne({"code": d["code"]}, {"$set": d}, upsert=True) for d in docs], ordered=False
+    )
+    generations.bump("catalog")
+    return result.upserted_count, result.modified_count
+
+
+def count_courses():
+    _count("courses", "count_documents")
+    return courses_collection.count_documents({})
+
+
+# Course rosters
+
+
+def ensure_roster_indexes():
+    _count("course_members", "create_index")
+    members_collection.create_index([("course", 1), ("student_id", 1)], unique=True)
+    _count("course_rosters", "create_index")
+    rosters_collection.create_index([("count", -1)])
+
+
+def add_roster_members(codes, student_id):
+    """Add one student to courses; counters only move for memberships that were new"""
+    from pymongo import UpdateOne
+
+    codes = sorted(set(codes))
+    if not codes:
+        return
+    now = datetime.utcnow()
+    _count("course_members", "bulk_write")
+    result = members_collection.bulk_write(
+        [
+            UpdateOne(
+                {"course": code, "student_id": student_id},
+                {"$setOnInsert": {"joined_at": now}},
+                upsert=True,
+            )
+            for code in codes
+        ],
+        ordered=False,
+    )
+    _bump_rosters({codes[i]: 1 for i in result.upserted_ids}, now)
+
+
+def remove_roster_members(codes, student_id):
+    """Remove one student from courses; counters only move for rows actually deleted"""
+    codes = sorted(set(codes))
+    if not codes:
+        return
+    deltas = {}
+    for code in codes:
+        _count("course_members", "delete_one")
+        if members_collection.delete_one({"course": code, "student_id": student_id}).deleted_count:
+            deltas[code] = -1
+    _bump_rosters(deltas, datetime.utcnow())
+
+
+def _add_roster_batch(docs):
+    """Roster rows for freshly inserted students (no existing memberships to check)"""
+    now = datetime.utcnow()
+    rows, deltas = [], {}
+    for doc in docs:
+        for code in set(doc.get("course_ids", [])):
+            rows.append({"course": code, "student_id": doc["_id"], "joined_at": now})
+            deltas[code] = deltas.get(code, 0) + 1
+    if not rows:
+        return
+    from pymongo.errors import BulkWriteError
+
+    _count("course_members", "insert_many")
+    try:
+        members_collection.insert_many(rows, ordered=False)
+    except BulkWriteError as e:
+        # Rows that already existed must not be counted twice
+        for err in e.details.get("writeErrors", []):
+            deltas[rows[err["index"]]["course"]] -= 1
+    _bump_rosters(deltas, now)
+
+
+def _bump_rosters(deltas, now):
+    from pymongo import UpdateOne
+
+    ops = [
+        UpdateOne({"_id": code}, {"$inc": {"count": delta}, "$set": {"updated_at": now}}, upsert=True)
+        for code, delta in deltas.items()
+        if delta
+    ]
+    if ops:
+        _count("course_rosters", "bulk_write")
+        rosters_collection.bulk_write(ops, ordered=False)
+
+
+def roster_count(code) -> int:
+    _count("course_rosters", "find_one")
+    doc = rosters_collection.find_one({"_id": code}, {"count": 1})
+    return doc["count"] if doc else 0
+
+
+def roster_page(code, after=None, limit=50) -> List[ObjectId]:
+    """Student ids enrolled in a course, in id order, starting after the given id"""
+    query = {"course": code}
+    if after is not None:
+        query["student_id"] = {"$gt": ObjectId(after)}
+    _count("course_members", "find")
+    cursor = members_collection.find(query, {"_id": 0, "student_id": 1}).sort("student_id", 1).limit(limit)
+    return [row["student_id"] for row in cursor]
+
+
+def popular_courses(limit=20):
+    """[{"_id": code, "count": n}] for the most enrolled courses this semester"""
+    query = {"count": {"$gt": 0}}
+    term = semester.current()
+    if term is not None:
+        query["_id"] = {"$regex": f"^{term}"}
+    _count("course_rosters", "find")
+    return list(rosters_collection.find(query, {"count": 1}).sort("count", -1).limit(limit))
+
+
+def rebuild_rosters():
+    """Recompute every roster from the students collection (one-off backfill); returns courses written.
+
+    Archived semesters count too, the same history archive_stale_courses leaves in place.
+    """
+    from pymongo import UpdateOne
+
+    ensure_roster_indexes()
+    now = datetime.utcnow()
+    counts, ops = {}, []
+    _count("students", "find")
+    for student in students_collection.find({}, {"course_ids": 1, "archived_course_ids": 1}):
+        codes = set(student.get("course_ids", []))
+        for archived in (student.get("archived_course_ids") or {}).values():
+            codes.update(archived)
+        for code in codes:
+            counts[code] = counts.get(code, 0) + 1
+            ops.append(
+                UpdateOne(
+                    {"course": code, "student_id": student["_id"]},
+                    {"$setOnInsert": {"joined_at": now}},
+                    upsert=True,
+                )
+            )
+            if len(ops) >= 1000:
+                _count("course_members", "bulk_write")
+                members_collection.bulk_write(ops, ordered=False)
+                ops = []
+    if ops:
+        _count("course_members", "bulk_write")
+        members_collection.bulk_write(ops, ordered=False)
+    # Absolute counts, so concurrent or repeated rebuilds converge
+    if counts:
+        _count("course_rosters", "bulk_write")
+        rosters_collection.bulk_write(
+            [
+                UpdateOne({"_id": code}, {"$set": {"count": n, "updated_at": now}}, upsert=True)
+                for code, n in counts.items()
+            ],
+            ordered=False,
+        )
+    return len(counts)
+
+
+def ensure_rosters():
+    """Indexes, plus a backfill the first time rosters are used on an existing database"""
+    ensure_roster_indexes()
+    _count("course_rosters", "find_one")
+    if rosters_collection.find_one({}, {"_id": 1}) is None:
+        return rebuild_rosters()
+    return 0
+
+
+# OTPs
+
+
+def store_otp(email, otp):
+    now = datetime.utcnow()
+    _count("otps", "update_one")
+    otp_collection.update_one(
+        {"email": email},
+        {"$set": {"email": email, "otp": otp, "created_at": now, "expires_at": now + OTP_TTL, "verified": False}},
+        upsert=True,
+    )
+
+
+def verify_otp(email, otp) -> bool:
+    """Mark a matching, unexpired, unverified OTP as verified in one atomic update"""
+    _count("otps", "update_one")
+    result = otp_collection.update_one(
+        {"email": email, "otp": otp, "verified": False, "expires_at": {"$gt": datetime.utcnow()}},
+        {"$set": {"verified": True}},
+    )
+    return result.modified_count > 0
+
+
+def has_verified_otp(email) -> bool:
+    _count("otps", "find_one")
+    doc = otp_collection.find_one(
+        {"email": email, "verified": True, "expires_at": {"$gt": datetime.utcnow()}}, {"_id": 1}
+    )
+    return doc is not None
+
+
+def delete_otp(email):
+    _count("otps", "delete_one")
+    otp_collection.delete_one({"email": email})
+
+
+# Match events
+
+
+def log_match_events(events):
+    """Record ranker training signals without waiting for the write to be acknowledged"""
+    if not events:
+        return
+    from pymongo import WriteConcern
+
+    _count(ranker.EVENTS_COLLECTION, "insert_many")
+    match_events_collection.with_options(write_concern=WriteConcern(w=0)).insert_many(events, ordered=False)
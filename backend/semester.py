@@ -0,0 +1,89 @@
+"""
+Semester partitioning of course selections.
+
+NTHU course codes start with the ROC academic year and term:
+"1132OAES 510000" is year 113, term 2, semester "1132". Students keep
+their old codes forever, which would grow the matching vocabulary every
+term, so matching only sees the current semester:
+
+    - candidates are students with at least one current-semester course
+      (an anchored regex on the indexed course_ids field)
+    - course_ids are trimmed to the current semester before scoring
+    - after each NTHU catalog refresh, older codes are moved from
+      course_ids to archived_course_ids.<semester>
+
+The current semester is the most common one in the last catalog feed,
+stored in the `settings` collection so every worker agrees; workers cache
+it until the "semester" generation is bumped (see generations.py). Set
+CURRENT_SEMESTER to pin it. Until either exists nothing is partitioned.
+Codes without a semester prefix are always kept.
+"""
+
+import os
+import re
+from collections import Counter
+from datetime import datetime
+
+import db
+import generations
+
+SEMESTER_PATTERN = re.compile(r"^(\d{4})")
+PINNED_SEMESTER = os.getenv("CURRENT_SEMESTER", "").strip() or None
+
+settings_collection = db.LazyCollection("settings")
+
+_cache = generations.GenerationCache("semester", size=1)
+
+
+def semester_of(code):
+    match = SEMESTER_PATTERN.match(code or "")
+    return match.group(1) if match else None
+
+
+def feed_semester(codes):
+    """Most common semester among a catalog feed's course codes"""
+    counts = Counter(filter(None, (semester_of(c) for c in codes)))
+    return counts.most_common(1)[0][0] if counts else None
+
+
+def current():
+    """The current semester, e.g. "1132", or None when not known yet"""
+    if PINNED_SEMESTER:
+        return PINNED_SEMESTER
+
+    def load():
+        doc = settings_collection.find_one({"_id": "current_semester"}, {"value": 1})
+        return doc["value"] if doc else None
+
+    return _cache.get_or_load("current", load)
+
+
+def set_current(term):
+    settings_collection.update_one(
+        {"_id": "current_semester"}, {"$set": {"value": term, "updated_at": datetime.utcnow()}}, upsert=True
+    )
+    generations.bump("semester")
+
+
+def is_stale(code, term):
+    found = semester_of(code)
+    return found is not None and found < term
+
+
+def in_term(code, term):
+    found = semester_of(code)
+    return found is None or found == term
+
+
+def trim(student, term):
+    """Student document with course_ids limited to the given semester (unchanged when term is None)"""
+    if term is None or not student or "course_ids" not in student:
+        return student
+    return {**student, "course_ids": [c for c in student["course_ids"] if in_term(c, term)]}
+
+
+def active_filter(term):
+    """Query for students taking at least one course this semester"""
+    if term is None:
+        return {}
+    return {"course_ids": {"$regex": f"^{re.escape(term)}"}}
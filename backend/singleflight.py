@@ -0,0 +1,161 @@
+"""
+Single-flight: concurrent callers asking for the same computation share one run.
+
+    body, status = singleflight.do(f"get_matches:{student_id}", compute, shared=True)
+
+Within a process, the first caller for a key runs `fn` and the others wait
+on it and get the same result (or exception). With shared=True the leader
+also takes an flock in SINGLEFLIGHT_DIR, so callers in other workers on
+the host wait for it too, then read the result it left behind (JSON, so
+tuples come back as lists). Keys are hashed onto SINGLEFLIGHT_LOCK_STRIPES
+lock files, so arbitrary keys (search text, filter combinations) cannot
+grow the directory; two keys sharing a stripe only queue behind each
+other. Results are per key and pruned after RESULT_TTL_SECONDS. A result only counts if it
+was written after the caller arrived; anything older is recomputed.
+A caller that waits longer than `wait` seconds runs `fn` itself.
+"""
+
+import fcntl
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+
+import logs
+import metrics
+
+_DEFAULT_DIR = "/dev/shm/studybuddy-singleflight" if os.path.isdir("/dev/shm") else os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "data", "singleflight"
+)
+SINGLEFLIGHT_DIR = os.getenv("SINGLEFLIGHT_DIR", _DEFAULT_DIR)
+WAIT_SECONDS = float(os.getenv("SINGLEFLIGHT_WAIT_SECONDS", 30))
+LOCK_STRIPES = int(os.getenv("SINGLEFLIGHT_LOCK_STRIPES", 1024))
+RESULT_TTL_SECONDS = 60
+POLL_SECONDS = 0.01
+PRUNE_PROBABILITY = 1 / 64
+
+metrics.describe("studybuddy_singleflight_runs_total", "Computations actually executed per key prefix")
+metrics.describe("studybuddy_singleflight_coalesced_total", "Callers served another caller's result")
+
+log = logs.get_logger("singleflight")
+
+_MISSING = object()
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+_calls = {}
+_lock = threading.Lock()
+
+
+def _kind(key):
+    return key.split(":", 1)[0]
+
+
+def do(key, fn, shared=False, wait=None):
+    """fn() run once for all concurrent callers with the same key"""
+    wait = WAIT_SECONDS if wait is None else wait
+    with _lock:
+        call = _calls.get(key)
+        leader = call is None
+        if leader:
+            call = _calls[key] = _Call()
+    if not leader:
+        if call.done.wait(wait):
+            metrics.inc("studybuddy_singleflight_coalesced_total", kind=_kind(key), scope="process")
+            if call.error is not None:
+                raise call.error
+            return call.result
+        return _run(key, fn)
+
+    try:
+        call.result = _run_shared(key, fn, wait) if shared else _run(key, fn)
+        return call.result
+    except Exception as e:
+        call.error = e
+        raise
+    finally:
+        with _lock:
+            _calls.pop(key, None)
+        call.done.set()
+
+
+def _run(key, fn):
+    metrics.inc("studybuddy_singleflight_runs_total", kind=_kind(key))
+    return fn()
+
+
+def _paths(key):
+    name = hashlib.sha1(key.encode("utf-8")).hexdigest()
+    stripe = int(name, 16) % LOCK_STRIPES
+    return os.path.join(SINGLEFLIGHT_DIR, f"stripe-{stripe}.lock"), os.path.join(SINGLEFLIGHT_DIR, f"{name}.json")
+
+
+def _read_result(path, arrived_ns):
+    try:
+        if os.stat(path).st_mtime_ns < arrived_ns:
+            return _MISSING
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return _MISSING
+
+
+def _write_result(path, result):
+    try:
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(result, f, default=str)
+        os.replace(tmp_path, path)
+    except (OSError, TypeError, ValueError) as e:
+        log.warning("single-flight result not shared", extra={"error": str(e)})
+
+
+def _prune():
+    cutoff = time.time() - RESULT_TTL_SECONDS
+    for name in os.listdir(SINGLEFLIGHT_DIR):
+        path = os.path.join(SINGLEFLIGHT_DIR, name)
+        try:
+            if name.endswith(".json") and os.stat(path).st_mtime < cutoff:
+                os.remove(path)
+        except OSError:
+            pass
+
+
+def _run_shared(key, fn, wait):
+    os.makedirs(SINGLEFLIGHT_DIR, exist_ok=True)
+    lock_path, result_path = _paths(key)
+    arrived_ns = time.time_ns()
+    fd = os.open(lock_path, os.O_RDWR | os.O_CREAT, 0o600)
+    try:
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            # Another worker is computing this key (or one on the same stripe); wait for it
+            deadline = time.monotonic() + wait
+            while True:
+                time.sleep(POLL_SECONDS)
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    break
+                except BlockingIOError:
+                    if time.monotonic() > deadline:
+                        return _run(key, fn)
+            result = _read_result(result_path, arrived_ns)
+            if result is not _MISSING:
+                metrics.inc("studybuddy_singleflight_coalesced_total", kind=_kind(key), scope="host")
+                return result
+        result = _run(key, fn)
+        _write_result(result_path, result)
+        if random.random() < PRUNE_PROBABILITY:
+            _prune()
+        return result
+    finally:
+        os.close(fd)
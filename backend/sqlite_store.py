@@ -0,0 +1,1047 @@
+"""
+Embedded single-file storage with the MongoDB collection API the app uses.
+
+STORAGE_BACKEND=sqlite makes db.get_client() return a SQLiteClient, so the
+app, scripts and benchmarks run against a local SQLite file (SQLITE_PATH)
+instead of a cluster. Only the part of pymongo this code base calls is
+implemented, with MongoDB's semantics:
+
+    find / find_one / count_documents / distinct, cursors with sort,
+    skip and limit; insert_one / insert_many; update_one / update_many /
+    replace_one / find_one_and_update with upsert; delete_one /
+    delete_many; bulk_write; create_index (unique, compound) / drop_index
+
+    query:  $eq $ne $gt $gte $lt $lte $in $nin $exists $regex $not
+            $elemMatch $size $all $or $and $nor
+    update: $set $unset $inc $min $max $setOnInsert $push $addToSet $pull
+
+Each collection is a table of (id, doc) rows. doc is Extended JSON
+(bson.json_util), so ObjectId and datetime values round-trip and rows can
+be inspected with SQLite's JSON functions. Index entries live in one
+table keyed by (collection, index, key): array fields are multikey and
+missing fields index as null, as in MongoDB. Equality, $in and anchored
+prefix regexes on _id or a single-field index read candidates from it;
+anything else scans. Unique indexes raise DuplicateKeyError, or
+BulkWriteError for batches, with code 11000.
+
+There are no change streams: watch() raises OperationFailure code 40573,
+as a standalone mongod does, and change feeds fall back to polling. Writes run in BEGIN IMMEDIATE
+transactions on a WAL database, so worker processes can share one file.
+"""
+
+import asyncio
+import copy
+import itertools
+import json
+import os
+import re
+import sqlite3
+import threading
+from datetime import datetime
+
+from bson import ObjectId, json_util
+from pymongo import DeleteMany, DeleteOne, InsertOne, ReplaceOne, UpdateMany, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError, OperationFailure
+
+JSON_OPTIONS = json_util.JSONOptions(json_mode=json_util.JSONMode.RELAXED, tz_aware=False)
+
+# Bound parameters per IN (...) lookup
+LOOKUP_CHUNK = 500
+SCAN_PAGE = 500
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS _indexes (
+    coll TEXT NOT NULL, name TEXT NOT NULL, fields TEXT NOT NULL, uniq INTEGER NOT NULL,
+    PRIMARY KEY (coll, name)
+);
+CREATE TABLE IF NOT EXISTS _index_entries (
+    coll TEXT NOT NULL, idx TEXT NOT NULL, key TEXT NOT NULL, id TEXT NOT NULL, uniq INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS _index_entries_lookup ON _index_entries (coll, idx, key, id);
+CREATE INDEX IF NOT EXISTS _index_entries_doc ON _index_entries (coll, id);
+CREATE UNIQUE INDEX IF NOT EXISTS _index_entries_unique ON _index_entries (coll, idx, key) WHERE uniq = 1;
+"""
+
+
+def _dumps(doc):
+    return json_util.dumps(doc, json_options=JSON_OPTIONS)
+
+
+def _loads(text):
+    return json_util.loads(text, json_options=JSON_OPTIONS)
+
+
+# Values
+
+
+def _key(value):
+    """Type-tagged string for index keys and _id; equal Mongo values give equal keys"""
+    if value is None:
+        return "z:"
+    if isinstance(value, bool):
+        return f"b:{int(value)}"
+    if isinstance(value, (int, float)):
+        return f"n:{float(value)!r}"
+    if isinstance(value, str):
+        return f"s:{value}"
+    if isinstance(value, ObjectId):
+        return f"o:{value}"
+    if isinstance(value, datetime):
+        return f"d:{_loads(_dumps(value)).isoformat()}"
+    return "j:" + json.dumps(json.loads(_dumps(value)), sort_keys=True, separators=(",", ":"))
+
+
+def _type_class(value):
+    if isinstance(value, bool):
+        return "bool"
+    if isinstance(value, (int, float)):
+        return "number"
+    if isinstance(value, str):
+        return "string"
+    if isinstance(value, datetime):
+        return "date"
+    if isinstance(value, ObjectId):
+        return "objectid"
+    return None
+
+
+# Canonical BSON sort order across types
+_SORT_RANK = {None: 0, "number": 2, "string": 3, "object": 4, "array": 5, "objectid": 7, "bool": 8, "date": 9}
+
+
+def _sort_value(value, descending):
+    if isinstance(value, list):
+        if not value:
+            return (_SORT_RANK["array"], 0)
+        value = max(value, key=lambda v: _sort_value(v, descending)) if descending else min(
+            value, key=lambda v: _sort_value(v, descending)
+        )
+    if value is None:
+        return (0, 0)
+    cls = _type_class(value)
+    if cls is None:
+        return (_SORT_RANK["object"], _key(value))
+    return (_SORT_RANK[cls], value)
+
+
+def _eq(a, b):
+    if isinstance(a, bool) != isinstance(b, bool):
+        return False
+    return a == b
+
+
+def _resolve(value, parts):
+    """Values at a dotted path, descending into arrays of documents like MongoDB"""
+    if not parts:
+        return [value]
+    head, rest = parts[0], parts[1:]
+    if isinstance(value, dict):
+        return _resolve(value[head], rest) if head in value else []
+    if isinstance(value, list):
+        found = []
+        if head.isdigit() and int(head) < len(value):
+            found += _resolve(value[int(head)], rest)
+        for item in value:
+            if isinstance(item, dict):
+                found += _resolve(item, parts)
+        return found
+    return []
+
+
+def _values(doc, path):
+    return _resolve(doc, path.split("."))
+
+
+def _flatten(values):
+    """Each value, plus the elements of array values"""
+    for value in values:
+        yield value
+        if isinstance(value, list):
+            yield from value
+
+
+def _regex(pattern, options=""):
+    if isinstance(pattern, re.Pattern):
+        return pattern
+    flags = 0
+    for option, flag in (("i", re.IGNORECASE), ("m", re.MULTILINE), ("s", re.DOTALL), ("x", re.VERBOSE)):
+        if option in (options or ""):
+            flags |= flag
+    return re.compile(pattern, flags)
+
+
+def _index_values(doc, path):
+    """Index entries for one field: array elements (multikey), or null when missing"""
+    values = _values(doc, path)
+    if not values:
+        return [None]
+    found = []
+    for value in values:
+        found += value if isinstance(value, list) else [value]
+    return found
+
+
+# Queries
+
+
+def _equals_any(values, target):
+    if isinstance(target, re.Pattern):
+        return any(isinstance(v, str) and target.search(v) for v in _flatten(values))
+    if target is None and (not values or any(v is None for v in values)):
+        return True
+    return any(_eq(v, target) for v in _flatten(values))
+
+
+def _compare(values, target, op):
+    cls = _type_class(target)
+    for value in _flatten(values):
+        if isinstance(value, list) or _type_class(value) != cls:
+            continue
+        if (
+            (op == "$gt" and value > target)
+            or (op == "$gte" and value >= target)
+            or (op == "$lt" and value < target)
+            or (op == "$lte" and value <= target)
+        ):
+            return True
+    return False
+
+
+def _is_operator_dict(cond):
+    return isinstance(cond, dict) and cond and all(k.startswith("$") for k in cond)
+
+
+def _match_values(values, cond):
+    """Whether the values found at one path satisfy a field condition"""
+    if not _is_operator_dict(cond):
+        return _equals_any(values, cond)
+    for op, arg in cond.items():
+        if op == "$options":
+            continue
+        if op == "$eq":
+            ok = _equals_any(values, arg)
+        elif op == "$ne":
+            ok = not _equals_any(values, arg)
+        elif op in ("$gt", "$gte", "$lt", "$lte"):
+            ok = _compare(values, arg, op)
+        elif op == "$in":
+            ok = any(_equals_any(values, item) for item in arg)
+        elif op == "$nin":
+            ok = not any(_equals_any(values, item) for item in arg)
+        elif op == "$exists":
+            ok = bool(values) == bool(arg)
+        elif op == "$regex":
+            pattern = _regex(arg, cond.get("$options", ""))
+            ok = any(isinstance(v, str) and pattern.search(v) for v in _flatten(values))
+        elif op == "$not":
+            ok = not _match_values(values, arg if _is_operator_dict(arg) else {"$regex": arg})
+        elif op == "$size":
+            ok = any(isinstance(v, list) and len(v) == arg for v in values)
+        elif op == "$all":
+            ok = all(_equals_any(values, item) for item in arg)
+        elif op == "$elemMatch":
+            ok = any(
+                isinstance(v, list)
+                and any(
+                    _match(item, arg) if isinstance(item, dict) and not _is_operator_dict(arg) else _match_values([item], arg)
+                    for item in v
+                )
+                for v in values
+            )
+        else:
+            raise OperationFailure(f"unknown operator: {op}", code=2)
+        if not ok:
+            return False
+    return True
+
+
+def _match(doc, query):
+    for field, cond in (query or {}).items():
+        if field == "$or":
+            ok = any(_match(doc, q) for q in cond)
+        elif field == "$and":
+            ok = all(_match(doc, q) for q in cond)
+        elif field == "$nor":
+            ok = not any(_match(doc, q) for q in cond)
+        elif field.startswith("$"):
+            raise OperationFailure(f"unknown top level operator: {field}", code=2)
+        else:
+            ok = _match_values(_values(doc, field), cond)
+        if not ok:
+            return False
+    return True
+
+
+_LITERAL_PREFIX = re.compile(r"^\^((?:\\.|[^.^$*+?{}\[\]|()\\])*)$")
+
+
+def _lookup_keys(cond):
+    """Index keys that cover every match of a field condition, or None if it cannot use an index"""
+    if not isinstance(cond, dict):
+        # Missing fields are indexed as null, so {field: None} can use an index too
+        if isinstance(cond, (list, re.Pattern)):
+            return None
+        return [_key(cond)]
+    if set(cond) == {"$eq"}:
+        return _lookup_keys(cond["$eq"])
+    if set(cond) == {"$in"}:
+        keys = []
+        for item in cond["$in"]:
+            item_keys = _lookup_keys(item)
+            if item_keys is None:
+                return None
+            keys += item_keys
+        return keys
+    return None
+
+
+def _lookup_prefix(cond):
+    """String prefix for an anchored, case-sensitive literal regex"""
+    if not isinstance(cond, dict) or set(cond) - {"$regex", "$options"} or cond.get("$options"):
+        return None
+    pattern = cond.get("$regex")
+    match = _LITERAL_PREFIX.match(pattern) if isinstance(pattern, str) else None
+    return re.sub(r"\\(.)", r"\1", match.group(1)) if match else None
+
+
+# Projection and updates
+
+
+def _project(doc, projection):
+    if projection is None:
+        return doc
+    if isinstance(projection, (list, tuple)):
+        projection = {field: 1 for field in projection}
+    include = any(v for k, v in projection.items() if k != "_id")
+    if include:
+        out = {}
+        if projection.get("_id", 1) and "_id" in doc:
+            out["_id"] = doc["_id"]
+        for field, on in projection.items():
+            if field == "_id" or not on:
+                continue
+            source, target, parts = doc, out, field.split(".")
+            for part in parts[:-1]:
+                if not isinstance(source, dict) or not isinstance(source.get(part), dict):
+                    source = None
+                    break
+                source = source[part]
+                target = target.setdefault(part, {})
+            if isinstance(source, dict) and parts[-1] in source:
+                target[parts[-1]] = source[parts[-1]]
+        return out
+    out = copy.deepcopy(doc)
+    for field, on in projection.items():
+        if not on:
+            _unset(out, field)
+    return out
+
+
+def _parent(doc, path, create):
+    parts = path.split(".")
+    target = doc
+    for part in parts[:-1]:
+        if isinstance(target, list) and part.isdigit():
+            target = target[int(part)]
+            continue
+        if part not in target:
+            if not create:
+                return None, parts[-1]
+            target[part] = {}
+        target = target[part]
+    return target, parts[-1]
+
+
+def _get(doc, path, default=None):
+    parent, last = _parent(doc, path, create=False)
+    if isinstance(parent, dict):
+        return parent.get(last, default)
+    return default
+
+
+def _set(doc, path, value):
+    parent, last = _parent(doc, path, create=True)
+    if isinstance(parent, list) and last.isdigit():
+        parent[int(last)] = value
+    else:
+        parent[last] = value
+
+
+def _unset(doc, path):
+    parent, last = _parent(doc, path, create=False)
+    if isinstance(parent, dict):
+        parent.pop(last, None)
+
+
+def _pull_matches(item, cond):
+    if _is_operator_dict(cond):
+        return _match_values([item], cond)
+    if isinstance(cond, dict) and isinstance(item, dict):
+        return _match(item, cond)
+    return _eq(item, cond)
+
+
+def _apply_update(doc, update, inserting):
+    """Apply update operators (or a replacement) to doc in place"""
+    if not any(k.startswith("$") for k in update):
+        kept = doc.get("_id")
+        doc.clear()
+        doc.update(copy.deepcopy(update))
+        if kept is not None:
+            doc["_id"] = kept
+        return
+    for op, fields in update.items():
+        if op == "$setOnInsert" and not inserting:
+            continue
+        for path, arg in fields.items():
+            current = _get(doc, path)
+            if op in ("$set", "$setOnInsert"):
+                _set(doc, path, copy.deepcopy(arg))
+            elif op == "$unset":
+                _unset(doc, path)
+            elif op == "$inc":
+                _set(doc, path, (current or 0) + arg)
+            elif op == "$min":
+                if current is None or arg < current:
+                    _set(doc, path, arg)
+            elif op == "$max":
+                if current is None or arg > current:
+                    _set(doc, path, arg)
+            elif op in ("$push", "$addToSet"):
+                items = arg["$each"] if isinstance(arg, dict) and "$each" in arg else [arg]
+                array = list(current) if isinstance(current, list) else []
+                if current is not None and not isinstance(current, list):
+                    raise OperationFailure(f"The field '{path}' must be an array", code=2)
+                for item in items:
+                    if op == "$push" or not any(_eq(existing, item) for existing in array):
+                        array.append(copy.deepcopy(item))
+                _set(doc, path, array)
+            elif op == "$pull":
+                if isinstance(current, list):
+                    _set(doc, path, [item for item in current if not _pull_matches(item, arg)])
+            else:
+                raise OperationFailure(f"Unknown modifier: {op}", code=9)
+
+
+def _upsert_seed(query):
+    """Document an upsert starts from: the query's top-level equality fields"""
+    doc = {}
+    for field, cond in (query or {}).items():
+        if field.startswith("$"):
+            continue
+        if _is_operator_dict(cond):
+            if set(cond) == {"$eq"}:
+                _set(doc, field, copy.deepcopy(cond["$eq"]))
+            continue
+        _set(doc, field, copy.deepcopy(cond))
+    return doc
+
+
+# Results
+
+
+class InsertOneResult:
+    def __init__(self, inserted_id):
+        self.inserted_id = inserted_id
+        self.acknowledged = True
+
+
+class InsertManyResult:
+    def __init__(self, inserted_ids):
+        self.inserted_ids = inserted_ids
+        self.acknowledged = True
+
+
+class UpdateResult:
+    def __init__(self, matched_count, modified_count, upserted_id=None):
+        self.matched_count = matched_count
+        self.modified_count = modified_count
+        self.upserted_id = upserted_id
+        self.acknowledged = True
+
+
+class DeleteResult:
+    def __init__(self, deleted_count):
+        self.deleted_count = deleted_count
+        self.acknowledged = True
+
+
+class BulkWriteResult:
+    def __init__(self):
+        self.inserted_count = 0
+        self.matched_count = 0
+        self.modified_count = 0
+        self.deleted_count = 0
+        self.upserted_ids = {}
+        self.acknowledged = True
+
+    @property
+    def upserted_count(self):
+        return len(self.upserted_ids)
+
+    def details(self, write_errors):
+        return {
+            "writeErrors": write_errors,
+            "writeConcernErrors": [],
+            "nInserted": self.inserted_count,
+            "nUpserted": self.upserted_count,
+            "nMatched": self.matched_count,
+            "nModified": self.modified_count,
+            "nRemoved": self.deleted_count,
+            "upserted": [{"index": i, "_id": _id} for i, _id in self.upserted_ids.items()],
+        }
+
+
+# Client, database, collection
+
+
+class _Transaction:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        self.conn.execute("BEGIN IMMEDIATE")
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        self.conn.execute("COMMIT" if exc_type is None else "ROLLBACK")
+        return False
+
+
+class SQLiteClient:
+    """MongoClient stand-in over one SQLite file; one connection per thread"""
+
+    def __init__(self, path):
+        self.path = path
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._local = threading.local()
+        self._tables = set()
+        self._tables_lock = threading.Lock()
+        self.admin = _Admin(self)
+
+    def connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(SCHEMA)
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def table(self, coll):
+        name = f'"c_{coll}"'
+        if coll not in self._tables:
+            with self._tables_lock:
+                self.connection().execute(
+                    f"CREATE TABLE IF NOT EXISTS {name} (id TEXT PRIMARY KEY, doc TEXT NOT NULL)"
+                )
+                self._tables.add(coll)
+        return name
+
+    def __getitem__(self, name):
+        return Database(self, name)
+
+    def get_database(self, name):
+        return Database(self, name)
+
+    def close(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None and self._local.pid == os.getpid():
+            conn.close()
+        self._local.conn = None
+
+
+class _Admin:
+    def __init__(self, client):
+        self._client = client
+
+    def command(self, name, *args, **kwargs):
+        if name == "ping":
+            self._client.connection().execute("SELECT 1").fetchone()
+            return {"ok": 1.0}
+        raise OperationFailure(f"no such command: {name}", code=59)
+
+
+class Database:
+    def __init__(self, client, name):
+        self.client = client
+        self.name = name
+
+    def __getitem__(self, name):
+        return Collection(self, name)
+
+    def get_collection(self, name, **kwargs):
+        return Collection(self, name)
+
+    def list_collection_names(self):
+        rows = self.client.connection().execute(
+            "SELECT substr(name, 3) FROM sqlite_master WHERE type = 'table' AND name LIKE 'c\\_%' ESCAPE '\\'"
+        )
+        return [row[0] for row in rows]
+
+
+class Collection:
+    def __init__(self, database, name):
+        self.database = database
+        self.name = name
+        self._client = database.client
+        self._table = self._client.table(name)
+
+    def __repr__(self):
+        return f"sqlite_store.Collection({self.name!r})"
+
+    def with_options(self, **kwargs):
+        # Write concerns and read preferences have no meaning for one local file
+        return self
+
+    def watch(self, *args, **kwargs):
+        raise OperationFailure("The $changeStream stage is only supported on replica sets", 40573)
+
+    # Indexes
+
+    def _keys(self, conn):
+        """[(name, [(field, direction)], unique)]; older files store bare field names"""
+        rows = conn.execute("SELECT name, fields, uniq FROM _indexes WHERE coll = ?", (self.name,))
+        return [
+            (name, [(k, 1) if isinstance(k, str) else tuple(k) for k in json.loads(fields)], bool(uniq))
+            for name, fields, uniq in rows
+        ]
+
+    def _specs(self, conn):
+        return [(name, [field for field, _ in keys], unique) for name, keys, unique in self._keys(conn)]
+
+    def create_index(self, keys, unique=False, name=None, **kwargs):
+        if isinstance(keys, str):
+            keys = [(keys, 1)]
+        keys = [(field, direction) for field, direction in keys]
+        fields = [field for field, _ in keys]
+        name = name or "_".join(f"{field}_{direction}" for field, direction in keys)
+        with self._write() as conn:
+            existing = next((spec for spec in self._keys(conn) if spec[0] == name), None)
+            if existing:
+                if existing[1] != keys or existing[2] != bool(unique):
+                    raise OperationFailure(f"Index with name: {name} already exists with different options", 85)
+                return name
+            conn.execute(
+                "INSERT INTO _indexes (coll, name, fields, uniq) VALUES (?, ?, ?, ?)",
+                (self.name, name, json.dumps(keys), int(unique)),
+            )
+            spec = [(name, fields, unique)]
+            for row_id, text in conn.execute(f"SELECT id, doc FROM {self._table}").fetchall():
+                self._index(conn, row_id, _loads(text), spec)
+        return name
+
+    def index_information(self):
+        info = {"_id_": {"key": [("_id", 1)]}}
+        for name, keys, unique in self._keys(self._client.connection()):
+            info[name] = {"key": keys, **({"unique": True} if unique else {})}
+        return info
+
+    def drop_index(self, name):
+        with self._write() as conn:
+            if not conn.execute("DELETE FROM _indexes WHERE coll = ? AND name = ?", (self.name, name)).rowcount:
+                raise OperationFailure(f"index not found with name [{name}]", 27)
+            conn.execute("DELETE FROM _index_entries WHERE coll = ? AND idx = ?", (self.name, name))
+
+    def drop_indexes(self):
+        with self._write() as conn:
+            conn.execute("DELETE FROM _index_entries WHERE coll = ?", (self.name,))
+            conn.execute("DELETE FROM _indexes WHERE coll = ?", (self.name,))
+
+    def _index(self, conn, row_id, doc, specs):
+        for name, fields, unique in specs:
+            per_field = [[_key(v) for v in _index_values(doc, f)] for f in fields]
+            keys = {"\x1f".join(combo) for combo in itertools.product(*per_field)}
+            try:
+                conn.executemany(
+                    "INSERT INTO _index_entries (coll, idx, key, id, uniq) VALUES (?, ?, ?, ?, ?)",
+                    [(self.name, name, key, row_id, int(unique)) for key in keys],
+                )
+            except sqlite3.IntegrityError:
+                raise DuplicateKeyError(
+                    f"E11000 duplicate key error collection: {self.name} index: {name}", 11000
+                ) from None
+
+    # Reads
+
+    def _candidates(self, conn, query):
+        """(id, doc) rows that may match: an index lookup when the query allows one, else a scan"""
+        specs = {fields[0]: name for name, fields, _ in self._specs(conn) if len(fields) == 1}
+        for field, cond in (query or {}).items():
+            if field.startswith("$") or (field != "_id" and field not in specs):
+                continue
+            keys = _lookup_keys(cond)
+            if keys is not None:
+                return self._by_keys(conn, field, specs.get(field), keys)
+            prefix = _lookup_prefix(cond)
+            if prefix is not None:
+                bounds = (f"s:{prefix}", f"s:{prefix}\U0010ffff")
+                if field == "_id":
+                    sql = f"SELECT id, doc FROM {self._table} WHERE id >= ? AND id < ? ORDER BY rowid"
+                    params = bounds
+                else:
+                    sql = (
+                        f"SELECT id, doc FROM {self._table} WHERE id IN ("
+                        "SELECT id FROM _index_entries WHERE coll = ? AND idx = ? AND key >= ? AND key < ?"
+                        ") ORDER BY rowid"
+                    )
+                    params = (self.name, specs[field], *bounds)
+                return conn.execute(sql, params).fetchall()
+        return self._scan(conn)
+
+    def _by_keys(self, conn, field, index, keys):
+        rows = []
+        keys = list(dict.fromkeys(keys))
+        for start in range(0, len(keys), LOOKUP_CHUNK):
+            chunk = keys[start : start + LOOKUP_CHUNK]
+            marks = ",".join("?" * len(chunk))
+            if field == "_id":
+                sql = f"SELECT rowid, id, doc FROM {self._table} WHERE id IN ({marks})"
+                params = chunk
+            else:
+                sql = (
+                    f"SELECT rowid, id, doc FROM {self._table} WHERE id IN ("
+                    f"SELECT id FROM _index_entries WHERE coll = ? AND idx = ? AND key IN ({marks}))"
+                )
+                params = [self.name, index, *chunk]
+            rows += conn.execute(sql, params).fetchall()
+        rows.sort()
+        return [(row_id, text) for _, row_id, text in rows]
+
+    def _scan(self, conn):
+        last = 0
+        while True:
+            page = conn.execute(
+                f"SELECT rowid, id, doc FROM {self._table} WHERE rowid > ? ORDER BY rowid LIMIT ?", (last, SCAN_PAGE)
+            ).fetchall()
+            if not page:
+                return
+            for _, row_id, text in page:
+                yield row_id, text
+            last = page[-1][0]
+
+    def _matching(self, conn, query):
+        for row_id, text in self._candidates(conn, query):
+            doc = _loads(text)
+            if _match(doc, query):
+                yield row_id, doc
+
+    def find(self, filter=None, projection=None, sort=None, skip=0, limit=0, **kwargs):
+        cursor = Cursor(self, filter or {}, projection)
+        if sort:
+            cursor.sort(_sort_spec(sort))
+        return cursor.skip(skip).limit(limit)
+
+    def find_one(self, filter=None, projection=None, sort=None, **kwargs):
+        if filter is not None and not isinstance(filter, dict):
+            filter = {"_id": filter}
+        for doc in self.find(filter, projection, sort=sort).limit(1):
+            return doc
+        return None
+
+    def count_documents(self, filter, skip=0, limit=0, **kwargs):
+        count = sum(1 for _ in self._matching(self._client.connection(), filter)) - skip
+        count = max(count, 0)
+        return min(count, limit) if limit else count
+
+    def estimated_document_count(self, **kwargs):
+        return self._client.connection().execute(f"SELECT COUNT(*) FROM {self._table}").fetchone()[0]
+
+    def distinct(self, key, filter=None, **kwargs):
+        seen, out = set(), []
+        for _, doc in self._matching(self._client.connection(), filter or {}):
+            for value in _flatten(_values(doc, key)):
+                if isinstance(value, list):
+                    continue
+                marker = _key(value)
+                if marker not in seen:
+                    seen.add(marker)
+                    out.append(value)
+        return out
+
+    # Writes
+
+    def _write(self):
+        return _Transaction(self._client.connection())
+
+    def _savepoint(self, conn, fn):
+        """Run one write so that a failure undoes only that write"""
+        conn.execute("SAVEPOINT op")
+        try:
+            result = fn()
+        except BaseException:
+            conn.execute("ROLLBACK TO op")
+            conn.execute("RELEASE op")
+            raise
+        conn.execute("RELEASE op")
+        return result
+
+    def _insert(self, conn, specs, doc):
+        if "_id" not in doc:
+            doc["_id"] = ObjectId()
+        row_id = _key(doc["_id"])
+        try:
+            conn.execute(f"INSERT INTO {self._table} (id, doc) VALUES (?, ?)", (row_id, _dumps(doc)))
+        except sqlite3.IntegrityError:
+            raise DuplicateKeyError(
+                f"E11000 duplicate key error collection: {self.name} index: _id_ dup key: {{ _id: {doc['_id']!r} }}",
+                11000,
+            ) from None
+        self._index(conn, row_id, doc, specs)
+        return doc["_id"]
+
+    def _replace_row(self, conn, specs, row_id, doc):
+        conn.execute(f"UPDATE {self._table} SET doc = ? WHERE id = ?", (_dumps(doc), row_id))
+        conn.execute("DELETE FROM _index_entries WHERE coll = ? AND id = ?", (self.name, row_id))
+        self._index(conn, row_id, doc, specs)
+
+    def _delete_row(self, conn, row_id):
+        conn.execute(f"DELETE FROM {self._table} WHERE id = ?", (row_id,))
+        conn.execute("DELETE FROM _index_entries WHERE coll = ? AND id = ?", (self.name, row_id))
+
+    def _update(self, conn, specs, query, update, upsert, many, sort=None):
+        """Returns (matched, modified, upserted_id, last (before, after) pair)"""
+        matches = list(self._matching(conn, query))
+        if sort:
+            matches = _sorted(matches, _sort_spec(sort), key=lambda m: m[1])
+        if not many:
+            matches = matches[:1]
+        matched = modified = 0
+        pair = (None, None)
+        for row_id, doc in matches:
+            before = copy.deepcopy(doc)
+            _apply_update(doc, update, inserting=False)
+            matched += 1
+            if doc != before:
+                self._savepoint(conn, lambda: self._replace_row(conn, specs, row_id, doc))
+                modified += 1
+            pair = (before, doc)
+        if matched or not upsert:
+            return matched, modified, None, pair
+        doc = _upsert_seed(query)
+        _apply_update(doc, update, inserting=True)
+        upserted_id = self._savepoint(conn, lambda: self._insert(conn, specs, doc))
+        return 0, 0, upserted_id, (None, doc)
+
+    def insert_one(self, document, **kwargs):
+        with self._write() as conn:
+            inserted_id = self._insert(conn, self._specs(conn), document)
+        return InsertOneResult(inserted_id)
+
+    def insert_many(self, documents, ordered=True, **kwargs):
+        documents = list(documents)
+        self.bulk_write([InsertOne(doc) for doc in documents], ordered=ordered)
+        return InsertManyResult([doc["_id"] for doc in documents])
+
+    def update_one(self, filter, update, upsert=False, **kwargs):
+        with self._write() as conn:
+            matched, modified, upserted_id, _ = self._update(conn, self._specs(conn), filter, update, upsert, False)
+        return UpdateResult(matched, modified, upserted_id)
+
+    def update_many(self, filter, update, upsert=False, **kwargs):
+        with self._write() as conn:
+            matched, modified, upserted_id, _ = self._update(conn, self._specs(conn), filter, update, upsert, True)
+        return UpdateResult(matched, modified, upserted_id)
+
+    def replace_one(self, filter, replacement, upsert=False, **kwargs):
+        return self.update_one(filter, replacement, upsert=upsert)
+
+    def find_one_and_update(self, filter, update, projection=None, sort=None, upsert=False, return_document=False, **kwargs):
+        with self._write() as conn:
+            _, _, _, (before, after) = self._update(conn, self._specs(conn), filter, update, upsert, False, sort=sort)
+        doc = after if return_document else before
+        return None if doc is None else _project(doc, projection)
+
+    def find_one_and_delete(self, filter, projection=None, sort=None, **kwargs):
+        with self._write() as conn:
+            matches = list(self._matching(conn, filter))
+            if sort:
+                matches = _sorted(matches, _sort_spec(sort), key=lambda m: m[1])
+            if not matches:
+                return None
+            row_id, doc = matches[0]
+            self._delete_row(conn, row_id)
+        return _project(doc, projection)
+
+    def _delete(self, conn, query, many):
+        deleted = 0
+        for row_id, _ in list(self._matching(conn, query)):
+            self._delete_row(conn, row_id)
+            deleted += 1
+            if not many:
+                break
+        return deleted
+
+    def delete_one(self, filter, **kwargs):
+        with self._write() as conn:
+            return DeleteResult(self._delete(conn, filter, many=False))
+
+    def delete_many(self, filter, **kwargs):
+        with self._write() as conn:
+            return DeleteResult(self._delete(conn, filter, many=True))
+
+    def bulk_write(self, requests, ordered=True, **kwargs):
+        result, errors = BulkWriteResult(), []
+        with self._write() as conn:
+            specs = self._specs(conn)
+            for index, op in enumerate(requests):
+                try:
+                    if isinstance(op, InsertOne):
+                        self._savepoint(conn, lambda: self._insert(conn, specs, op._doc))
+                        result.inserted_count += 1
+                    elif isinstance(op, (UpdateOne, UpdateMany, ReplaceOne)):
+                        many = isinstance(op, UpdateMany)
+                        matched, modified, upserted_id, _ = self._savepoint(
+                            conn, lambda: self._update(conn, specs, op._filter, op._doc, op._upsert, many)
+                        )
+                        result.matched_count += matched
+                        result.modified_count += modified
+                        if upserted_id is not None:
+                            result.upserted_ids[index] = upserted_id
+                    elif isinstance(op, (DeleteOne, DeleteMany)):
+                        result.deleted_count += self._delete(conn, op._filter, many=isinstance(op, DeleteMany))
+                    else:
+                        raise TypeError(f"{op!r} is not a valid request")
+                except DuplicateKeyError as e:
+                    errors.append({"index": index, "code": 11000, "errmsg": str(e), "op": getattr(op, "_doc", None)})
+                    if ordered:
+                        break
+        if errors:
+            raise BulkWriteError(result.details(errors))
+        return result
+
+    def drop(self):
+        with self._write() as conn:
+            conn.execute(f"DELETE FROM {self._table}")
+            conn.execute("DELETE FROM _index_entries WHERE coll = ?", (self.name,))
+            conn.execute("DELETE FROM _indexes WHERE coll = ?", (self.name,))
+
+
+def _sort_spec(key_or_list, direction=None):
+    if isinstance(key_or_list, str):
+        return [(key_or_list, direction or 1)]
+    return list(key_or_list.items()) if isinstance(key_or_list, dict) else list(key_or_list)
+
+
+def _sorted(items, spec, key=lambda doc: doc):
+    # Stable sorts applied last key first give a multi-key order
+    items = list(items)
+    for field, direction in reversed(spec):
+        descending = direction < 0
+        items.sort(
+            key=lambda item: _sort_value(_get(key(item), field) if "." in field else key(item).get(field), descending),
+            reverse=descending,
+        )
+    return items
+
+
+class Cursor:
+    """Lazy find() result supporting sort, skip and limit chaining"""
+
+    def __init__(self, collection, query, projection):
+        self._collection = collection
+        self._query = query
+        self._projection = projection
+        self._sort = None
+        self._skip = 0
+        self._limit = 0
+        self._iterator = None
+
+    def sort(self, key_or_list, direction=None):
+        self._sort = _sort_spec(key_or_list, direction)
+        return self
+
+    def skip(self, count):
+        self._skip = count
+        return self
+
+    def limit(self, count):
+        self._limit = count
+        return self
+
+    def batch_size(self, size):
+        return self
+
+    def _documents(self):
+        docs = (doc for _, doc in self._collection._matching(self._collection._client.connection(), self._query))
+        if self._sort:
+            docs = iter(_sorted(docs, self._sort))
+        docs = itertools.islice(docs, self._skip, self._skip + self._limit if self._limit else None)
+        for doc in docs:
+            yield _project(doc, self._projection)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self._iterator is None:
+            self._iterator = self._documents()
+        return next(self._iterator)
+
+    def close(self):
+        self._iterator = iter(())
+
+
+# Async facade for the ASGI path; each call runs on a worker thread
+
+
+class AsyncClient:
+    def __init__(self, client):
+        self._client = client
+
+    def __getitem__(self, name):
+        return AsyncDatabase(self._client[name])
+
+    async def close(self):
+        pass
+
+
+class AsyncDatabase:
+    def __init__(self, database):
+        self._database = database
+
+    def __getitem__(self, name):
+        return AsyncCollection(self._database[name])
+
+
+class AsyncCollection:
+    def __init__(self, collection):
+        self._collection = collection
+
+    def find(self, *args, **kwargs):
+        return AsyncCursor(self._collection.find(*args, **kwargs))
+
+    def with_options(self, **kwargs):
+        return self
+
+    def __getattr__(self, name):
+        method = getattr(self._collection, name)
+
+        async def call(*args, **kwargs):
+            return await asyncio.to_thread(method, *args, **kwargs)
+
+        return call
+
+
+class AsyncCursor:
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def sort(self, *args, **kwargs):
+        self._cursor.sort(*args, **kwargs)
+        return self
+
+    def skip(self, count):
+        self._cursor.skip(count)
+        return self
+
+    def limit(self, count):
+        self._cursor.limit(count)
+        return self
+
+    async def to_list(self, length=None):
+        if length and not 0 < self._cursor._limit <= length:
+            self._cursor.limit(length)
+        return await asyncio.to_thread(list, self._cursor)
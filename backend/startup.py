@@ -0,0 +1,68 @@
+"""Startup phase timing for the API process.
+
+Import this module first so PROCESS_START is as close to interpreter start
+as we can get without hooks. Each phase of create_app() is recorded, and the
+first request closes the report with the import-to-first-request time,
+which is checked against STARTUP_BUDGET_MS.
+"""
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+PROCESS_START = time.perf_counter()
+
+STARTUP_BUDGET_MS = float(os.getenv("STARTUP_BUDGET_MS", 1500))
+
+
+class StartupReport:
+    def __init__(self, started_at=PROCESS_START, budget_ms=STARTUP_BUDGET_MS):
+        self.started_at = started_at
+        self.budget_ms = budget_ms
+        self.phases = []
+        self.first_request_ms = None
+        self._lock = threading.Lock()
+
+    def record(self, name, ms):
+        self.phases.append((name, ms))
+
+    def record_since_start(self, name):
+        self.record(name, (time.perf_counter() - self.started_at) * 1000)
+
+    @contextmanager
+    def phase(self, name):
+        begin = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, (time.perf_counter() - begin) * 1000)
+
+    def mark_first_request(self):
+        """Record import-to-first-request time; only the first call counts"""
+        if self.first_request_ms is not None:
+            return False
+        with self._lock:
+            if self.first_request_ms is not None:
+                return False
+            self.first_request_ms = (time.perf_counter() - self.started_at) * 1000
+        return True
+
+    @property
+    def over_budget(self):
+        return self.first_request_ms is not None and self.first_request_ms > self.budget_ms
+
+    def as_dict(self):
+        return {
+            "pid": os.getpid(),
+            "phases_ms": {name: round(ms, 1) for name, ms in self.phases},
+            "first_request_ms": round(self.first_request_ms, 1) if self.first_request_ms is not None else None,
+            "budget_ms": self.budget_ms,
+            "over_budget": self.over_budget,
+        }
+
+    def summary(self):
+        parts = ", ".join(f"{name}={ms:.1f}ms" for name, ms in self.phases)
+        return f"⏱️ Startup phases (pid {os.getpid()}): {parts}"
+
+
+report = StartupReport()
@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+Bulk student import from JSON Lines or CSV.
+
+Rows are validated a batch at a time with the same rules as /add_student,
+except that email uniqueness is one `$in` query per batch (plus the emails
+already seen earlier in the file) instead of a find_one per row. Valid rows
+are written with one unordered insert_many per batch, so a bad row never
+blocks the rest.
+
+CSV files need a header row with the student fields; list fields
+(course_ids, study_spots, study_times) are separated by ";".
+
+Every row produces one result, in input order:
+
+    {"row": 3, "status": "inserted", "student_id": "..."}
+    {"row": 4, "status": "error", "error": "Invalid college selected"}
+    {"row": 5, "status": "valid"}                      # dry run
+
+Used by POST /import_students and by `python create_mock_data.py import`.
+"""
+
+import codecs
+import csv
+import json
+import os
+from datetime import datetime
+
+import repository
+
+BATCH_SIZE = int(os.getenv("STUDENT_IMPORT_BATCH_SIZE", 1000))
+
+REQUIRED_FIELDS = ("name", "email", "college", "department", "course_ids", "study_spots", "study_times")
+LIST_FIELDS = ("course_ids", "study_spots", "study_times")
+LIST_SEPARATOR = ";"
+
+FORMATS = ("jsonl", "csv")
+
+
+def detect_format(filename="", content_type=""):
+    """'csv' or 'jsonl' from a file name or content type; JSON Lines by default"""
+    if (filename or "").lower().endswith(".csv") or "csv" in (content_type or ""):
+        return "csv"
+    return "jsonl"
+
+
+def check_student(data, college_departments, email_taken):
+    """The /add_student rules without the database; returns an error message or None"""
+    for field in REQUIRED_FIELDS:
+        if field not in data:
+            return f"Missing required field: {field}"
+
+    email = str(data.get("email") or "").strip().lower()
+    if not email.endswith(".nthu.edu.tw"):
+        return "Please use a valid NTHU email address ending with .nthu.edu.tw"
+    if email_taken(email):
+        return "Email already registered"
+
+    for field in LIST_FIELDS:
+        if not isinstance(data[field], list) or len(data[field]) == 0:
+            return f"{field} must be a non-empty list"
+
+    college = data.get("college")
+    if college not in college_departments:
+        return "Invalid college selected"
+    if data.get("department") not in college_departments[college]:
+        return "Invalid department for selected college"
+    return None
+
+
+def _csv_student(record):
+    student = {k.strip(): (v or "").strip() for k, v in record.items() if k}
+    for field in LIST_FIELDS:
+        if field in student:
+            student[field] = [item.strip() for item in student[field].split(LIST_SEPARATOR) if item.strip()]
+    return student
+
+
+def read_rows(lines, fmt="jsonl"):
+    """(row number, student dict or error message) for each input record"""
+    if fmt == "csv":
+        for row, record in enumerate(csv.DictReader(lines), start=1):
+            yield row, _csv_student(record)
+        return
+    row = 0
+    for line in lines:
+        if not line.strip():
+            continue
+        row += 1
+        try:
+            student = json.loads(line)
+        except ValueError as e:
+            yield row, f"Invalid JSON: {e}"
+            continue
+        yield row, student if isinstance(student, dict) else "Each line must be a JSON object"
+
+
+def _student_doc(data, now):
+    doc = repository.new_student_doc(data, now)
+    doc["name"] = str(doc["name"]).strip()
+    return doc
+
+
+def _import_batch(batch, college_departments, seen_emails, dry_run):
+    emails = {
+        str(data.get("email") or "").strip().lower()
+        for _, data in batch
+        if isinstance(data, dict)
+    }
+    taken = repository.existing_emails(emails) | seen_emails
+
+    now = datetime.utcnow()
+    results, docs, doc_rows = [], [], []
+    for row, data in batch:
+        error = data if isinstance(data, str) else check_student(data, college_departments, taken.__contains__)
+        if error:
+            results.append({"row": row, "status": "error", "error": error})
+            continue
+        doc = _student_doc(data, now)
+        taken.add(doc["email"])
+        seen_emails.add(doc["email"])
+        results.append({"row": row, "status": "valid"})
+        docs.append(doc)
+        doc_rows.append(len(results) - 1)
+
+    if dry_run or not docs:
+        return results
+
+    from pymongo.errors import BulkWriteError
+
+    failed = {}
+    try:
+        repository.insert_students(docs)
+    except BulkWriteError as e:
+        for error in e.details.get("writeErrors", []):
+            duplicate = error.get("code") == 11000
+            failed[error["index"]] = "Email already registered" if duplicate else error.get("errmsg", "Write failed")
+    except Exception as e:
+        failed = dict.fromkeys(range(len(docs)), f"Error saving student: {e}")
+    for index, (doc, result_index) in enumerate(zip(docs, doc_rows)):
+        row = results[result_index]["row"]
+        if index in failed:
+            results[result_index] = {"row": row, "status": "error", "error": failed[index]}
+        else:
+            results[result_index] = {"row": row, "status": "inserted", "student_id": str(doc["_id"])}
+    return results
+
+
+def import_students(rows, college_departments, batch_size=BATCH_SIZE, dry_run=False):
+    """Validate and insert (row, data) pairs batch by batch, yielding one result per row"""
+    if not dry_run:
+        repository.ensure_student_indexes()
+    seen_emails = set()
+    batch = []
+    for item in rows:
+        batch.append(item)
+        if len(batch) >= batch_size:
+            yield from _import_batch(batch, college_departments, seen_emails, dry_run)
+            batch = []
+    if batch:
+        yield from _import_batch(batch, college_departments, seen_emails, dry_run)
+
+
+def decode_body(body):
+    """Lines of an uploaded file, tolerating a UTF-8 BOM (Excel CSV exports)"""
+    return codecs.decode(body, "utf-8-sig").splitlines(keepends=True)
@@ -0,0 +1,99 @@
+"""Admission gates (host-wide slots and wait tickets) and shared token buckets"""
+
+import threading
+import time
+
+import pytest
+from flask import Flask
+
+import admission
+
+
+@pytest.fixture(autouse=True)
+def admission_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(admission, "ADMISSION_DIR", str(tmp_path))
+    monkeypatch.setattr(admission, "_gates", {})
+    monkeypatch.setattr(admission, "_db_local", threading.local())
+    return tmp_path
+
+
+def test_gate_admits_limit_then_queues_then_rejects(admission_dir):
+    gate = admission.Gate("test", limit=2, queue=1, directory=str(admission_dir))
+    first, _ = gate.acquire(timeout=0)
+    second, _ = gate.acquire(timeout=0)
+    assert first is not None and second is not None
+    assert gate.acquire(timeout=0.05) == (None, "timeout")
+
+    ticket = gate.take_ticket()  # another request already waiting
+    assert gate.acquire(timeout=0.05) == (None, "queue_full")
+    admission.os.close(ticket)
+
+    admitted = []
+    waiter = threading.Thread(target=lambda: admitted.append(gate.acquire(timeout=2)))
+    waiter.start()
+    time.sleep(0.1)
+    admission.os.close(first)
+    waiter.join()
+    fd, reason = admitted[0]
+    assert fd is not None and reason is None
+    for fd in (fd, second):
+        admission.os.close(fd)
+
+
+def test_gates_are_shared_across_gate_objects(admission_dir):
+    # Two workers on one host each build their own Gate over the same files
+    one = admission.Gate("shared", 1, 0, directory=str(admission_dir))
+    other = admission.Gate("shared", 1, 0, directory=str(admission_dir))
+    fd, _ = one.acquire(timeout=0)
+    assert other.acquire(timeout=0) == (None, "queue_full")
+    admission.os.close(fd)
+    fd, _ = other.acquire(timeout=0)
+    assert fd is not None
+    admission.os.close(fd)
+
+
+def test_limit_decorator_sheds_with_503(monkeypatch):
+    monkeypatch.setattr(admission, "LIMITS", {"busy": (1, 0)})
+    monkeypatch.setattr(admission, "RETRY_AFTER_SECONDS", 7)
+    app = Flask(__name__)
+    inside, release = threading.Event(), threading.Event()
+
+    @app.route("/busy")
+    @admission.limit("busy")
+    def busy():
+        inside.set()
+        release.wait(5)
+        return "done"
+
+    client = app.test_client()
+    holder = threading.Thread(target=lambda: client.get("/busy"))
+    holder.start()
+    assert inside.wait(5)
+    response = app.test_client().get("/busy")
+    assert response.status_code == 503 and response.headers["Retry-After"] == "7"
+    release.set()
+    holder.join()
+    assert app.test_client().get("/busy").data == b"done"
+
+
+def test_token_bucket_bursts_then_refills(monkeypatch):
+    monkeypatch.setattr(admission, "RATES", {"otp_email": (3.0, 60.0)})
+    now = 1000.0
+    assert [admission.take("otp_email", "a@nthu", now) for _ in range(3)] == [0, 0, 0]
+    assert admission.take("otp_email", "a@nthu", now) == 20
+    assert admission.take("otp_email", "b@nthu", now) == 0  # per key
+    assert admission.take("otp_email", "a@nthu", now + 20) == 0
+    assert admission.take("unknown", "a@nthu", now) == 0
+
+
+def test_check_rates_reports_the_longest_wait(monkeypatch):
+    monkeypatch.setattr(admission, "RATES", {"user": (1.0, 10.0), "ip": (1.0, 100.0)})
+    assert admission.check_rates([("user", "u1"), ("ip", "1.2.3.4"), ("ip", None)]) == 0
+    assert admission.check_rates([("user", "u1"), ("ip", "1.2.3.4")]) in (100, 101)
+
+
+def test_parse_limits_and_rates():
+    limits = admission._parse_limits("get_matches=8:16, custom=1")
+    assert limits["get_matches"] == (8, 16) and limits["custom"] == (1, 0)
+    assert limits["get_groups"] == admission.DEFAULT_LIMITS["get_groups"]
+    assert admission._parse_rates("otp_email=2/60")["otp_email"] == (2.0, 60.0)
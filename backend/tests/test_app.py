@@ -0,0 +1,46 @@
+"""App factory: DB-free liveness and profile validation"""
+
+import pytest
+from bson import ObjectId
+
+import app as app_module
+import db
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.setattr(db, "STORAGE_BACKEND", "sqlite")
+    monkeypatch.setattr(db, "SQLITE_PATH", str(tmp_path / "app.sqlite3"))
+    db.reset_after_fork()
+    application = app_module.create_app({"TESTING": True, "SESSION_COOKIE_SECURE": False})
+    with application.test_client() as client:
+        yield client
+    db.reset_after_fork()
+
+
+def test_health_needs_no_database(client, monkeypatch):
+    def unreachable(*args, **kwargs):
+        raise AssertionError("liveness must not touch the database")
+
+    monkeypatch.setattr(db, "get_client", unreachable)
+    response = client.get("/health")
+    assert response.status_code == 200
+    assert response.get_json() == {"status": "ok"}
+
+
+def test_ready_reports_the_store(client):
+    response = client.get("/ready")
+    assert response.status_code == 200
+    assert response.get_json()["status"] == "ready"
+
+
+def test_update_profile_requires_login(client):
+    assert client.put("/update_profile", json={"study_times": ["morning"]}).status_code == 401
+
+
+def test_update_profile_rejects_unknown_study_times(client):
+    with client.session_transaction() as session:
+        session["user_id"] = str(ObjectId())
+    response = client.put("/update_profile", json={"study_times": ["midnight snack"]})
+    assert response.status_code == 400
+    assert response.get_json() == {"error": "Invalid study time: midnight snack"}
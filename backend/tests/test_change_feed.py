@@ -0,0 +1,79 @@
+"""Change-feed batching (stream mode) and overlap dedupe (poll mode)"""
+
+from datetime import datetime, timedelta
+
+import pytest
+
+import change_feed
+import sqlite_store
+
+
+class FakeStream:
+    """try_next() over a list of events, then None (idle)"""
+
+    def __init__(self, events):
+        self.events = list(events)
+
+    def try_next(self):
+        return self.events.pop(0) if self.events else None
+
+
+def upsert_event(i):
+    return {"operationType": "insert", "fullDocument": {"_id": i, "name": f"s{i}"}, "wallTime": datetime.utcnow()}
+
+
+@pytest.fixture
+def students(tmp_path):
+    client = sqlite_store.SQLiteClient(str(tmp_path / "feed.sqlite3"))
+    yield client["test"]["students"]
+    client.close()
+
+
+def test_stream_events_are_dispatched_in_batches(monkeypatch):
+    monkeypatch.setattr(change_feed, "STREAM_BATCH", 4)
+    feed = change_feed.ChangeFeed(None, "test")
+    batches = []
+    feed.register(batches.append)
+    events = [upsert_event(i) for i in range(10)]
+    events.insert(3, {"operationType": "delete", "documentKey": {"_id": 99}, "wallTime": datetime.utcnow()})
+    events.insert(5, {"operationType": "update", "fullDocument": None, "wallTime": datetime.utcnow()})
+    stream = FakeStream(events)
+    while True:
+        changes = feed.drain(stream)
+        if not changes:
+            break
+        feed.dispatch(changes)
+    assert [len(b) for b in batches] == [4, 4, 3]
+    assert [c["op"] for c in batches[0]] == ["upsert", "upsert", "upsert", "delete"]
+    assert [c["_id"] for b in batches for c in b if c["op"] == "upsert"] == list(range(10))
+
+
+def test_stream_projection_keeps_id_and_timestamps():
+    feed = change_feed.ChangeFeed(None, "test", projection={"name": 1})
+    project = feed._pipeline()[-1]["$project"]
+    assert {"fullDocument._id", "fullDocument.name", "fullDocument.updated_at", "documentKey"} <= set(project)
+
+
+def test_poll_picks_up_late_commits_once(students):
+    feed = change_feed.ChangeFeed(students, "test", projection={"name": 1}, overlap_seconds=10)
+    delivered = []
+    feed.register(lambda changes: delivered.extend(c["_id"] for c in changes))
+    now = datetime.utcnow()
+    students.insert_one({"_id": 1, "name": "a", "email": "a@nthu", "updated_at": now + timedelta(seconds=1)})
+    assert feed.poll_once() == 1
+    # Stamped before the watermark but committed after the last poll
+    students.insert_one({"_id": 2, "name": "b", "updated_at": now})
+    assert feed.poll_once() == 1
+    assert feed.poll_once() == 0
+    students.update_one({"_id": 1}, {"$set": {"updated_at": now + timedelta(seconds=2)}})
+    assert feed.poll_once() == 1
+    assert delivered == [1, 2, 1]
+
+
+def test_poll_reads_only_projected_fields(students):
+    feed = change_feed.ChangeFeed(students, "test", projection={"name": 1})
+    seen = []
+    feed.register(seen.extend)
+    students.insert_one({"_id": 1, "name": "a", "email": "a@nthu", "created_at": datetime.utcnow()})
+    feed.poll_once()
+    assert set(seen[0]["doc"]) == {"_id", "name", "created_at"}
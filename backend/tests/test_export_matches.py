@@ -0,0 +1,91 @@
+"""Export scoring: chunked matrix products agree with calculate_weighted_similarity"""
+
+import random
+
+import pytest
+from bson import ObjectId
+
+import export_matches
+from matching import calculate_weighted_similarity, encode_features
+
+
+class ListWriter:
+    def __init__(self):
+        self.rows = []
+
+    def write(self, rows):
+        self.rows.extend(rows)
+
+
+def population(count, seed=7):
+    rng = random.Random(seed)
+    courses = [f"C{n:03d}" for n in range(40)]
+    spots = ["library", "cafe", "lab", "dorm"]
+    times = ["morning", "afternoon", "evening", "night"]
+    students = [
+        {
+            "_id": ObjectId(),
+            "department": rng.choice(["CS", "EE"]),
+            "course_ids": rng.sample(courses, rng.randint(1, 5)),
+            "study_spots": rng.sample(spots, rng.randint(1, 2)),
+            "study_times": rng.sample(times, rng.randint(1, 2)),
+        }
+        for _ in range(count)
+    ]
+    students.append({"_id": ObjectId(), "department": "CS"})  # no features at all
+    return students
+
+
+@pytest.mark.parametrize("chunk_rows", [4, 256])
+def test_scores_match_calculate_weighted_similarity(chunk_rows):
+    students = population(30)
+    writer = ListWriter()
+    export_matches.export(students, writer, top=5, chunk_rows=chunk_rows)
+
+    courses = sorted({c for s in students for c in s.get("course_ids", [])})
+    spots = sorted({p for s in students for p in s.get("study_spots", [])})
+    times = sorted({t for s in students for t in s.get("study_times", [])})
+    vectors = {str(s["_id"]): encode_features(s, courses, spots, times) for s in students}
+
+    ranked = [row for row in writer.rows if row["rank"] > 0]
+    assert ranked
+    for row in ranked:
+        expected = calculate_weighted_similarity(
+            vectors[row["student_id"]], vectors[row["partner_id"]], courses, spots
+        )
+        assert row["score"] == pytest.approx(expected, abs=1e-5)
+        assert row["partner_id"] != row["student_id"]
+
+    for student_id, vector in vectors.items():
+        rows = [row for row in ranked if row["student_id"] == student_id]
+        scores = [row["score"] for row in rows]
+        assert scores == sorted(scores, reverse=True)
+        if rows:
+            best = max(
+                calculate_weighted_similarity(vector, other, courses, spots)
+                for other_id, other in vectors.items()
+                if other_id != student_id
+            )
+            assert rows[0]["score"] == pytest.approx(best, abs=1e-5)
+
+
+def test_student_without_features_gets_an_empty_row():
+    students = population(5)
+    writer = ListWriter()
+    export_matches.export(students, writer, top=3)
+    lonely = [row for row in writer.rows if row["student_id"] == str(students[-1]["_id"])]
+    assert lonely == [
+        {
+            "student_id": str(students[-1]["_id"]),
+            "department": "CS",
+            "college": "",
+            "rank": 0,
+            "partner_id": None,
+            "partner_department": None,
+            "partner_college": None,
+            "score": 0.0,
+            "shared_courses": 0,
+            "shared_spots": 0,
+            "shared_times": 0,
+        }
+    ]
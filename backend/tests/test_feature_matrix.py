@@ -0,0 +1,70 @@
+"""Feature matrix: cosine parity, row lookup and delta generations"""
+
+import pytest
+from bson import ObjectId
+
+import feature_matrix
+from matching import DEFAULT_WEIGHTS, calculate_weighted_similarity, encode_features
+
+
+def student(courses=(), spots=(), times=()):
+    return {"_id": ObjectId(), "course_ids": list(courses), "study_spots": list(spots), "study_times": list(times)}
+
+
+@pytest.fixture
+def students():
+    return [
+        student(["CS101", "MA201"], ["library"], ["evening"]),
+        student(["CS101"], ["cafe"], ["evening", "night"]),
+        student(["EE300"], ["library", "lab"], ["morning"]),
+        student(),
+    ]
+
+
+def test_cosine_matches_calculate_weighted_similarity(tmp_path, students):
+    matrix = feature_matrix.FeatureMatrix(feature_matrix.publish(students, directory=str(tmp_path)))
+    courses, spots, times = matrix.vocab
+    vectors = [encode_features(s, courses, spots, times) for s in students]
+    for i, s in enumerate(students):
+        scores = matrix.cosine(s, DEFAULT_WEIGHTS)
+        expected = [
+            calculate_weighted_similarity(vectors[i], other, courses, spots) if vectors[i].any() and other.any() else 0.0
+            for other in vectors
+        ]
+        assert scores == pytest.approx(expected, abs=1e-6)
+
+
+def test_row_lookup(tmp_path, students):
+    matrix = feature_matrix.FeatureMatrix(feature_matrix.publish(students, directory=str(tmp_path)))
+    assert [matrix.row_of(s["_id"]) for s in students] == [0, 1, 2, 3]
+    assert matrix.row_of(ObjectId()) is None
+    assert matrix.rows_of([students[2]["_id"], ObjectId()]).tolist() == [2]
+    assert matrix.object_ids([1, 3]) == [students[1]["_id"], students[3]["_id"]]
+
+
+def test_delta_generation_scores_like_a_full_build(tmp_path, students):
+    directory = str(tmp_path / "delta")
+    feature_matrix.publish(students, directory=directory)
+    changed = dict(students[1], course_ids=["CS101", "PH110"], study_spots=["garden"])
+    added = student(["PH110"], ["garden"], ["night"])
+    assert feature_matrix.apply_changes([changed, added], [students[2]["_id"]], directory=directory)
+    assert not feature_matrix.apply_changes([changed, added], [students[2]["_id"]], directory=directory)
+
+    delta = feature_matrix._open_published(directory)
+    current = [students[0], changed, students[3], added]
+    full = feature_matrix.FeatureMatrix(feature_matrix.publish(current, directory=str(tmp_path / "full")))
+    assert delta.count == full.count == 4
+    assert delta.row_of(students[2]["_id"]) is None
+    assert all(delta.encodes(s) for s in current)
+
+    for s in current:
+        order = [full.row_of(o["_id"]) for o in current]
+        by_delta = delta.cosine(s, DEFAULT_WEIGHTS)[[delta.row_of(o["_id"]) for o in current]]
+        assert by_delta == pytest.approx(full.cosine(s, DEFAULT_WEIGHTS)[order], abs=1e-6)
+
+
+def test_rejects_foreign_files(tmp_path):
+    path = tmp_path / "not-a-matrix.bin"
+    path.write_bytes(b"x" * 64)
+    with pytest.raises(ValueError):
+        feature_matrix.FeatureMatrix(str(path))
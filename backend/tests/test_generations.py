@@ -0,0 +1,79 @@
+"""Generation-checked caches: bumps invalidate, entries expire, outages bypass"""
+
+import time
+
+import pytest
+
+import generations
+
+
+@pytest.fixture
+def counters(monkeypatch):
+    state = {"generation": 1, "healthy": True}
+
+    def current(namespace):
+        return state["generation"] if state["healthy"] else None
+
+    monkeypatch.setattr(generations, "current", current)
+    return state
+
+
+def loader():
+    calls = []
+
+    def load():
+        calls.append(1)
+        return len(calls)
+
+    return load, calls
+
+
+def test_entries_are_reused_until_the_generation_moves(counters):
+    cache = generations.GenerationCache("test", size=8, max_age=60)
+    load, calls = loader()
+    assert [cache.get_or_load("k", load) for _ in range(3)] == [1, 1, 1]
+    counters["generation"] += 1
+    assert cache.get_or_load("k", load) == 2
+    assert len(calls) == 2
+
+
+def test_entries_expire_after_max_age_without_a_bump(counters, monkeypatch):
+    clock = [100.0]
+    monkeypatch.setattr(generations.time, "monotonic", lambda: clock[0])
+    cache = generations.GenerationCache("test", max_age=30)
+    load, calls = loader()
+    assert cache.get_or_load("k", load) == 1
+    clock[0] += 29
+    assert cache.get_or_load("k", load) == 1
+    clock[0] += 2
+    assert cache.get_or_load("k", load) == 2
+
+
+def test_unreadable_counters_bypass_the_cache(counters):
+    cache = generations.GenerationCache("test")
+    load, calls = loader()
+    cache.get_or_load("k", load)
+    counters["healthy"] = False
+    assert cache.get_or_load("k", load) == 2
+    assert cache.get_or_load("k", load) == 3
+
+
+def test_size_bound_evicts_least_recently_used(counters):
+    cache = generations.GenerationCache("test", size=2)
+    cache.get_or_load("a", lambda: "a")
+    cache.get_or_load("b", lambda: "b")
+    cache.get_or_load("a", lambda: "stale")
+    cache.get_or_load("c", lambda: "c")
+    assert list(cache._entries) == ["a", "c"]
+
+
+def test_refresh_never_steps_back_behind_a_local_bump(monkeypatch):
+    class Counters:
+        def find(self, query, projection):
+            return [{"_id": "test", "generation": 3}]
+
+    monkeypatch.setattr(generations, "generations_collection", Counters())
+    monkeypatch.setattr(generations, "_known", {"test": 5})
+    monkeypatch.setattr(generations, "_checked_at", float("-inf"))
+    assert generations.current("test") == 5
+    assert time.monotonic() - generations._checked_at < 5
@@ -0,0 +1,66 @@
+"""Study-group formation: balanced sizes, partitioned large populations, cached bodies"""
+
+import random
+
+import pytest
+from bson import ObjectId
+
+import generations
+import groups
+
+
+def population(n, seed=0):
+    rng = random.Random(seed)
+    courses = [f"11410CS{i:04d}00" for i in range(60)]
+    return [
+        {
+            "_id": ObjectId(),
+            "name": f"s{i}",
+            "department": rng.choice(["CS", "EE", "MATH"]),
+            "course_ids": rng.sample(courses, 4),
+            "study_spots": rng.sample(["library", "cafe", "lab"], 1),
+            "study_times": rng.sample(["mon", "tue", "wed", "thu"], 2),
+        }
+        for i in range(n)
+    ]
+
+
+def check_partition(result, n):
+    members = sorted(i for group, _ in result for i in group)
+    assert members == list(range(n))
+    sizes = [len(group) for group, _ in result]
+    assert min(sizes) >= groups.MIN_GROUP_SIZE and max(sizes) <= groups.MAX_GROUP_SIZE
+
+
+@pytest.mark.parametrize("n", [3, 7, 41, 120])
+def test_every_student_lands_in_one_bounded_group(n):
+    check_partition(groups.form_groups(population(n)), n)
+
+
+def test_large_populations_are_grouped_per_partition(monkeypatch):
+    monkeypatch.setattr(groups, "PARTITION_SIZE", 50)
+    students = population(230)
+    parts = groups.partitions(students, 50)
+    assert max(len(p) for p in parts) <= 50
+    assert sorted(i for p in parts for i in p) == list(range(230))
+    check_partition(groups.form_groups(students), 230)
+
+
+def test_groups_for_reads_students_only_after_a_profile_write(monkeypatch):
+    generation = [1]
+    monkeypatch.setattr(generations, "current", lambda namespace: generation[0])
+    groups._bodies.clear()
+    students = population(20)
+    loads = []
+
+    def load():
+        loads.append(1)
+        return students
+
+    first = groups.groups_for("department:CS", load, "11410", 4)
+    again = groups.groups_for("department:CS", load, "11410", 4)
+    assert again is first and len(loads) == 1
+    generation[0] += 1
+    groups.groups_for("department:CS", load, "11410", 4)
+    assert len(loads) == 2
+    assert first["total_students"] == 20
@@ -0,0 +1,84 @@
+"""Structured log records: JSON shape, secret redaction, trace ids"""
+
+import io
+import json
+import logging
+
+import pytest
+
+import logs
+import tracing
+
+
+@pytest.fixture
+def output():
+    stream = io.StringIO()
+    logs.shutdown()
+    logs.configure(stream)
+    yield stream
+    logs.shutdown()
+
+
+def records(stream):
+    logs.shutdown()  # flush the writer thread
+    return [json.loads(line) for line in stream.getvalue().splitlines()]
+
+
+def test_records_are_json_with_extra_fields(output):
+    logs.get_logger("test").info("hello %s", "world", extra={"count": 3})
+    (record,) = records(output)
+    assert record["msg"] == "hello world" and record["logger"] == "studybuddy.test"
+    assert record["level"] == "INFO" and record["count"] == 3
+
+
+def test_secret_fields_and_values_are_redacted(output):
+    log = logs.get_logger("test")
+    log.info("login", extra={"password": "hunter2", "Token": "abc", "note": "otp: 123456 sent"})
+    log.warning("user typed password=swordfish in the form")
+    first, second = records(output)
+    assert first["password"] == first["Token"] == logs.REDACTED
+    assert first["note"] == f"otp: {logs.REDACTED} sent"
+    assert "swordfish" not in second["msg"] and logs.REDACTED in second["msg"]
+
+
+def test_tracebacks_are_redacted(output):
+    try:
+        raise ValueError("bad otp=654321")
+    except ValueError:
+        logs.get_logger("test").exception("failed")
+    (record,) = records(output)
+    assert "ValueError" in record["exc"] and "654321" not in record["exc"]
+
+
+def test_records_carry_the_active_trace(output):
+    span, token = tracing.start_request("GET /x")
+    try:
+        logs.get_logger("test").info("inside")
+    finally:
+        tracing._current.reset(token)
+    logs.get_logger("test").info("outside")
+    inside, outside = records(output)
+    assert (inside["trace_id"], inside["span_id"]) == (span.trace_id, span.span_id)
+    assert outside["trace_id"] is None
+
+
+def test_sampling_never_drops_warnings(output, monkeypatch):
+    monkeypatch.setattr(logs, "SAMPLE_RATES", logs.parse_sample_rates("noisy=0"))
+    log = logs.get_logger("noisy")
+    log.info("dropped")
+    log.warning("kept")
+    assert [r["msg"] for r in records(output)] == ["kept"]
+
+
+def test_parse_sample_rates_clamps():
+    assert logs.parse_sample_rates("email=0.1, courses=2,bad") == {"studybuddy.email": 0.1, "studybuddy.courses": 1.0}
+
+
+def test_full_queue_drops_instead_of_blocking():
+    import queue
+
+    handler = logs.DroppingQueueHandler(queue.Queue(maxsize=1))
+    record = logging.makeLogRecord({"msg": "x"})
+    handler.enqueue(record)
+    handler.enqueue(record)  # must not raise or block
+    assert handler.queue.qsize() == 1
@@ -0,0 +1,36 @@
+"""Timetable blending keeps candidates with and without schedules on one scale"""
+
+import numpy as np
+import pytest
+
+import matching
+import timetable
+
+
+@pytest.fixture
+def slots():
+    return {
+        "A": timetable.slots_to_bytes(range(0, 10)),
+        "B": timetable.slots_to_bytes(range(0, 10)),
+        "C": timetable.slots_to_bytes(range(10, 20)),
+    }
+
+
+def test_unknown_schedules_get_the_mean_free_time_ratio(slots):
+    target = {"course_ids": ["A"]}
+    others = [{"course_ids": ["B"]}, {"course_ids": ["C"]}, {"course_ids": ["X"]}]
+    scores, shared = matching.blend_timetable(target, others, [0.5, 0.5, 0.5], slots)
+    target_free = timetable.SLOT_COUNT - 10
+    ratios = np.array([1.0, (target_free - 10) / target_free])
+    assert list(shared[:2]) == [target_free, target_free - 10]
+    w = timetable.TIMETABLE_WEIGHT
+    assert scores[:2] == pytest.approx((1 - w) * 0.5 + w * ratios)
+    assert scores[2] == pytest.approx((1 - w) * 0.5 + w * ratios.mean())
+    assert scores[1] < scores[2] < scores[0]
+
+
+def test_nothing_known_leaves_scores_alone(slots):
+    scores, shared = matching.blend_timetable({"course_ids": ["A"]}, [{"course_ids": ["X"]}], [0.4], slots)
+    assert list(scores) == [0.4] and shared is None
+    scores, shared = matching.blend_timetable({"course_ids": ["X"]}, [{"course_ids": ["A"]}], [0.4], slots)
+    assert list(scores) == [0.4] and shared is None
@@ -0,0 +1,57 @@
+"""New-match queueing: seeds once per worker, bounded queue, cheap seed check"""
+
+import queue
+from collections import OrderedDict
+
+import pytest
+from bson import ObjectId
+
+import new_matches
+import repository
+
+
+@pytest.fixture(autouse=True)
+def fresh_queue(monkeypatch):
+    monkeypatch.setattr(new_matches, "_queue", queue.Queue(maxsize=2))
+    monkeypatch.setattr(new_matches, "_seeded", OrderedDict())
+    return new_matches._queue
+
+
+def test_repeat_views_seed_once(fresh_queue):
+    student = ObjectId()
+    for _ in range(5):
+        new_matches.seed(student)
+    assert fresh_queue.qsize() == 1
+    assert fresh_queue.get_nowait() == (student, False)
+
+
+def test_full_queue_drops_instead_of_blocking(fresh_queue):
+    assert new_matches.submit(ObjectId()) and new_matches.submit(ObjectId())
+    assert new_matches.submit(ObjectId()) is False
+    dropped = ObjectId()
+    new_matches.seed(dropped)
+    assert dropped not in new_matches._seeded  # a later view tries again
+
+
+def test_seed_skips_scoring_when_a_list_exists(monkeypatch):
+    student = ObjectId()
+
+    class Stored:
+        def find_one(self, query, projection):
+            return {"_id": query["_id"]}
+
+    def must_not_load(student_id):
+        raise AssertionError("scored a student that already has a list")
+
+    monkeypatch.setattr(new_matches, "top_matches_collection", Stored())
+    monkeypatch.setattr(repository, "match_student", must_not_load)
+    assert new_matches.process(student, propagate=False) == 0
+
+
+def test_splice_reports_new_entries_only():
+    a, b, c = ObjectId(), ObjectId(), ObjectId()
+    stored = [{"student_id": a, "score": 0.9}, {"student_id": b, "score": 0.5}]
+    entries, is_new = new_matches.splice(stored, c, 0.7)
+    assert [sid for sid, _ in entries] == [a, c, b] and is_new
+    entries, is_new = new_matches.splice(stored, b, 0.95)
+    assert entries[0] == (b, 0.95) and not is_new
@@ -0,0 +1,69 @@
+"""Partner filters: raw ObjectId storage and atomic contact claims"""
+
+import pytest
+from bson import ObjectId
+
+import partner_filters
+import sqlite_store
+
+
+@pytest.fixture
+def filters(tmp_path, monkeypatch):
+    client = sqlite_store.SQLiteClient(str(tmp_path / "filters.sqlite3"))
+    collection = client["test"]["partner_filters"]
+    monkeypatch.setattr(partner_filters, "filters_collection", collection)
+    yield collection
+    client.close()
+
+
+def test_ids_with_trailing_nul_bytes_round_trip():
+    padded, other = ObjectId(b"abcdefghij\x00\x00"), ObjectId()
+    found = partner_filters.PartnerFilter([padded, other, padded])
+    assert len(found) == 2
+    assert padded in found and other in found and ObjectId() not in found
+    assert sorted(found.object_ids()) == sorted([padded, other])
+
+
+def test_rows_skip_students_outside_the_matrix():
+    inside, outside = ObjectId(), ObjectId()
+
+    class Matrix:
+        def row_of(self, student_id):
+            return 7 if student_id == inside else None
+
+    assert partner_filters.PartnerFilter([inside, outside]).rows(Matrix()) == [7]
+
+
+def test_each_address_is_claimed_once(filters):
+    owner, partner = ObjectId(), ObjectId()
+    assert partner_filters.claim_contact(owner, "Amy@nthu", partner)
+    assert not partner_filters.claim_contact(owner, "amy@NTHU", partner)
+    assert partner_filters.claim_contact(owner, "bob@nthu")
+    assert partner in partner_filters.load(owner)
+    partner_filters.release_contact(owner, "amy@nthu", partner)
+    assert partner not in partner_filters.load(owner)
+    assert partner_filters.claim_contact(owner, "amy@nthu", partner)
+
+
+def test_claim_survives_losing_the_insert_race(filters, monkeypatch):
+    owner, blocked = ObjectId(), ObjectId()
+    insert_one = filters.insert_one
+
+    def racing_insert(doc):
+        # A block for the same owner lands between the update and the insert
+        partner_filters.block(owner, blocked)
+        return insert_one(doc)
+
+    monkeypatch.setattr(filters, "insert_one", racing_insert)
+    assert partner_filters.claim_contact(owner, "amy@nthu")
+    doc = filters.find_one({"_id": owner})
+    assert doc["contacted_emails"] == ["amy@nthu"] and doc["blocked"] == [blocked]
+
+
+def test_blocks_hide_both_sides(filters):
+    a, b = ObjectId(), ObjectId()
+    partner_filters.block(a, b)
+    assert b in partner_filters.load(a) and a in partner_filters.load(b)
+    assert partner_filters.is_blocked_by(b, a)
+    partner_filters.unblock(a, b)
+    assert len(partner_filters.load(a)) == 0 and len(partner_filters.load(b)) == 0
@@ -0,0 +1,47 @@
+"""Roster rebuilds agree with incremental maintenance, archived terms included"""
+
+import pytest
+from bson import ObjectId
+
+import generations
+import repository
+import semester
+import sqlite_store
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    client = sqlite_store.SQLiteClient(str(tmp_path / "rosters.sqlite3"))
+    database = client["test"]
+    for name in ("students", "members", "rosters"):
+        monkeypatch.setattr(repository, f"{name}_collection", database[f"c_{name}"])
+    monkeypatch.setattr(generations, "bump", lambda *namespaces: None)
+    yield database
+    client.close()
+
+
+def roster(code):
+    return sorted(repository.roster_page(code, limit=100)), repository.roster_count(code)
+
+
+def test_rebuild_keeps_archived_terms(store):
+    a, b = ObjectId(), ObjectId()
+    repository.students_collection.insert_many(
+        [
+            {"_id": a, "course_ids": ["11320CS 100000", "11410CS 200000"]},
+            {"_id": b, "course_ids": ["11320CS 100000"]},
+        ]
+    )
+    for sid in (a, b):
+        repository.add_roster_members(repository.students_collection.find_one({"_id": sid})["course_ids"], sid)
+    before = roster("11320CS 100000")
+
+    assert repository.archive_stale_courses("1141") == (2, 2)
+    assert semester.trim(repository.students_collection.find_one({"_id": a}), "1141")["course_ids"] == ["11410CS 200000"]
+    # Archival leaves history in place, and a rebuild reproduces it
+    assert roster("11320CS 100000") == before
+    repository.members_collection.delete_many({})
+    repository.rosters_collection.delete_many({})
+    assert repository.rebuild_rosters() == 2
+    assert roster("11320CS 100000") == before == (sorted([a, b]), 2)
+    assert roster("11410CS 200000") == ([a], 1)
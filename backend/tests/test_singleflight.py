@@ -0,0 +1,107 @@
+"""Single-flight coalescing within a process and across processes on one host"""
+
+import fcntl
+import multiprocessing
+import os
+import threading
+import time
+
+import pytest
+
+import singleflight
+
+
+@pytest.fixture(autouse=True)
+def lock_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(singleflight, "SINGLEFLIGHT_DIR", str(tmp_path))
+    return tmp_path
+
+
+def test_concurrent_callers_share_one_run():
+    runs = []
+    release = threading.Event()
+
+    def compute():
+        runs.append(1)
+        release.wait(5)
+        return {"answer": 42}
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(singleflight.do("test:k", compute))) for _ in range(8)]
+    for t in threads:
+        t.start()
+    time.sleep(0.1)
+    release.set()
+    for t in threads:
+        t.join()
+    assert len(runs) == 1
+    assert results == [{"answer": 42}] * 8
+
+
+def test_errors_reach_every_waiter():
+    def compute():
+        time.sleep(0.1)
+        raise ValueError("boom")
+
+    errors = []
+
+    def call():
+        try:
+            singleflight.do("test:err", compute)
+        except ValueError as e:
+            errors.append(str(e))
+
+    threads = [threading.Thread(target=call) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert errors == ["boom"] * 4
+
+
+def _slow_compute(marker):
+    with open(marker, "a") as f:
+        f.write("run\n")
+    time.sleep(0.3)
+    return [1, 2]
+
+
+def _worker(marker, out):
+    out.put(singleflight.do("test:host", lambda: _slow_compute(marker), shared=True))
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="needs fork")
+def test_shared_runs_once_across_processes(lock_dir):
+    marker = str(lock_dir / "runs.txt")
+    ctx = multiprocessing.get_context("fork")
+    out = ctx.Queue()
+    procs = [ctx.Process(target=_worker, args=(marker, out)) for _ in range(3)]
+    for p in procs:
+        p.start()
+        time.sleep(0.02)
+    results = [out.get(timeout=10) for _ in procs]
+    for p in procs:
+        p.join(10)
+    assert results == [[1, 2]] * 3
+    with open(marker) as f:
+        assert f.read().count("run") == 1
+
+
+def test_waiter_runs_itself_after_wait_expires(lock_dir):
+    lock_path, _ = singleflight._paths("test:stuck")
+    fd = os.open(lock_path, os.O_RDWR | os.O_CREAT, 0o600)
+    fcntl.flock(fd, fcntl.LOCK_EX)  # another worker that never finishes
+    try:
+        started = time.monotonic()
+        assert singleflight.do("test:stuck", lambda: "mine", shared=True, wait=0.2) == "mine"
+        assert time.monotonic() - started < 2
+    finally:
+        os.close(fd)
+
+
+def test_lock_files_are_bounded_by_stripes(lock_dir, monkeypatch):
+    monkeypatch.setattr(singleflight, "LOCK_STRIPES", 8)
+    for i in range(200):
+        singleflight.do(f"search_courses:query {i}", lambda: i, shared=True)
+    locks = [name for name in os.listdir(lock_dir) if name.endswith(".lock")]
+    assert 0 < len(locks) <= 8
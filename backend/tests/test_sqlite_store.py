@@ -0,0 +1,268 @@
+"""
+Parity tests for sqlite_store: the query, update and write operations the
+app actually issues, with the results MongoDB gives.
+
+Every test runs against a SQLiteClient in a temporary file. Set
+MONGO_TEST_URI (e.g. mongodb://localhost:27017) to run the same assertions
+against a real server as well; each run uses a throwaway database.
+"""
+
+import os
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+from bson import ObjectId
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError, OperationFailure
+
+import sqlite_store
+
+MONGO_TEST_URI = os.getenv("MONGO_TEST_URI", "")
+
+
+@pytest.fixture(params=["sqlite", "mongodb"])
+def coll(request, tmp_path):
+    name = f"parity_{uuid.uuid4().hex[:12]}"
+    if request.param == "sqlite":
+        client = sqlite_store.SQLiteClient(str(tmp_path / "store.sqlite3"))
+        yield client[name]["students"]
+        client.close()
+        return
+    if not MONGO_TEST_URI:
+        pytest.skip("MONGO_TEST_URI not set")
+    from pymongo import MongoClient
+
+    client = MongoClient(MONGO_TEST_URI, serverSelectionTimeoutMS=5000)
+    try:
+        yield client[name]["students"]
+    finally:
+        client.drop_database(name)
+        client.close()
+
+
+def ids(cursor):
+    return sorted(doc["_id"] for doc in cursor)
+
+
+@pytest.fixture
+def people(coll):
+    coll.insert_many(
+        [
+            {"_id": 1, "name": "Amy", "department": "CS", "course_ids": ["CS101", "MA201"], "year": 1},
+            {"_id": 2, "name": "bob", "department": "EE", "course_ids": ["EE110"], "year": 2, "claimed_by": "w1"},
+            {"_id": 3, "name": "Ann", "department": "CS", "course_ids": [], "year": 3, "claimed_by": None},
+            {"_id": 4, "name": "Zed", "profile": {"term": "2026-fall"}, "year": 4, "attempts": 5},
+        ]
+    )
+    return coll
+
+
+# Queries
+
+
+def test_equality_matches_array_members(people):
+    assert ids(people.find({"course_ids": "CS101"})) == [1]
+    assert ids(people.find({"department": "CS"})) == [1, 3]
+
+
+def test_none_matches_missing_and_null(people):
+    assert ids(people.find({"claimed_by": None})) == [1, 3, 4]
+
+
+def test_comparisons(people):
+    assert ids(people.find({"year": {"$gt": 2}})) == [3, 4]
+    assert ids(people.find({"year": {"$gte": 2, "$lt": 4}})) == [2, 3]
+    assert ids(people.find({"department": {"$ne": "CS"}})) == [2, 4]
+
+
+def test_in_and_nin(people):
+    assert ids(people.find({"_id": {"$in": [1, 4, 99]}})) == [1, 4]
+    assert ids(people.find({"course_ids": {"$in": ["MA201", "EE110"]}})) == [1, 2]
+    assert ids(people.find({"_id": {"$nin": [1, 2]}})) == [3, 4]
+
+
+def test_exists(people):
+    assert ids(people.find({"claimed_by": {"$exists": True}})) == [2, 3]
+    assert ids(people.find({"course_ids": {"$exists": False}})) == [4]
+
+
+def test_regex_prefix_and_case_insensitive(people):
+    assert ids(people.find({"name": {"$regex": "^A"}})) == [1, 3]
+    assert ids(people.find({"name": {"$regex": "^b", "$options": "i"}})) == [2]
+    assert ids(people.find({"course_ids": {"$regex": "^EE"}})) == [2]
+
+
+def test_not_matches_missing_fields(people):
+    # new_matches._claimable: attempts below the cap, or never attempted
+    assert ids(people.find({"attempts": {"$not": {"$gte": 5}}})) == [1, 2, 3]
+
+
+def test_or_and(people):
+    assert ids(people.find({"$or": [{"year": 1}, {"claimed_by": "w1"}]})) == [1, 2]
+    assert ids(people.find({"$and": [{"department": "CS"}, {"year": {"$gt": 1}}]})) == [3]
+    query = {"department": "CS", "$or": [{"claimed_by": None}, {"year": {"$lt": 0}}]}
+    assert ids(people.find(query)) == [1, 3]
+
+
+def test_dotted_fields(people):
+    assert ids(people.find({"profile.term": "2026-fall"})) == [4]
+    assert ids(people.find({"profile.term": None})) == [1, 2, 3]
+
+
+def test_datetimes_and_object_ids(coll):
+    now = datetime(2026, 10, 19, 12, 0, 0)
+    first, second = ObjectId(), ObjectId()
+    coll.insert_many(
+        [{"_id": first, "updated_at": now - timedelta(minutes=5)}, {"_id": second, "updated_at": now}]
+    )
+    assert ids(coll.find({"updated_at": {"$gte": now - timedelta(minutes=1)}})) == [second]
+    assert ids(coll.find({"_id": {"$gt": first}})) == [second]
+    assert coll.find_one({"_id": first})["updated_at"] == now - timedelta(minutes=5)
+
+
+# Cursors and reads
+
+
+def test_sort_skip_limit_projection(people):
+    docs = list(people.find({}, {"name": 1, "_id": 0}).sort("year", -1).skip(1).limit(2))
+    assert docs == [{"name": "Ann"}, {"name": "bob"}]
+    docs = list(people.find({"year": {"$lt": 3}}, sort=[("name", 1)]))
+    assert [d["name"] for d in docs] == ["Amy", "bob"]
+
+
+def test_count_and_distinct(people):
+    assert people.count_documents({"department": "CS"}) == 2
+    assert people.count_documents({}) == 4
+    assert sorted(people.distinct("course_ids")) == ["CS101", "EE110", "MA201"]
+    assert sorted(people.distinct("department", {"year": {"$lt": 3}})) == ["CS", "EE"]
+
+
+# Updates
+
+
+def test_set_unset_inc(people):
+    people.update_one({"_id": 2}, {"$set": {"profile.term": "2026-fall"}, "$unset": {"claimed_by": ""}, "$inc": {"attempts": 1}})
+    doc = people.find_one({"_id": 2})
+    assert doc["profile"] == {"term": "2026-fall"}
+    assert "claimed_by" not in doc
+    assert doc["attempts"] == 1
+    result = people.update_many({"department": "CS"}, {"$inc": {"year": 10}})
+    assert (result.matched_count, result.modified_count) == (2, 2)
+    assert ids(people.find({"year": {"$gt": 10}})) == [1, 3]
+
+
+def test_add_to_set_and_pull(people):
+    people.update_one({"_id": 1}, {"$addToSet": {"course_ids": {"$each": ["CS101", "PH100"]}}})
+    people.update_one({"_id": 3}, {"$addToSet": {"blocked": "x@nthu"}})
+    assert people.find_one({"_id": 1})["course_ids"] == ["CS101", "MA201", "PH100"]
+    assert people.find_one({"_id": 3})["blocked"] == ["x@nthu"]
+    people.update_one({"_id": 1}, {"$pull": {"course_ids": "MA201"}})
+    assert people.find_one({"_id": 1})["course_ids"] == ["CS101", "PH100"]
+    people.update_one({"_id": 1}, {"$pull": {"course_ids": {"$in": ["CS101", "PH100"]}}})
+    assert people.find_one({"_id": 1})["course_ids"] == []
+
+
+def test_upsert_seeds_query_fields(coll):
+    result = coll.update_one(
+        {"email": "amy@nthu"}, {"$set": {"name": "Amy"}, "$setOnInsert": {"created_at": 1}}, upsert=True
+    )
+    assert result.upserted_id is not None
+    doc = coll.find_one({"email": "amy@nthu"}, {"_id": 0})
+    assert doc == {"email": "amy@nthu", "name": "Amy", "created_at": 1}
+    coll.update_one({"email": "amy@nthu"}, {"$set": {"name": "Amy L"}, "$setOnInsert": {"created_at": 2}}, upsert=True)
+    assert coll.find_one({"email": "amy@nthu"}, {"_id": 0}) == {"email": "amy@nthu", "name": "Amy L", "created_at": 1}
+
+
+def test_find_one_and_update_returns_after(people):
+    doc = people.find_one_and_update(
+        {"_id": 3}, {"$inc": {"year": 1}}, projection={"year": 1}, return_document=ReturnDocument.AFTER
+    )
+    assert doc == {"_id": 3, "year": 4}
+    before = people.find_one_and_update({"_id": 3}, {"$inc": {"year": 1}})
+    assert before["year"] == 4
+    assert people.find_one_and_update({"_id": 99}, {"$inc": {"year": 1}}) is None
+
+
+def test_delete_many(people):
+    assert people.delete_many({"department": "CS"}).deleted_count == 2
+    assert ids(people.find({})) == [2, 4]
+
+
+# Bulk writes and indexes
+
+
+def test_bulk_write_upserts(people):
+    result = people.bulk_write(
+        [UpdateOne({"_id": 1}, {"$set": {"year": 9}}, upsert=True), UpdateOne({"_id": 5}, {"$set": {"year": 5}}, upsert=True)],
+        ordered=False,
+    )
+    assert (result.matched_count, result.upserted_count) == (1, 1)
+    assert people.find_one({"_id": 5}) == {"_id": 5, "year": 5}
+    assert people.find_one({"_id": 1})["year"] == 9
+
+
+def test_unique_index_rejects_duplicates(coll):
+    coll.create_index("email", unique=True)
+    coll.insert_one({"email": "amy@nthu"})
+    with pytest.raises(DuplicateKeyError) as error:
+        coll.insert_one({"email": "amy@nthu"})
+    assert error.value.code == 11000
+    with pytest.raises(BulkWriteError) as error:
+        coll.insert_many([{"email": "bob@nthu"}, {"email": "amy@nthu"}, {"email": "cat@nthu"}], ordered=False)
+    assert [e["code"] for e in error.value.details["writeErrors"]] == [11000]
+    assert sorted(coll.distinct("email")) == ["amy@nthu", "bob@nthu", "cat@nthu"]
+    with pytest.raises(BulkWriteError):
+        coll.bulk_write([UpdateOne({"email": "dan@nthu"}, {"$set": {"email": "bob@nthu"}}, upsert=True)], ordered=False)
+
+
+def test_index_information_and_drop(coll):
+    coll.create_index([("department", 1), ("year", -1)])
+    coll.create_index("email", unique=True)
+    info = coll.index_information()
+    assert info["department_1_year_-1"]["key"] == [("department", 1), ("year", -1)]
+    assert info["email_1"].get("unique") is True
+    coll.drop_index("email_1")
+    assert "email_1" not in coll.index_information()
+    coll.insert_many([{"email": "amy@nthu"}, {"email": "amy@nthu"}])
+    assert coll.count_documents({"email": "amy@nthu"}) == 2
+
+
+def test_indexed_lookups_match_scans(coll):
+    coll.insert_many([{"_id": i, "dept": "CS" if i % 2 else "EE", "tags": [f"t{i}", "all"]} for i in range(20)])
+    scanned = ids(coll.find({"dept": "CS", "tags": {"$in": ["t3", "t4", "t5"]}}))
+    coll.create_index("dept")
+    coll.create_index("tags")
+    assert ids(coll.find({"dept": "CS", "tags": {"$in": ["t3", "t4", "t5"]}})) == scanned == [3, 5]
+    assert coll.count_documents({"tags": "all"}) == 20
+
+
+# SQLite-only surface
+
+
+def test_watch_fails_like_a_standalone_server(tmp_path):
+    import change_feed
+
+    coll = sqlite_store.SQLiteClient(str(tmp_path / "store.sqlite3"))["db"]["students"]
+    with pytest.raises(OperationFailure) as error:
+        coll.watch([])
+    assert error.value.code == 40573
+    assert change_feed.ChangeFeed(coll, "students")._streams_unsupported(error.value)
+
+
+def test_async_to_list_limits_the_cursor(tmp_path):
+    import asyncio
+
+    client = sqlite_store.SQLiteClient(str(tmp_path / "store.sqlite3"))
+    client["db"]["students"].insert_many([{"_id": i} for i in range(10)])
+    coll = sqlite_store.AsyncClient(client)["db"]["students"]
+
+    async def run():
+        cursor = coll.find({}).sort("_id", -1)
+        docs = await cursor.to_list(3)
+        assert cursor._cursor._limit == 3
+        assert await coll.find({}).limit(2).to_list(5) == [{"_id": 0}, {"_id": 1}]
+        assert len(await coll.find({}).to_list(None)) == 10
+        return docs
+
+    assert asyncio.run(run()) == [{"_id": 9}, {"_id": 8}, {"_id": 7}]
@@ -0,0 +1,55 @@
+"""traceparent parsing and who decides sampling"""
+
+import pytest
+
+import tracing
+
+TRACE_ID = "4bf92f3577b34da6a3ce929d0e0e4736"
+PARENT_ID = "00f067aa0ba902b7"
+
+
+@pytest.mark.parametrize(
+    "header, expected",
+    [
+        (f"00-{TRACE_ID}-{PARENT_ID}-01", (TRACE_ID, PARENT_ID, True)),
+        (f"00-{TRACE_ID}-{PARENT_ID}-00", (TRACE_ID, PARENT_ID, False)),
+        (f" 00-{TRACE_ID}-{PARENT_ID}-03 ", (TRACE_ID, PARENT_ID, True)),
+        (None, None),
+        ("", None),
+        ("garbage", None),
+        (f"00-{'0' * 32}-{PARENT_ID}-01", None),
+        (f"00-{TRACE_ID[:-1]}-{PARENT_ID}-01", None),
+        (f"00-{TRACE_ID}-{PARENT_ID}-zz", None),
+        (f"00-{'g' * 32}-{PARENT_ID}-01", None),
+    ],
+)
+def test_parse_traceparent(header, expected):
+    assert tracing.parse_traceparent(header) == expected
+
+
+def open_request(header):
+    span, token = tracing.start_request("GET /x", header)
+    tracing._current.reset(token)
+    return span
+
+
+def test_untrusted_sampled_flag_is_ignored(monkeypatch):
+    monkeypatch.setattr(tracing, "SAMPLE_RATE", 0.0)
+    monkeypatch.setattr(tracing, "TRUST_INCOMING_SAMPLED", False)
+    span = open_request(f"00-{TRACE_ID}-{PARENT_ID}-01")
+    assert (span.trace_id, span.parent_id, span.sampled) == (TRACE_ID, PARENT_ID, False)
+    assert span.traceparent.startswith(f"00-{TRACE_ID}-") and span.traceparent.endswith("-00")
+
+
+def test_trusted_callers_decide_sampling(monkeypatch):
+    monkeypatch.setattr(tracing, "SAMPLE_RATE", 0.0)
+    monkeypatch.setattr(tracing, "TRUST_INCOMING_SAMPLED", True)
+    assert open_request(f"00-{TRACE_ID}-{PARENT_ID}-01").sampled
+    monkeypatch.setattr(tracing, "SAMPLE_RATE", 1.0)
+    assert not open_request(f"00-{TRACE_ID}-{PARENT_ID}-00").sampled
+
+
+def test_new_roots_follow_the_sample_rate(monkeypatch):
+    monkeypatch.setattr(tracing, "SAMPLE_RATE", 1.0)
+    span = open_request(None)
+    assert span.sampled and span.parent_id is None and len(span.trace_id) == 32
@@ -0,0 +1,43 @@
+"""Ranker training rows must be built from the same students serving scores"""
+
+import pytest
+from bson import ObjectId
+
+import matching
+import ranker
+import repository
+import semester
+import sqlite_store
+import train_ranker
+
+
+@pytest.fixture
+def students(tmp_path, monkeypatch):
+    client = sqlite_store.SQLiteClient(str(tmp_path / "ranker.sqlite3"))
+    collection = client["test"]["students"]
+    monkeypatch.setattr(repository, "students_collection", collection)
+    monkeypatch.setattr(semester, "current", lambda: "1141")
+    yield collection
+    client.close()
+
+
+def test_training_rows_match_serving_features(students):
+    user, partner = ObjectId(), ObjectId()
+    students.insert_many(
+        [
+            {"_id": user, "name": "u", "course_ids": ["11410CS 100000", "11320CS 200000"], "study_spots": ["lib"], "study_times": []},
+            {"_id": partner, "name": "p", "course_ids": ["11410CS 100000", "11320CS 200000"], "study_spots": ["lib"], "study_times": []},
+        ]
+    )
+    labels = {(str(user), str(partner)): 1}
+    loaded = train_ranker.load_students(labels)
+    # Last semester's shared course is not a shared course at serving time
+    assert loaded[str(user)]["course_ids"] == ["11410CS 100000"]
+    X, y = train_ranker.build_dataset(labels, loaded)
+
+    target = repository.match_student(user)
+    others = repository.match_candidates([partner])
+    serving = ranker.pair_features(target, others, matching.profile_cosines(target, others))
+    assert X.tolist() == serving.tolist()
+    assert X[0, ranker.FEATURE_NAMES.index("shared_courses")] == 1
+    assert y.tolist() == [1]
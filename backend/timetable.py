@@ -0,0 +1,122 @@
+"""Weekly timetable bitmaps for courses and students.
+
+NTHU encodes meeting times as day letter + period, e.g. "M3M4R7" is
+Monday periods 3-4 and Thursday period 7. Days are M T W R F S U and the
+13 periods are 1 2 3 4 n 5 6 7 8 9 a b c. That makes 91 weekly slots,
+stored as a 128-bit little-endian bitmap (two uint64 words).
+
+Catalog ingest stores each course's bitmap in a `slots` field. A student's
+busy bitmap is the OR over their course_ids. Shared free time with every
+candidate is then a bitwise AND plus popcount over an (N, 2) uint64
+array: a few instructions per candidate.
+"""
+import os
+import re
+
+DAYS = "MTWRFSU"
+PERIODS = "1234n56789abc"
+SLOT_COUNT = len(DAYS) * len(PERIODS)
+SLOT_WORDS = 2
+SLOT_BYTES = SLOT_WORDS * 8
+
+# Fraction of the match score that comes from shared free time
+TIMETABLE_WEIGHT = float(os.getenv("TIMETABLE_WEIGHT", 0.2))
+
+# Feed fields that carry meeting times; "教室與上課時間" is "<room>\t<slots>" per line
+TIME_FIELDS = ("上課時間", "教室與上課時間")
+
+_SLOT_RUN = re.compile(rf"^(?:[{DAYS}][{PERIODS}])+$")
+_SLOT = re.compile(rf"([{DAYS}])([{PERIODS}])")
+
+
+def parse_slots(text):
+    """Slot indices from an NTHU time string; room names and junk are ignored"""
+    slots = set()
+    for line in (text or "").splitlines():
+        for token in re.split(r"[\t\s,]+", line):
+            if _SLOT_RUN.match(token):
+                for day, period in _SLOT.findall(token):
+                    slots.add(DAYS.index(day) * len(PERIODS) + PERIODS.index(period))
+    return slots
+
+
+def slots_to_bytes(slots):
+    value = 0
+    for slot in slots:
+        value |= 1 << slot
+    return value.to_bytes(SLOT_BYTES, "little")
+
+
+def course_slot_bits(course):
+    """Bitmap bytes for a raw feed course dict, or None when it has no meeting times"""
+    slots = set()
+    for field in TIME_FIELDS:
+        value = course.get(field)
+        if isinstance(value, str):
+            slots |= parse_slots(value)
+    return slots_to_bytes(slots) if slots else None
+
+
+SLOT_PROJECTION = {"_id": 0, "code": 1, "slots": 1}
+
+
+def slots_filter(course_ids):
+    return {"code": {"$in": list(course_ids)}, "slots": {"$exists": True}}
+
+
+def slots_by_code(courses):
+    return {c["code"]: bytes(c["slots"]) for c in courses}
+
+
+def student_course_ids(students):
+    course_ids = set()
+    for student in students:
+        course_ids.update(student.get("course_ids", []))
+    return course_ids
+
+
+def load_course_slots(courses_collection, course_ids):
+    """{course code: bitmap bytes} for the given codes, in one query"""
+    if not course_ids:
+        return {}
+    return slots_by_code(courses_collection.find(slots_filter(course_ids), SLOT_PROJECTION))
+
+
+def busy_matrix(students, course_slots):
+    """(N, 2) uint64 busy bitmaps and a bool mask of students with any known schedule"""
+    import numpy as np
+
+    busy = np.zeros((len(students), SLOT_WORDS), dtype=np.uint64)
+    known = np.zeros(len(students), dtype=bool)
+    rows = busy.view(np.uint8).reshape(len(students), SLOT_BYTES)
+    for i, student in enumerate(students):
+        for code in student.get("course_ids", []):
+            bits = course_slots.get(code)
+            if bits is not None:
+                rows[i] |= np.frombuffer(bits, dtype=np.uint8)
+                known[i] = True
+    return busy, known
+
+
+def popcount(words):
+    import numpy as np
+
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(words).sum(axis=-1)
+    return np.unpackbits(words.view(np.uint8), axis=-1).sum(axis=-1)
+
+
+def valid_mask():
+    import numpy as np
+
+    return np.frombuffer(slots_to_bytes(range(SLOT_COUNT)), dtype=np.uint64)
+
+
+def shared_free_slots(target_busy, candidate_busy):
+    """Free slots the target shares with each candidate, and the target's own free slot count"""
+    import numpy as np
+
+    valid = valid_mask()
+    target_free = ~target_busy & valid
+    shared = target_free & ~candidate_busy
+    return popcount(shared), int(popcount(target_free[np.newaxis])[0])
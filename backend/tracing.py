@@ -0,0 +1,387 @@
+"""
+Lightweight request tracing.
+
+Every request gets a trace: a root span with child spans for each MongoDB
+command (pymongo command monitoring), SMTP send and outgoing HTTP call
+made while it runs. Work handed to a background thread through
+tracing.propagate() stays in the same trace. An incoming W3C
+`traceparent` header continues the caller's trace, and every response
+carries its own.
+
+TRACE_SAMPLE_RATE (0 to 1, default 0) decides which request traces are
+exported, including ones continued from a traceparent: any client can
+send that header, so its sampled flag is ignored unless
+TRACE_TRUST_INCOMING_SAMPLED=1 (only behind a gateway that strips or sets
+the header for outside callers). Ids exist for unsampled
+requests too, so log records always carry trace_id and span_id (set by a
+log record factory). Unsampled traces only skip recording spans.
+
+Finished spans are queued to one exporter thread per process:
+
+    TRACE_EXPORTER=file   one JSON span per line (OTLP span fields) in
+                          TRACE_DIR/traces-<pid>.jsonl, rotated at
+                          TRACE_FILE_MAX_BYTES, keeping TRACE_FILE_BACKUPS
+    TRACE_EXPORTER=otlp   OTLP/HTTP JSON batches to a local collector at
+                          TRACE_OTLP_ENDPOINT
+
+Spans record operation names and sizes, never query filters or message
+bodies.
+"""
+
+import contextvars
+import functools
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+import logs
+
+SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", 0))
+TRUST_INCOMING_SAMPLED = os.getenv("TRACE_TRUST_INCOMING_SAMPLED", "0") == "1"
+EXPORTER = os.getenv("TRACE_EXPORTER", "file").strip().lower()
+TRACE_DIR = os.getenv("TRACE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "traces"))
+FILE_MAX_BYTES = int(os.getenv("TRACE_FILE_MAX_BYTES", 50 * 1024 * 1024))
+FILE_BACKUPS = int(os.getenv("TRACE_FILE_BACKUPS", 3))
+OTLP_ENDPOINT = os.getenv("TRACE_OTLP_ENDPOINT", "http://localhost:4318/v1/traces")
+SERVICE_NAME = os.getenv("TRACE_SERVICE_NAME", "studybuddy-api")
+
+EXPORT_BATCH = 512
+EXPORT_INTERVAL_SECONDS = 1.0
+# Spans dropped instead of blocking requests when the exporter falls behind
+QUEUE_LIMIT = 10000
+
+KINDS = {"internal": 1, "server": 2, "client": 3}
+
+log = logs.get_logger("tracing")
+
+_current = contextvars.ContextVar("trace_span", default=None)
+
+
+class Span:
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "kind", "sampled", "start_ns", "end_ns", "attributes", "error")
+
+    def __init__(self, name, kind="internal", parent=None, trace_id=None, parent_id=None, sampled=None, attributes=None):
+        self.trace_id = parent.trace_id if parent else trace_id or os.urandom(16).hex()
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent.span_id if parent else parent_id
+        self.name = name
+        self.kind = kind
+        self.sampled = parent.sampled if parent else (sampled if sampled is not None else random.random() < SAMPLE_RATE)
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.attributes = dict(attributes or {})
+        self.error = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def end(self, error=None):
+        if self.end_ns is not None:
+            return
+        self.end_ns = time.time_ns()
+        if error is not None:
+            self.error = f"{type(error).__name__}: {error}"
+        if self.sampled:
+            _export(self)
+
+    @property
+    def traceparent(self):
+        return f"00-{self.trace_id}-{self.span_id}-{'01' if self.sampled else '00'}"
+
+    def as_otlp(self):
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": KINDS.get(self.kind, 1),
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": [{"key": k, "value": _otlp_value(v)} for k, v in self.attributes.items()],
+            "status": {"code": 2, "message": self.error} if self.error else {"code": 1},
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        return span
+
+
+def _otlp_value(value):
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def parse_traceparent(header):
+    """(trace_id, parent span_id, sampled) from a W3C traceparent header, or None"""
+    parts = (header or "").strip().split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16 or parts[1] == "0" * 32:
+        return None
+    try:
+        int(parts[1], 16), int(parts[2], 16)
+        return parts[1], parts[2], bool(int(parts[3], 16) & 1)
+    except ValueError:
+        return None
+
+
+def current_span():
+    return _current.get()
+
+
+def current_ids():
+    """(trace_id, span_id) of the active span, or (None, None)"""
+    span = _current.get()
+    return (span.trace_id, span.span_id) if span else (None, None)
+
+
+# Request roots (Flask hooks below, asgi.py for the async endpoints)
+
+
+def start_request(name, traceparent=None, **attributes):
+    """Open and activate a server span; returns (span, token) for finish_request"""
+    incoming = parse_traceparent(traceparent)
+    if incoming:
+        trace_id, parent_id, sampled = incoming
+        # Untrusted callers keep their trace id but not their sampling decision
+        sampled = sampled if TRUST_INCOMING_SAMPLED else None
+        span = Span(name, "server", trace_id=trace_id, parent_id=parent_id, sampled=sampled, attributes=attributes)
+    else:
+        span = Span(name, "server", attributes=attributes)
+    return span, _current.set(span)
+
+
+def finish_request(span, token, status=None, error=None):
+    if status is not None:
+        span.set(**{"http.status_code": status})
+        if status >= 500 and error is None:
+            span.error = f"HTTP {status}"
+    span.end(error)
+    try:
+        _current.reset(token)
+    except ValueError:
+        # Reset from a different context (e.g. a streamed response); leaving it is harmless
+        pass
+
+
+def init_app(app):
+    from flask import g, request
+
+    @app.before_request
+    def _start_trace():
+        rule = request.url_rule.rule if request.url_rule else request.path
+        g.trace = start_request(
+            f"{request.method} {rule}",
+            request.headers.get("traceparent"),
+            **{"http.method": request.method, "http.route": rule},
+        )
+
+    @app.after_request
+    def _trace_header(response):
+        trace = g.get("trace")
+        if trace:
+            trace[0].set(**{"http.status_code": response.status_code})
+            response.headers["traceparent"] = trace[0].traceparent
+        return response
+
+    @app.teardown_request
+    def _end_trace(error=None):
+        trace = g.pop("trace", None)
+        if trace:
+            span, token = trace
+            finish_request(span, token, span.attributes.get("http.status_code"), error)
+
+
+# Child spans
+
+
+class _NoopSpan:
+    def set(self, **attributes):
+        pass
+
+
+NOOP = _NoopSpan()
+
+
+@contextmanager
+def span(name, kind="internal", **attributes):
+    """Child span of the active one; starts a new (sampled-by-rate) trace when there is none"""
+    parent = _current.get()
+    if parent is not None and not parent.sampled:
+        yield NOOP
+        return
+    child = Span(name, kind, parent=parent, attributes=attributes)
+    if not child.sampled:
+        token = _current.set(child)
+        try:
+            yield NOOP
+        finally:
+            _current.reset(token)
+        return
+    token = _current.set(child)
+    try:
+        yield child
+    except BaseException as e:
+        child.end(e)
+        raise
+    else:
+        child.end()
+    finally:
+        _current.reset(token)
+
+
+def propagate(fn):
+    """Wrap fn so it runs in the caller's trace context, e.g. as a Thread target"""
+    context = contextvars.copy_context()
+
+    @functools.wraps(fn)
+    def run(*args, **kwargs):
+        return context.run(fn, *args, **kwargs)
+
+    return run
+
+
+# MongoDB commands
+
+try:
+    from pymongo import monitoring
+
+    class MongoCommandTracer(monitoring.CommandListener):
+        """One client span per command sent while a sampled span is active"""
+
+        def __init__(self):
+            self._open = {}
+
+        def started(self, event):
+            parent = _current.get()
+            if parent is None or not parent.sampled:
+                return
+            target = event.command.get(event.command_name)
+            attributes = {"db.system": "mongodb", "db.name": event.database_name, "db.operation": event.command_name}
+            if isinstance(target, str):
+                attributes["db.mongodb.collection"] = target
+            self._open[(event.request_id, event.connection_id)] = Span(
+                f"mongodb {event.command_name}", "client", parent=parent, attributes=attributes
+            )
+
+        def succeeded(self, event):
+            span = self._open.pop((event.request_id, event.connection_id), None)
+            if span is not None:
+                span.end()
+
+        def failed(self, event):
+            span = self._open.pop((event.request_id, event.connection_id), None)
+            if span is not None:
+                span.error = str(event.failure.get("errmsg", event.failure))
+                span.end()
+
+    MONGO_LISTENER = MongoCommandTracer()
+except ImportError:
+    MONGO_LISTENER = None
+
+
+# Log records carry the active trace
+
+
+_base_record_factory = logging.getLogRecordFactory()
+
+
+def _record_factory(*args, **kwargs):
+    record = _base_record_factory(*args, **kwargs)
+    span = _current.get()
+    record.trace_id = span.trace_id if span else None
+    record.span_id = span.span_id if span else None
+    return record
+
+
+logging.setLogRecordFactory(_record_factory)
+
+
+# Export
+
+_queue = queue.Queue(maxsize=QUEUE_LIMIT)
+_exporter = None
+_exporter_pid = None
+_exporter_lock = threading.Lock()
+
+
+def _export(span):
+    global _exporter, _exporter_pid
+    if _exporter is None or _exporter_pid != os.getpid():
+        with _exporter_lock:
+            if _exporter is None or _exporter_pid != os.getpid():
+                _exporter = threading.Thread(target=_export_loop, name="trace-exporter", daemon=True)
+                _exporter_pid = os.getpid()
+                _exporter.start()
+    try:
+        _queue.put_nowait(span)
+    except queue.Full:
+        pass
+
+
+def _export_loop():
+    write = _write_otlp if EXPORTER == "otlp" else _write_file
+    while True:
+        batch = [_queue.get()]
+        deadline = time.monotonic() + EXPORT_INTERVAL_SECONDS
+        while len(batch) < EXPORT_BATCH:
+            try:
+                batch.append(_queue.get(timeout=max(deadline - time.monotonic(), 0)))
+            except queue.Empty:
+                break
+        try:
+            write([s.as_otlp() for s in batch])
+        except Exception as e:
+            log.warning("could not export spans", extra={"spans": len(batch), "error": str(e)})
+        finally:
+            for _ in batch:
+                _queue.task_done()
+
+
+def _write_file(spans):
+    os.makedirs(TRACE_DIR, exist_ok=True)
+    path = os.path.join(TRACE_DIR, f"traces-{os.getpid()}.jsonl")
+    lines = "".join(json.dumps({"service": SERVICE_NAME, **s}) + "\n" for s in spans)
+    try:
+        if os.path.getsize(path) + len(lines) > FILE_MAX_BYTES:
+            for n in range(FILE_BACKUPS - 1, 0, -1):
+                if os.path.exists(f"{path}.{n}"):
+                    os.replace(f"{path}.{n}", f"{path}.{n + 1}")
+            if FILE_BACKUPS:
+                os.replace(path, f"{path}.1")
+            else:
+                os.remove(path)
+    except FileNotFoundError:
+        pass
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(lines)
+
+
+def _write_otlp(spans):
+    import requests
+
+    body = {
+        "resourceSpans": [
+            {
+                "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": SERVICE_NAME}}]},
+                "scopeSpans": [{"scope": {"name": "studybuddy.tracing"}, "spans": spans}],
+            }
+        ]
+    }
+    requests.post(OTLP_ENDPOINT, json=body, timeout=5).raise_for_status()
+
+
+def flush(timeout=5.0):
+    """Wait until queued spans are written (tests, shutdown); False on timeout"""
+    deadline = time.monotonic() + timeout
+    while _queue.unfinished_tasks:
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
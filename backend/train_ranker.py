@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Train the learned match re-ranker from logged engagement.
+
+get_matches logs an "impression" for every match shown and
+/send_partner_email logs a "contact" when the user emails one of them
+(collection: match_events). Each shown (user, candidate) pair becomes a
+training row, labelled 1 if the user contacted that candidate. The model
+file is what RANKER_MODEL_PATH should point at; workers pick up a new file
+without a restart.
+
+Usage:
+    pip install -r requirements-ml.txt
+    python train_ranker.py --out ml_models/ranker.json
+"""
+
+import argparse
+import os
+from collections import defaultdict
+
+from bson import ObjectId
+
+import db
+import ranker
+import repository
+from matching import profile_cosines
+
+
+def load_labelled_pairs(events):
+    """{(user_id, candidate_id): label} from impression/contact events"""
+    labels = {}
+    for event in events.find({}, {"_id": 0, "user_id": 1, "candidate_id": 1, "type": 1}):
+        key = (event["user_id"], event["candidate_id"])
+        if event["type"] == ranker.CONTACT:
+            labels[key] = 1
+        else:
+            labels.setdefault(key, 0)
+    return labels
+
+
+def load_students(labels):
+    """{id string: student} for every labelled id, trimmed to this semester exactly as serving loads them"""
+    ids = {ObjectId(i) for pair in labels for i in pair if ObjectId.is_valid(i)}
+    return {str(s["_id"]): s for s in repository.match_candidates(ids)}
+
+
+def build_dataset(labels, students):
+    import numpy as np
+
+    by_user = defaultdict(list)
+    for (user_id, candidate_id), label in labels.items():
+        if user_id in students and candidate_id in students:
+            by_user[user_id].append((students[candidate_id], label))
+
+    blocks, targets = [], []
+    for user_id, rows in by_user.items():
+        target = students[user_id]
+        candidates = [c for c, _ in rows]
+        # The same function serving passes to ranker.rerank
+        blocks.append(ranker.pair_features(target, candidates, profile_cosines(target, candidates)))
+        targets.extend(label for _, label in rows)
+    if not blocks:
+        return np.empty((0, len(ranker.FEATURE_NAMES)), dtype=np.float32), np.empty(0)
+    return np.vstack(blocks), np.asarray(targets)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--out", default=ranker.MODEL_PATH or "ml_models/ranker.json")
+    parser.add_argument("--rounds", type=int, default=200)
+    parser.add_argument("--max-depth", type=int, default=4)
+    args = parser.parse_args()
+
+    import xgboost
+    from sklearn.metrics import roc_auc_score
+    from sklearn.model_selection import train_test_split
+
+    labels = load_labelled_pairs(db.get_collection(ranker.EVENTS_COLLECTION))
+    X, y = build_dataset(labels, load_students(labels))
+    print(f"📊 {len(y)} labelled pairs, {int(y.sum())} contacts")
+    if len(set(y)) < 2:
+        print("❌ Need both contacted and non-contacted pairs to train")
+        return 1
+
+    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42, stratify=y)
+    model = xgboost.XGBClassifier(
+        n_estimators=args.rounds,
+        max_depth=args.max_depth,
+        learning_rate=0.1,
+        objective="binary:logistic",
+        eval_metric="auc",
+    )
+    model.fit(X_train, y_train)
+    auc = roc_auc_score(y_test, model.predict_proba(X_test)[:, 1])
+    cosine_auc = roc_auc_score(y_test, X_test[:, ranker.FEATURE_NAMES.index("cosine")])
+    print(f"✅ holdout AUC {auc:.3f} (cosine alone {cosine_auc:.3f})")
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+    # Write then rename so serving workers never load a half-written file
+    # (keep the extension, xgboost picks the format from it)
+    root, ext = os.path.splitext(args.out)
+    tmp_path = f"{root}.tmp{ext}"
+    model.get_booster().save_model(tmp_path)
+    os.replace(tmp_path, args.out)
+    print(f"💾 Saved model to {args.out}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())